@@ -3,17 +3,21 @@
 獨立的管理介面，提供日誌管理、案件紀錄管理、系統測試等功能
 """
 
-from flask import Flask, request, render_template, jsonify, send_file
+from flask import Flask, request, render_template, jsonify, Response, stream_with_context, g
 import datetime
+import json
 import os
 import logging
+import time
 
 # 導入自定義模組
 from config import config
 from logger import logger_manager
 from case_manager import case_manager
 from message_broadcaster import message_broadcaster
+from http_client import http_client
 from api_routes import APIRoutes
+from metrics import metrics
 
 # 創建Flask應用程式
 app = Flask(__name__, static_folder="static", static_url_path="/")
@@ -34,25 +38,41 @@ except ValueError as e:
 # 註冊API路由
 api_routes = APIRoutes(app)
 
+# 啟動時預熱外部 API 連線
+http_client.start_keepalive()
+
+# 開始彙總效能指標（/metrics）
+metrics.start("admin")
+
 # 請求前處理
 @app.before_request
 def before_request():
     """請求前處理"""
-    user_info = logger_manager.get_user_info()
+    g.request_start = time.perf_counter()
     logger_manager.log_user_action("管理頁面訪問", f"路徑: {request.path}")
 
 # 請求後處理
 @app.after_request
 def after_request(response):
     """請求後處理"""
-    user_info = logger_manager.get_user_info()
+    # 請求處理時間（日誌以毫秒記錄，效能指標以秒依路由統計）
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.record_request(request.method, route, response.status_code, elapsed)
     logger_manager.log_request(
         request.method, 
         request.path, 
-        response.status_code
+        response.status_code,
+        round(elapsed * 1000, 1)
     )
     return response
 
+# 效能指標（Prometheus 文字格式）
+@app.route("/metrics")
+def get_metrics():
+    """輸出效能指標"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 # 管理首頁
 @app.route("/")
 def admin_home():
@@ -192,6 +212,47 @@ def system_logs():
     logger_manager.log_user_action("訪問日誌管理頁面")
     return render_template("system/logs.html")
 
+@app.route("/system/logs/stream")
+def stream_logs():
+    """即時日誌串流（Server-Sent Events，追蹤目前的日誌檔案）"""
+    logger_manager.log_user_action("開啟即時日誌串流")
+    log_type = request.args.get('type', 'all').lower()
+    ip_filter = request.args.get('ip', '')
+    # 瀏覽器斷線重連時會帶上最後收到的位置
+    last_position = request.headers.get('Last-Event-ID') or request.args.get('position')
+    
+    def generate():
+        yield "retry: 3000\n\n"
+        for position, entries in logger_manager.follow_log(last_position):
+            events = []
+            for entry in entries:
+                if log_type != 'all' and entry['level'].lower() != log_type:
+                    continue
+                if ip_filter and not (entry['ip'] or '').startswith(ip_filter):
+                    continue
+                events.append({
+                    'timestamp': entry['ts'],
+                    'type': entry['level'],
+                    'content': entry['message'],
+                    'category': entry['category'],
+                    'action': entry['action'],
+                    'ip': entry['ip'],
+                    'path': entry['path'],
+                    'status': entry['status']
+                })
+            
+            if events:
+                yield f"id: {position}\ndata: {json.dumps(events, ensure_ascii=False)}\n\n"
+            else:
+                # 保持連線（同時更新位置）
+                yield f"id: {position}\n: keepalive\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route("/system/logs/files")
 def get_log_files():
     """獲取日誌檔案列表"""
@@ -226,9 +287,15 @@ def view_record(filename):
 def download_record(filename):
     """下載案件紀錄"""
     logger_manager.log_user_action("下載案件紀錄", f"檔案: {filename}")
-    file_path = os.path.join("record", filename)
-    if os.path.exists(file_path):
-        return send_file(file_path, as_attachment=True)
+    content = case_manager.read_case_file(filename)
+    if content:
+        # 以文字檢視提供下載（結構化紀錄同樣輸出為 .txt）
+        download_name = os.path.splitext(filename)[0] + ".txt"
+        return Response(
+            content,
+            mimetype='text/plain; charset=utf-8',
+            headers={'Content-Disposition': f'attachment; filename={download_name}'}
+        )
     else:
         return "檔案不存在", 404
 
@@ -246,7 +313,7 @@ def internal_error(error):
     return render_template("Information/500.html"), 500
 
 if __name__ == "__main__":
-    # 啟動管理應用程式
+    # 開發環境啟動管理應用程式（生產環境請使用 gunicorn admin_app:app，設定見 gunicorn.conf.py）
     print("啟動緊急事件通報系統 - 管理網站")
     print("管理介面: https://admin.fcuems.tw/")
     app.run(host="0.0.0.0", port=5000, debug=True)
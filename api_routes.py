@@ -5,9 +5,32 @@ API路由模組
 
 import datetime
 import os
-from flask import request, jsonify, send_file
+import zlib
+import zipfile
+from flask import request, jsonify, Response, stream_with_context
 from case_manager import case_manager
 from logger import logger_manager
+from message_broadcaster import message_broadcaster
+from tracing import wizard_tracer
+
+class _ChunkBuffer:
+    """收集 zip 輸出的暫存緩衝區（供串流逐段取出）"""
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        """取出目前累積的資料"""
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
 
 class APIRoutes:
     """API路由處理器"""
@@ -16,6 +39,78 @@ class APIRoutes:
         self.app = app
         self._register_routes()
     
+    def _summary_stats(self, date_from, date_to):
+        """獲取列表頁使用的案件分類統計"""
+        case_stats = case_manager.get_case_stats(date_from, date_to)
+        return {
+            'total_cases': case_stats['total_cases'],
+            'ohca_cases': case_stats['ohca_cases'],
+            'internal_cases': case_stats['internal_cases'],
+            'surgical_cases': case_stats['surgical_cases']
+        }
+    
+    # 匯出串流每次輸出的區塊大小
+    EXPORT_CHUNK_SIZE = 64 * 1024
+    
+    def _stream_export(self, chunks, export_filename, compression=None):
+        """將匯出內容直接串流至回應（可選 gzip 或 zip 即時壓縮，不產生暫存檔案）"""
+        def encoded():
+            # 合併小段文字為固定大小的區塊
+            buffer = []
+            size = 0
+            for chunk in chunks:
+                data = chunk.encode('utf-8')
+                buffer.append(data)
+                size += len(data)
+                if size >= self.EXPORT_CHUNK_SIZE:
+                    yield b"".join(buffer)
+                    buffer = []
+                    size = 0
+            if buffer:
+                yield b"".join(buffer)
+        
+        def generate():
+            try:
+                if compression == 'gzip':
+                    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+                    for data in encoded():
+                        compressed = compressor.compress(data)
+                        if compressed:
+                            yield compressed
+                    yield compressor.flush()
+                elif compression == 'zip':
+                    output = _ChunkBuffer()
+                    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+                        # 串流輸出無法回寫檔頭，預先使用 ZIP64 以支援超過 2 GiB 的匯出
+                        with archive.open(export_filename, 'w', force_zip64=True) as entry:
+                            for data in encoded():
+                                entry.write(data)
+                                compressed = output.drain()
+                                if compressed:
+                                    yield compressed
+                    yield output.drain()
+                else:
+                    yield from encoded()
+            except Exception as e:
+                # 重新拋出以中斷連線，避免用戶端收到看似完整的截斷檔案
+                logger_manager.log_error(f"Export stream failed: {e}")
+                raise
+        
+        download_name = export_filename
+        mimetype = 'text/plain; charset=utf-8'
+        if compression == 'gzip':
+            download_name += ".gz"
+            mimetype = 'application/gzip'
+        elif compression == 'zip':
+            download_name = os.path.splitext(export_filename)[0] + ".zip"
+            mimetype = 'application/zip'
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename={download_name}'}
+        )
+    
     def _register_routes(self):
         """註冊API路由"""
         
@@ -27,16 +122,10 @@ class APIRoutes:
                 case_type = request.args.get('type', 'all')
                 date_from = request.args.get('from', '')
                 date_to = request.args.get('to', '')
+                location = request.args.get('location', '')
                 limit = int(request.args.get('limit', 100))  # 預設最多100筆
                 offset = int(request.args.get('offset', 0))  # 分頁偏移
-                
-                records = []
-                stats = {
-                    'total_cases': 0,
-                    'ohca_cases': 0,
-                    'internal_cases': 0,
-                    'surgical_cases': 0
-                }
+                cursor = request.args.get('cursor', '')  # 鍵集分頁游標（優先於 offset）
                 
                 # 如果沒有指定日期範圍，預設為今天
                 if not date_from:
@@ -44,41 +133,22 @@ class APIRoutes:
                 if not date_to:
                     date_to = date_from
                 
-                # 獲取案件檔案
-                case_files = case_manager.get_case_files(date_from, date_to)
-                
-                for case_file in case_files:
-                    try:
-                        # 讀取案件檔案
-                        content = case_manager.read_case_file(case_file['filename'])
-                        if content:
-                            # 解析完整案件資訊
-                            case_info = case_manager.parse_case_record_full(content)
-                            case_info.update(case_file)
-                            
-                            # 統計
-                            stats['total_cases'] += 1
-                            if case_info.get('event_type') == 'OHCA':
-                                stats['ohca_cases'] += 1
-                            elif case_info.get('event_type') == '內科':
-                                stats['internal_cases'] += 1
-                            elif case_info.get('event_type') == '外科':
-                                stats['surgical_cases'] += 1
-                            
-                            # 類型過濾
-                            if case_type == 'all' or case_info.get('event_type') == case_type:
-                                records.append(case_info)
-                                
-                    except Exception as e:
-                        logger_manager.log_error(f"Failed to parse case record {case_file['filename']}: {e}")
-                        continue
-                
-                # 按時間排序（最新的在前）
-                records.sort(key=lambda x: x['case_id'], reverse=True)
-                
-                # 分頁處理
-                total_records = len(records)
-                records = records[offset:offset + limit]
+                # 統計由每日統計桶彙總
+                stats = self._summary_stats(date_from, date_to)
+                
+                # 由查詢引擎過濾與分頁，只載入當頁的案件
+                result = case_manager.query_cases(
+                    case_type=case_type,
+                    date_from=date_from,
+                    date_to=date_to,
+                    location=location or None,
+                    limit=limit,
+                    offset=offset,
+                    full=True,
+                    cursor=cursor or None
+                )
+                records = result['records']
+                total_records = result['total']
                 
                 return jsonify({
                     "success": True,
@@ -88,18 +158,23 @@ class APIRoutes:
                             "total": total_records,
                             "limit": limit,
                             "offset": offset,
-                            "has_more": offset + limit < total_records
+                            "has_more": result['next_cursor'] is not None,
+                            "next_cursor": result['next_cursor']
                         },
                         "stats": stats,
                         "filters": {
                             "case_type": case_type,
                             "date_from": date_from,
-                            "date_to": date_to
+                            "date_to": date_to,
+                            "location": location
                         }
                     },
                     "timestamp": datetime.datetime.now().isoformat()
                 })
                 
+            except ValueError as e:
+                # 分頁參數或游標格式錯誤
+                return jsonify({"success": False, "error": str(e)}), 400
             except Exception as e:
                 logger_manager.log_error(f"API get all records failed: {e}")
                 return jsonify({"success": False, "error": str(e)})
@@ -108,24 +183,22 @@ class APIRoutes:
         def api_get_single_record(case_id):
             """API: 獲取單一案件紀錄 (JSON格式)"""
             try:
-                # 搜尋案件檔案
-                filename = f"case_{case_id}.txt"
-                content = case_manager.read_case_file(filename)
+                # 由索引搜尋案件檔案
+                filename = case_manager.find_case_filename(case_id)
+                case_info = case_manager.load_case_record(filename) if filename else None
                 
-                if not content:
+                if not case_info:
                     return jsonify({"success": False, "error": "案件紀錄不存在"})
                 
-                # 解析完整案件資訊
-                case_info = case_manager.parse_case_record_full(content)
                 case_info['filename'] = filename
                 case_info['case_id'] = case_id
                 
-                # 解析時間
-                try:
-                    case_time = datetime.datetime.strptime(case_id, "%Y%m%d_%H%M%S")
+                # 解析時間（支援含流水號的案件編號）
+                case_time = case_manager.parse_case_id(case_id)
+                if case_time:
                     case_info['timestamp'] = case_time.isoformat()
                     case_info['time'] = case_time.strftime("%Y-%m-%d %H:%M:%S")
-                except ValueError:
+                else:
                     case_info['timestamp'] = None
                     case_info['time'] = None
                 
@@ -180,51 +253,19 @@ class APIRoutes:
                 date_from = data.get('date_from', '')
                 date_to = data.get('date_to', '')
                 
-                records = []
-                stats = {
-                    'total_cases': 0,
-                    'ohca_cases': 0,
-                    'internal_cases': 0,
-                    'surgical_cases': 0
-                }
+                location = data.get('location', '')
                 
                 # 如果沒有指定日期範圍，顯示所有記錄
                 # 保持空字串以顯示所有記錄
                 
-                # 獲取案件檔案
-                case_files = case_manager.get_case_files(date_from, date_to)
-                
-                for case_file in case_files:
-                    try:
-                        # 讀取案件檔案
-                        content = case_manager.read_case_file(case_file['filename'])
-                        if content:
-                            # 解析案件資訊
-                            case_info = case_manager.parse_case_record(content)
-                            # 添加檔案資訊，但不覆蓋已解析的內容
-                            for key, value in case_file.items():
-                                if key not in case_info or case_info[key] is None:
-                                    case_info[key] = value
-                            
-                            # 統計
-                            stats['total_cases'] += 1
-                            if case_info.get('event_type') == 'OHCA':
-                                stats['ohca_cases'] += 1
-                            elif case_info.get('event_type') == '內科':
-                                stats['internal_cases'] += 1
-                            elif case_info.get('event_type') == '外科':
-                                stats['surgical_cases'] += 1
-                            
-                            # 類型過濾
-                            if case_type == 'all' or case_info.get('event_type') == case_type:
-                                records.append(case_info)
-                                
-                    except Exception as e:
-                        logger_manager.log_error(f"Failed to parse case record {case_file['filename']}: {e}")
-                        continue
-                
-                # 按時間排序（最新的在前）
-                records.sort(key=lambda x: x['case_id'], reverse=True)
+                # 統計由每日統計桶彙總，記錄由查詢引擎過濾
+                stats = self._summary_stats(date_from, date_to)
+                records = case_manager.query_cases(
+                    case_type=case_type,
+                    date_from=date_from,
+                    date_to=date_to,
+                    location=location or None
+                )['records']
                 
                 return jsonify({
                     "success": True,
@@ -245,14 +286,7 @@ class APIRoutes:
                 date_from = data.get('date_from', '')
                 date_to = data.get('date_to', '')
                 ip_filter = data.get('ip_filter', '')
-                
-                logs = []
-                stats = {
-                    'total_requests': 0,
-                    'user_actions': 0,
-                    'incidents': 0,
-                    'tests': 0
-                }
+                action_filter = data.get('action', '')
                 
                 # 如果沒有指定日期範圍，預設為今天
                 if not date_from:
@@ -260,118 +294,20 @@ class APIRoutes:
                 if not date_to:
                     date_to = date_from
                 
-                # 轉換日期格式並生成日期列表
+                # 由日誌索引過濾與統計，不再逐行解析文字檔
                 try:
-                    start_date = datetime.datetime.strptime(date_from, "%Y-%m-%d")
-                    end_date = datetime.datetime.strptime(date_to, "%Y-%m-%d")
-                    
-                    # 生成日期範圍
-                    current_date = start_date
-                    while current_date <= end_date:
-                        date_str = current_date.strftime("%Y%m%d")
-                        log_filename = logger_manager.get_log_filename(date_str)
-                        
-                        # 讀取日誌檔案
-                        if os.path.exists(log_filename):
-                            log_lines = logger_manager.read_log_file(os.path.basename(log_filename))
-                            logger_manager.log_user_action("日誌API調試", f"讀取到 {len(log_lines)} 行日誌")
-                            
-                            for i, line in enumerate(log_lines):
-                                line = line.strip()
-                                if not line:
-                                    continue
-                                
-                                # 只調試前5行
-                                if i < 5:
-                                    logger_manager.log_user_action("日誌行調試", f"第{i+1}行: {repr(line[:100])}")
-                                
-                                # 解析日誌行
-                                try:
-                                    # 嘗試多種解析方式
-                                    if ' [' in line and '] ' in line:
-                                        parts = line.split(' [', 2)
-                                        if len(parts) >= 2:
-                                            timestamp = parts[0]
-                                            # 從 parts[1] 中分離 level 和 message
-                                            level_message = parts[1]
-                                            if '] ' in level_message:
-                                                level, message = level_message.split('] ', 1)
-                                                level = level.strip()
-                                                message = message.strip()
-                                                
-                                                # 調試解析結果
-                                                if i < 5:
-                                                    logger_manager.log_user_action("解析成功", f"第{i+1}行: {timestamp} | {level} | {message[:30]}...")
-                                            else:
-                                                if i < 5:
-                                                    logger_manager.log_user_action("解析失敗", f"第{i+1}行找不到 '] '")
-                                                continue
-                                        else:
-                                            if i < 5:
-                                                logger_manager.log_user_action("解析失敗", f"第{i+1}行parts長度不足: {len(parts)}")
-                                            continue
-                                    elif '] ' in line:
-                                        # 備用解析方式
-                                        bracket_pos = line.find('] ')
-                                        if bracket_pos > 0:
-                                            timestamp_level = line[:bracket_pos]
-                                            message = line[bracket_pos + 2:]
-                                            if ' [' in timestamp_level:
-                                                timestamp, level = timestamp_level.split(' [', 1)
-                                                level = level.rstrip(']')
-                                            else:
-                                                continue
-                                        else:
-                                            continue
-                                    else:
-                                        if i < 5:
-                                            logger_manager.log_user_action("解析失敗", f"第{i+1}行格式不符合: 找不到 ' [' 或 '] '")
-                                        continue
-                                    
-                                    # 類型過濾
-                                    if log_type != 'all' and level.lower() != log_type.lower():
-                                        if i < 5:
-                                            logger_manager.log_user_action("類型過濾", f"第{i+1}行被過濾: {level} != {log_type}")
-                                        continue
-                                    
-                                    # IP過濾
-                                    if ip_filter and ip_filter not in message:
-                                        if i < 5:
-                                            logger_manager.log_user_action("IP過濾", f"第{i+1}行被過濾: IP不匹配")
-                                        continue
-                                    
-                                    logs.append({
-                                        'timestamp': timestamp,
-                                        'type': level,
-                                        'content': message
-                                    })
-                                    
-                                    # 統計
-                                    stats['total_requests'] += 1
-                                    if 'USER_ACTION' in message or 'User Action' in message:
-                                        stats['user_actions'] += 1
-                                    elif 'INCIDENT' in message or '案件' in message:
-                                        stats['incidents'] += 1
-                                    elif 'TEST' in message or '測試' in message:
-                                        stats['tests'] += 1
-                                    
-                                    # 記錄成功添加的日誌
-                                    if i < 5:
-                                        logger_manager.log_user_action("日誌添加成功", f"第{i+1}行已添加: {level}")
-                                    
-                                except Exception as e:
-                                    continue
-                        
-                        current_date += datetime.timedelta(days=1)
-                
+                    result = logger_manager.query_logs(
+                        date_from,
+                        date_to,
+                        log_type=log_type,
+                        ip=ip_filter or None,
+                        action=action_filter or None
+                    )
                 except ValueError as e:
                     return jsonify({"success": False, "error": f"日期格式錯誤: {str(e)}"})
                 
-                # 按時間排序（最新的在前）
-                logs.sort(key=lambda x: x['timestamp'], reverse=True)
-                
-                # 記錄最終結果
-                logger_manager.log_user_action("日誌API結果", f"返回 {len(logs)} 條日誌，統計: {stats}")
+                logs = result['logs']
+                stats = result['stats']
                 
                 return jsonify({
                     "success": True,
@@ -383,6 +319,104 @@ class APIRoutes:
                 logger_manager.log_error(f"Get logs API failed: {e}")
                 return jsonify({"success": False, "error": str(e)})
         
+        @self.app.route("/system/logs/diagnostics", methods=["GET", "POST"])
+        def logs_diagnostics():
+            """查詢或切換日誌解析診斷模式"""
+            try:
+                if request.method == "POST":
+                    data = request.get_json() or {}
+                    status = logger_manager.set_diagnostics(
+                        enabled=data.get('enabled'),
+                        sample_rate=data.get('sample_rate'),
+                        rate_limit=data.get('rate_limit')
+                    )
+                    logger_manager.log_user_action("切換日誌診斷模式", f"狀態: {status}")
+                else:
+                    status = logger_manager.get_diagnostics_status()
+                
+                return jsonify({"success": True, "diagnostics": status})
+                
+            except (TypeError, ValueError) as e:
+                return jsonify({"success": False, "error": f"參數格式錯誤: {str(e)}"})
+            except Exception as e:
+                logger_manager.log_error(f"Log diagnostics failed: {e}")
+                return jsonify({"success": False, "error": str(e)})
+        
+        @self.app.route("/system/broadcast/control", methods=["GET", "POST"])
+        def broadcast_control():
+            """查詢或切換 LINE 與 Discord 廣播（所有工作程序立即生效）"""
+            try:
+                if request.method == "POST":
+                    data = request.get_json() or {}
+                    message_broadcaster.set_broadcast_control(
+                        line=data.get('line_enabled'),
+                        discord=data.get('discord_enabled')
+                    )
+                    status = message_broadcaster.get_broadcast_status()
+                    logger_manager.log_user_action("切換廣播控制", f"狀態: {status}")
+                else:
+                    status = message_broadcaster.get_broadcast_status()
+                
+                return jsonify({"success": True, "broadcast": status})
+                
+            except Exception as e:
+                logger_manager.log_error(f"Broadcast control failed: {e}")
+                return jsonify({"success": False, "error": str(e)})
+        
+        @self.app.route("/system/traces/summary", methods=["GET"])
+        def traces_summary():
+            """填報流程各階段與通報到送達時間的每日百分位數統計"""
+            try:
+                today = datetime.datetime.now().strftime("%Y-%m-%d")
+                date_from = request.args.get('date_from', today)
+                date_to = request.args.get('date_to', date_from)
+                
+                # 驗證日期格式
+                datetime.datetime.strptime(date_from, "%Y-%m-%d")
+                datetime.datetime.strptime(date_to, "%Y-%m-%d")
+                
+                return jsonify({
+                    "success": True,
+                    "summary": wizard_tracer.get_summary(date_from, date_to),
+                    "filters": {"date_from": date_from, "date_to": date_to}
+                })
+                
+            except ValueError as e:
+                return jsonify({"success": False, "error": f"日期格式錯誤: {str(e)}"})
+            except Exception as e:
+                logger_manager.log_error(f"Trace summary failed: {e}")
+                return jsonify({"success": False, "error": str(e)})
+        
+        @self.app.route("/system/traces", methods=["GET"])
+        def list_traces():
+            """獲取指定日期的填報流程追蹤列表"""
+            try:
+                date = request.args.get('date', datetime.datetime.now().strftime("%Y-%m-%d"))
+                datetime.datetime.strptime(date, "%Y-%m-%d")
+                limit = min(int(request.args.get('limit', 100)), 1000)
+                
+                traces = wizard_tracer.get_traces(date, limit)
+                return jsonify({"success": True, "traces": traces, "count": len(traces)})
+                
+            except ValueError as e:
+                return jsonify({"success": False, "error": f"參數格式錯誤: {str(e)}"})
+            except Exception as e:
+                logger_manager.log_error(f"List traces failed: {e}")
+                return jsonify({"success": False, "error": str(e)})
+        
+        @self.app.route("/system/traces/<trace_id>", methods=["GET"])
+        def get_trace(trace_id):
+            """獲取單一填報流程追蹤的所有階段"""
+            try:
+                trace = wizard_tracer.get_trace(trace_id)
+                if not trace:
+                    return jsonify({"success": False, "error": "追蹤紀錄不存在"}), 404
+                return jsonify({"success": True, "trace": trace})
+                
+            except Exception as e:
+                logger_manager.log_error(f"Get trace failed: {e}")
+                return jsonify({"success": False, "error": str(e)})
+        
         @self.app.route("/system/logs/export", methods=["POST"])
         def export_logs():
             """匯出日誌檔案"""
@@ -397,47 +431,32 @@ class APIRoutes:
                 if not date_to:
                     date_to = date_from
                 
-                # 生成匯出檔案名稱
-                export_filename = f"logs_export_{date_from}_{date_to}.txt"
-                export_path = os.path.join("logs", export_filename)
+                compression = data.get('compression') or None
                 
-                # 收集日誌內容
-                all_logs = []
                 try:
                     start_date = datetime.datetime.strptime(date_from, "%Y-%m-%d")
                     end_date = datetime.datetime.strptime(date_to, "%Y-%m-%d")
+                except ValueError as e:
+                    return jsonify({"success": False, "error": f"日期格式錯誤: {str(e)}"})
+                
+                # 生成匯出檔案名稱
+                export_filename = f"logs_export_{date_from}_{date_to}.txt"
+                
+                def generate():
+                    """逐行產生日誌內容"""
+                    yield f"日誌匯出 / Log Export\n"
+                    yield f"日期範圍 / Date Range: {date_from} ~ {date_to}\n"
+                    yield f"匯出時間 / Export Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                    yield "="*50 + "\n\n"
                     
                     current_date = start_date
                     while current_date <= end_date:
                         date_str = current_date.strftime("%Y%m%d")
-                        log_filename = logger_manager.get_log_filename(date_str)
-                        
-                        if os.path.exists(log_filename):
-                            log_lines = logger_manager.read_log_file(f"flask_app_{date_str}.log")
-                            all_logs.extend(log_lines)
-                        
+                        yield from logger_manager.iter_log_file(f"flask_app_{date_str}.log")
                         current_date += datetime.timedelta(days=1)
                 
-                except ValueError as e:
-                    return jsonify({"success": False, "error": f"日期格式錯誤: {str(e)}"})
-                
-                # 寫入匯出檔案
-                with open(export_path, 'w', encoding='utf-8') as f:
-                    f.write(f"日誌匯出 / Log Export\n")
-                    f.write(f"日期範圍 / Date Range: {date_from} ~ {date_to}\n")
-                    f.write(f"匯出時間 / Export Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                    f.write("="*50 + "\n\n")
-                    f.writelines(all_logs)
-                
-                # 返回檔案下載
-                from flask import send_file
-                return send_file(
-                    export_path,
-                    as_attachment=True,
-                    download_name=export_filename,
-                    mimetype='text/plain'
-                )
-                
+                return self._stream_export(generate(), export_filename, compression)
+            
             except Exception as e:
                 logger_manager.log_error(f"Export logs failed: {e}")
                 return jsonify({"success": False, "error": str(e)})
@@ -458,7 +477,7 @@ class APIRoutes:
                     "message": message,
                     "cleared_files": cleared_files
                 })
-                
+            
             except Exception as e:
                 logger_manager.log_error(f"Clear logs failed: {e}")
                 return jsonify({"success": False, "error": str(e)})
@@ -474,34 +493,34 @@ class APIRoutes:
                 # 如果沒有指定日期範圍，顯示所有記錄
                 # 保持空字串以顯示所有記錄
                 
+                compression = data.get('compression') or None
+                
                 # 生成匯出檔案名稱
                 if date_from and date_to:
                     export_filename = f"records_export_{date_from}_{date_to}.txt"
                 else:
                     export_filename = f"records_export_all.txt"
-                export_path = os.path.join("record", export_filename)
-                
-                # 收集案件紀錄
-                case_files = case_manager.get_case_files(date_from, date_to)
-                
-                # 寫入匯出檔案
-                with open(export_path, 'w', encoding='utf-8') as f:
-                    f.write(f"案件紀錄匯出 / Case Records Export\n")
-                    f.write(f"日期範圍 / Date Range: {date_from} ~ {date_to}\n")
-                    f.write(f"匯出時間 / Export Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                    f.write(f"案件總數 / Total Cases: {len(case_files)}\n")
-                    f.write("="*50 + "\n\n")
+                
+                total_cases = case_manager.count_cases(date_from, date_to)
+                
+                def generate():
+                    """逐筆產生案件紀錄內容"""
+                    yield f"案件紀錄匯出 / Case Records Export\n"
+                    yield f"日期範圍 / Date Range: {date_from} ~ {date_to}\n"
+                    yield f"匯出時間 / Export Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                    yield f"案件總數 / Total Cases: {total_cases}\n"
+                    yield "="*50 + "\n\n"
                     
-                    for case_file in case_files:
+                    for case_file in case_manager.iter_case_files(date_from, date_to):
                         content = case_manager.read_case_file(case_file['filename'])
                         if content:
-                            f.write(f"案件檔案 / Case File: {case_file['filename']}\n")
-                            f.write("-" * 30 + "\n")
-                            f.write(content)
-                            f.write("\n" + "="*50 + "\n\n")
-                
-                return send_file(export_path, as_attachment=True, download_name=export_filename)
+                            yield f"案件檔案 / Case File: {case_file['filename']}\n"
+                            yield "-" * 30 + "\n"
+                            yield content
+                            yield "\n" + "="*50 + "\n\n"
                 
+                return self._stream_export(generate(), export_filename, compression)
+            
             except Exception as e:
                 logger_manager.log_error(f"Export records failed: {e}")
                 return jsonify({"success": False, "error": str(e)})
@@ -522,7 +541,7 @@ class APIRoutes:
                     "message": message,
                     "cleared_files": cleared_files
                 })
-                
+            
             except Exception as e:
                 logger_manager.log_error(f"Clear records failed: {e}")
                 return jsonify({"success": False, "error": str(e)})
@@ -3,35 +3,39 @@
 重構後的模組化版本
 """
 
-from flask import Flask, request, abort, render_template, redirect, session, jsonify
-from linebot import LineBotApi, WebhookHandler
+from flask import Flask, request, abort, render_template, redirect, session, jsonify, Response, g
+from linebot import WebhookHandler
 from linebot.exceptions import InvalidSignatureError
-from linebot.models import MessageEvent, TextMessage, TextSendMessage, JoinEvent
+from linebot.models import MessageEvent, TextMessage, JoinEvent
 import datetime
 import logging
-import os
-import requests
 import threading
+import time
 
 # 導入自定義模組
 from config import config
 from logger import logger_manager
 from case_manager import case_manager
 from message_broadcaster import message_broadcaster
+from http_client import http_client
+from session_store import session_interface
+from metrics import metrics
+from tracing import wizard_tracer
 
 # 創建Flask應用程式
 app = Flask(__name__, static_folder="static", static_url_path="/")
 app.secret_key = config.SECRET_KEY
-app.config["SESSION_TYPE"] = config.SESSION_TYPE
+
+# 伺服器端 Session：Cookie 只保存 Session ID，填報資料保存在 SQLite（所有工作程序共用）
+if config.SESSION_TYPE != "cookie":
+    app.session_interface = session_interface
 
 # 禁用Flask的請求日誌記錄
 import logging
 log = logging.getLogger('werkzeug')
 log.disabled = True
 
-# LINE Bot 設定
-from linebot import LineBotApi, WebhookHandler
-line_bot_api = LineBotApi(config.LINE_BOT_API_TOKEN)
+# LINE Bot 設定（訊息發送使用共用 HTTP 連線池）
 handler = WebhookHandler(config.LINE_WEBHOOK_HANDLER)
 
 # 驗證配置
@@ -41,9 +45,18 @@ except ValueError as e:
     print(f"配置驗證失敗: {e}")
     exit(1)
 
-# 廣播寄送控制
+# 廣播寄送控制（預設值；執行中可由管理網站切換，設定保存在共用狀態供所有工作程序使用）
 line = 1
 discord = 1
+message_broadcaster.init_broadcast_control(line=line == 1, discord=discord == 1)
+message_broadcaster.start_outbox()
+
+# 開始彙總效能指標（/metrics）與填報流程追蹤
+metrics.start("main")
+wizard_tracer.start()
+
+# 啟動時預熱外部 API 連線
+http_client.start_keepalive()
 
 # 案件分類和地點對照表
 event_table = {1: "OHCA", 2: "內科", 3: "外科"}
@@ -71,45 +84,29 @@ locat_table = {
     21: "共善樓",
 }
 
+def get_location_name():
+    """獲取目前 session 選擇的地點名稱（預設地點查表，自訂地點只保存在使用者 session）"""
+    location_id = session.get("locat", "0")
+    if location_id == "99":
+        return session.get("custom_location") or "Unknown"
+    try:
+        return locat_table.get(int(location_id), "Unknown")
+    except (ValueError, TypeError):
+        return "Unknown"
+
 def Time() -> str:
     """獲取當前時間字串"""
     now = datetime.datetime.now().strftime("%Y年%m月%d日 %H時%M分%S秒")
     return now
 
-def discord_send(message):
-    """發送 Discord 訊息並返回訊息 ID"""
-    try:
-        # 使用 requests 直接呼叫 Discord Webhook API 來獲取訊息 ID
-        # 添加 wait=true 參數來獲取訊息 ID
-        payload = {"content": message}
-        response = requests.post(f"{config.DISCORD_WEBHOOK_URL}?wait=true", json=payload)
-        
-        if response.status_code == 200:  # 使用 wait=true 時，成功回應是 200
-            # 從回應中獲取訊息 ID
-            message_data = response.json()
-            message_id = message_data.get('id')
-            logging.info(f"Discord message sent successfully, ID: {message_id}")
-            return message_id
-        else:
-            logging.error(f"Failed to send Discord message: {response.status_code} - {response.text}")
-            return None
-            
-    except Exception as e:
-        logging.error(f"Error sending Discord message: {e}")
-        return None
-
-def broadcast_message(group_id, message):
-    """廣播訊息到LINE群組"""
-    line_bot_api.push_message(group_id, TextSendMessage(text=message))
-
 # 公開API路由（供外部訪問）
 @app.route("/api/stats", methods=["GET"])
 def get_stats():
     """獲取系統統計資料"""
     try:
-        # 獲取案件統計
-        case_files = case_manager.get_case_files()
+        # 獲取案件統計（由每日統計桶彙總，單次查詢）
         case_stats = case_manager.get_case_stats()
+        today = datetime.datetime.now().strftime("%Y-%m-%d")
         
         # 獲取日誌統計
         log_files = logger_manager.get_log_files()
@@ -118,15 +115,16 @@ def get_stats():
             "success": True,
             "data": {
                 "cases": {
-                    "total": len(case_files),
-                    "today": case_stats.get('total_cases', 0),
+                    "total": case_stats.get('total_cases', 0),
+                    "today": case_stats['by_date'].get(today, 0),
                     "ohca": case_stats.get('ohca_cases', 0),
                     "internal": case_stats.get('internal_cases', 0),
                     "surgical": case_stats.get('surgical_cases', 0)
                 },
                 "logs": {
                     "total_files": len(log_files),
-                    "latest_file": log_files[0]['filename'] if log_files else None
+                    "latest_file": log_files[0]['filename'] if log_files else None,
+                    "pipeline": logger_manager.get_pipeline_stats()
                 },
                 "system": {
                     "status": "running",
@@ -143,31 +141,36 @@ def get_cases():
     try:
         # 獲取查詢參數
         case_type = request.args.get('type', 'all')
+        date_from = request.args.get('from', '')
+        date_to = request.args.get('to', '')
+        location = request.args.get('location', '')
         limit = int(request.args.get('limit', 10))
         offset = int(request.args.get('offset', 0))
+        cursor = request.args.get('cursor', '')
         
-        # 獲取案件檔案
-        case_files = case_manager.get_case_files()
-        
-        # 過濾案件
-        filtered_cases = []
-        for case_file in case_files[offset:offset+limit]:
-            content = case_manager.read_case_file(case_file['filename'])
-            if content:
-                case_info = case_manager.parse_case_record(content)
-                if case_type == 'all' or case_info.get('event_type') == case_type:
-                    case_info.update(case_file)
-                    filtered_cases.append(case_info)
+        # 由查詢引擎過濾後再分頁，確保每頁筆數正確（有游標時使用鍵集分頁）
+        result = case_manager.query_cases(
+            case_type=case_type,
+            date_from=date_from,
+            date_to=date_to,
+            location=location or None,
+            limit=limit,
+            offset=offset,
+            cursor=cursor or None
+        )
         
         return jsonify({
             "success": True,
             "data": {
-                "cases": filtered_cases,
-                "total": len(case_files),
+                "cases": result['records'],
+                "total": result['total'],
                 "limit": limit,
-                "offset": offset
+                "offset": offset,
+                "next_cursor": result['next_cursor']
             }
         })
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -175,9 +178,8 @@ def get_cases():
 def get_case_detail(case_id):
     """獲取特定案件詳情"""
     try:
-        content = case_manager.read_case_file(case_id)
-        if content:
-            case_info = case_manager.parse_case_record_full(content)
+        case_info = case_manager.load_case_record(case_id)
+        if case_info:
             return jsonify({
                 "success": True,
                 "data": case_info
@@ -196,6 +198,8 @@ def get_logs():
         limit = int(request.args.get('limit', 50))
         date_from = request.args.get('date_from', '')
         date_to = request.args.get('date_to', '')
+        ip_filter = request.args.get('ip', '')
+        action_filter = request.args.get('action', '')
         
         # 如果沒有指定日期範圍，預設為今天
         if not date_from:
@@ -203,75 +207,21 @@ def get_logs():
         if not date_to:
             date_to = date_from
         
-        logs = []
-        stats = {
-            'total_requests': 0,
-            'user_actions': 0,
-            'incidents': 0,
-            'tests': 0
-        }
-        
-        # 轉換日期格式並生成日期列表
+        # 由日誌索引過濾、統計並限制數量（最新的在前）
         try:
-            start_date = datetime.datetime.strptime(date_from, "%Y-%m-%d")
-            end_date = datetime.datetime.strptime(date_to, "%Y-%m-%d")
-            
-            # 生成日期範圍
-            current_date = start_date
-            while current_date <= end_date:
-                date_str = current_date.strftime("%Y%m%d")
-                log_filename = logger_manager.get_log_filename(date_str)
-                
-                # 讀取日誌檔案
-                if os.path.exists(log_filename):
-                    log_lines = logger_manager.read_log_file(os.path.basename(log_filename))
-                    
-                    for line in log_lines:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        
-                        # 解析日誌行
-                        try:
-                            if ' [' in line and '] ' in line:
-                                parts = line.split(' [', 2)
-                                if len(parts) >= 2:
-                                    timestamp = parts[0]
-                                    level_message = parts[1]
-                                    if '] ' in level_message:
-                                        level, message = level_message.split('] ', 1)
-                                        level = level.strip()
-                                        message = message.strip()
-                                        
-                                        # 類型過濾
-                                        if log_type != 'all' and level.lower() != log_type.lower():
-                                            continue
-                                        
-                                        logs.append({
-                                            'timestamp': timestamp,
-                                            'type': level,
-                                            'content': message
-                                        })
-                                        
-                                        # 統計
-                                        stats['total_requests'] += 1
-                                        if 'USER_ACTION' in message or 'User Action' in message:
-                                            stats['user_actions'] += 1
-                                        elif 'INCIDENT' in message or '案件' in message:
-                                            stats['incidents'] += 1
-                                        elif 'TEST' in message or '測試' in message:
-                                            stats['tests'] += 1
-                        except Exception:
-                            continue
-                
-                current_date += datetime.timedelta(days=1)
-        
+            result = logger_manager.query_logs(
+                date_from,
+                date_to,
+                log_type=log_type,
+                ip=ip_filter or None,
+                action=action_filter or None,
+                limit=limit
+            )
         except ValueError as e:
             return jsonify({"success": False, "error": f"日期格式錯誤: {str(e)}"}), 400
         
-        # 按時間排序並限制數量
-        logs.sort(key=lambda x: x['timestamp'], reverse=True)
-        logs = logs[:limit]
+        logs = result['logs']
+        stats = result['stats']
         
         return jsonify({
             "success": True,
@@ -292,62 +242,51 @@ def get_records():
         case_type = request.args.get('type', 'all')
         date_from = request.args.get('from', '')
         date_to = request.args.get('to', '')
+        location = request.args.get('location', '')
         limit = int(request.args.get('limit', 100))
         offset = int(request.args.get('offset', 0))
+        cursor = request.args.get('cursor', '')
         
-        records = []
+        # 統計由每日統計桶彙總，記錄由查詢引擎過濾與分頁
+        case_stats = case_manager.get_case_stats(date_from, date_to)
         stats = {
-            'total_cases': 0,
-            'ohca_cases': 0,
-            'internal_cases': 0,
-            'surgical_cases': 0
+            'total_cases': case_stats['total_cases'],
+            'ohca_cases': case_stats['ohca_cases'],
+            'internal_cases': case_stats['internal_cases'],
+            'surgical_cases': case_stats['surgical_cases']
         }
         
-        # 獲取案件檔案
-        case_files = case_manager.get_case_files(date_from, date_to)
-        
-        for case_file in case_files:
-            # 讀取案件檔案內容
-            content = case_manager.read_case_file(case_file['filename'])
-            if not content:
-                continue
-                
-            # 解析案件記錄
-            case_info = case_manager.parse_case_record(content)
-            
-            # 統計
-            stats['total_cases'] += 1
-            event_type = case_info.get('event_type', '')
-            if 'OHCA' in event_type:
-                stats['ohca_cases'] += 1
-            elif '內科' in event_type:
-                stats['internal_cases'] += 1
-            elif '外科' in event_type:
-                stats['surgical_cases'] += 1
-            
-            # 過濾案件類型
-            if case_type != 'all' and case_type not in event_type:
-                continue
-            
-            # 添加檔案資訊
-            case_info.update(case_file)
-            records.append(case_info)
-        
-        # 分頁處理
-        total_count = len(records)
-        records = records[offset:offset + limit]
+        result = case_manager.query_cases(
+            case_type=case_type,
+            date_from=date_from,
+            date_to=date_to,
+            location=location or None,
+            limit=limit,
+            offset=offset,
+            cursor=cursor or None,
+            # 此端點的分類一向以部分字串比對（如「科」同時符合內科與外科）
+            type_contains=True
+        )
+        records = result['records']
         
         return jsonify({
             "success": True,
             "data": records,
             "stats": stats,
             "pagination": {
-                "total": total_count,
+                "total": result['total'],
                 "limit": limit,
                 "offset": offset,
-                "count": len(records)
+                "count": len(records),
+                "has_more": result['next_cursor'] is not None,
+                "next_cursor": result['next_cursor']
             }
         })
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             "success": False,
@@ -356,11 +295,35 @@ def get_records():
 
 # 注意：敏感操作（如清除、匯出）仍保留在管理網站中
 
+# 填報流程各階段（依序），每個階段的處理時間以 Session 中的追蹤編號串連
+WIZARD_STAGES = (
+    "show_02_event", "process_02_event",
+    "show_03_location", "process_03_location",
+    "show_05_room", "process_05_room",
+    "show_06_content", "process_06_content",
+    "show_07_check", "process_07_check",
+    "show_08_sending", "process_08_sending",
+    "show_09_sending", "show_10_sended"
+)
+
+def trace_wizard_stage(elapsed):
+    """記錄填報流程階段的伺服器處理時間（流程起點建立新的追蹤編號）"""
+    if request.endpoint not in WIZARD_STAGES:
+        return
+    
+    started = time.time() - elapsed
+    if request.endpoint == "show_02_event":
+        session["trace"] = {'id': wizard_tracer.start_trace(started), 'started': started}
+    
+    trace = session.get("trace")
+    if trace:
+        wizard_tracer.record_span(trace, request.endpoint, started, elapsed)
+
 # 請求前處理
 @app.before_request
 def before_request():
     """請求前處理"""
-    user_info = logger_manager.get_user_info()
+    g.request_start = time.perf_counter()
     logger_manager.log_user_action("頁面訪問", f"路徑: {request.path}")
     # 不在這裡記錄請求，避免重複記錄
 
@@ -368,14 +331,25 @@ def before_request():
 @app.after_request
 def after_request(response):
     """請求後處理"""
-    user_info = logger_manager.get_user_info()
+    # 請求處理時間（日誌以毫秒記錄，效能指標以秒依路由統計）
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.record_request(request.method, route, response.status_code, elapsed)
+    trace_wizard_stage(elapsed)
     logger_manager.log_request(
         request.method, 
         request.path, 
-        response.status_code
+        response.status_code,
+        round(elapsed * 1000, 1)
     )
     return response
 
+# 效能指標（Prometheus 文字格式）
+@app.route("/metrics")
+def get_metrics():
+    """輸出效能指標"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 # 主頁面路由
 @app.route("/")
 @app.route("/Inform/Read_02_Event")
@@ -387,9 +361,7 @@ def show_02_event():
     session["room"] = "NULL"
     session["content"] = ""
     session["message"] = "NULL"
-    
-    # 初始化地點表（複製預設表）
-    session["locat_table"] = locat_table
+    session.pop("custom_location", None)
     
     logger_manager.log_user_action("訪問主頁面（案件分類）")
     return render_template("Inform/02_event.html")
@@ -419,20 +391,14 @@ def show_07_check():
     
     # 準備案件資料
     event_type = session.get('event', 0)
-    location_id = session.get('locat', '0')
     room = session.get('room', 'NULL')
     content = session.get('content', '')
     
     # 獲取案件分類名稱
     event_name = event_table.get(event_type, 'Unknown')
     
-    # 獲取地點名稱
-    try:
-        location_id_int = int(location_id)
-        location_name = session["locat_table"].get(session["locat"], 'Unknown')
-    except (ValueError, TypeError):
-        # 如果轉換失敗，可能是自訂地點（ID為99）或其他特殊情況
-        location_name = session["locat_table"].get(location_id, 'Unknown')
+    # 獲取地點名稱（自訂地點的 ID 為 99）
+    location_name = get_location_name()
     
     return render_template("Inform/07_check.html", 
                           event=event_name,
@@ -454,7 +420,7 @@ def show_10_sended():
     # 準備案件資料
     case_data = {
         'event_type': event_table.get(session.get('event', 0), 'Unknown'),
-        'location': session.get('locat_table', {}).get(session.get('locat', 0), 'Unknown'),
+        'location': get_location_name(),
         'room': session.get('room', 'Unknown'),
         'content': session.get('content', 'Unknown'),
         'message': session.get('message', 'Unknown')
@@ -488,12 +454,12 @@ def process_03_location():
     if selected_button != 0:
         # 預設地點
         session["locat"] = str(selected_button)
-        location_name = session["locat_table"].get(session["locat"], "Unknown")
+        location_name = get_location_name()
         logger_manager.log_user_action("選擇案件地點", f"地點: {location_name}({selected_button})")
     else:
-        # 自訂地點：新增到地點表
+        # 自訂地點：只保存使用者輸入的地點
         session["locat"] = "99"
-        session["locat_table"].update({"99": custom_location})
+        session["custom_location"] = custom_location
         logger_manager.log_user_action("自訂案件地點", f"自訂地點: {custom_location}")
 
     return redirect("/Inform/Read_05_Room")
@@ -546,7 +512,7 @@ def show_09_sending():
     session["message"] = (
         "緊急事件通報\n"
         f"案件分類： {event_table[session['event']]}\n"
-        f"案件地點： {session['locat_table'].get(session['locat'], 'Unknown')}\n"
+        f"案件地點： {get_location_name()}\n"
         f"案件位置： {session['room']}\n"
         f"案件補充：\n\t{content_with_tabs}\n"
         f"通報時間： {Time()}"
@@ -555,50 +521,24 @@ def show_09_sending():
     # 記錄事件通報
     logger_manager.log_user_action("提交案件通報", 
         f"Event={event_table[session['event']]} | "
-        f"Location={session['locat_table'].get(session['locat'], 'Unknown')} | "
+        f"Location={get_location_name()} | "
         f"Room={session['room']} | "
         f"ContentLength={len(session['content'])}"
     )
 
-    # 發送訊息並記錄結果
-    discord_success = False
-    line_success = False
-    discord_message_id = None
-
-    if discord == 1:
-        message_id = discord_send(session["message"] + "\n@everyone\n# [事件回覆](https://forms.gle/dww4orwk2RHSbVV2A)")
-        if message_id:
-            discord_success = True
-            discord_message_id = message_id
-            logger_manager.log_user_action("Discord發送成功", f"MessageID={message_id}")
-        else:
-            logger_manager.log_user_action("Discord發送失敗", "Failed to send Discord message")
-    
-    if line == 1:
-        try:
-            broadcast_message(config.LINE_GROUP_ID, session["message"])
-            line_success = True
-            logger_manager.log_user_action("LINE發送成功", f"GroupID={config.LINE_GROUP_ID}")
-        except Exception as e:
-            logger_manager.log_user_action("LINE發送失敗", f"Error={str(e)}")
-
-    # 記錄整體發送結果
-    logger_manager.log_user_action("案件廣播完成", 
-        f"Discord={discord_success} | LINE={line_success}")
-
     # 獲取通報者資訊
     user_info = logger_manager.get_user_info()
     
-    # 準備案件資料並儲存紀錄
+    # 準備案件資料並先儲存紀錄（廣播結果由寄件匣完成後回寫）
     case_data = {
         'event_type': event_table[session['event']],
-        'location': session['locat_table'].get(session['locat'], 'Unknown'),
+        'location': get_location_name(),
         'room': session['room'],
         'content': session['content'],
         'message': session["message"],
-        'discord_success': discord_success,
-        'line_success': line_success,
-        'discord_message_id': discord_message_id,
+        'discord_success': False,
+        'line_success': False,
+        'discord_message_id': None,
         'ip': user_info.get('ip', 'Unknown'),
         'country': user_info.get('country', 'Unknown'),
         'city': user_info.get('city', 'Unknown'),
@@ -606,12 +546,27 @@ def show_09_sending():
     }
     
     # 儲存案件紀錄
+    filename = None
     try:
         filename = case_manager.save_case_record(case_data)
         logger_manager.log_user_action("案件紀錄已保存", f"RecordFile={filename}")
     except Exception as e:
         logger_manager.log_user_action("案件紀錄保存失敗", f"Failed to save case record: {e}")
 
+    # 寫入廣播寄件匣，由背景工作執行緒同時發送到所有啟用的頻道並持續重試
+    results = message_broadcaster.broadcast_message(
+        session["message"],
+        case_data=case_data,
+        discord_content=session["message"] + "\n@everyone\n# [事件回覆](https://forms.gle/dww4orwk2RHSbVV2A)",
+        case_filename=filename,
+        deliver_async=True,
+        trace=session.get("trace")
+    )
+    logger_manager.log_user_action("案件已加入廣播佇列", f"Job={results.get('job_id')} | RecordFile={filename}")
+    
+    if session.get("trace"):
+        wizard_tracer.link_case(session["trace"], filename, results.get('job_id'))
+
     return redirect("/Inform/Read_10_Sended")
 
 # 注意：系統管理功能已移至獨立的管理網站 (admin_app.py)
@@ -638,7 +593,7 @@ def handle_message(event):
     
     # 回覆訊息
     reply_text = f"收到訊息: {event.message.text}"
-    line_bot_api.reply_message(event.reply_token, TextSendMessage(text=reply_text))
+    http_client.line_reply(event.reply_token, reply_text)
 
 @handler.add(JoinEvent)
 def handle_join(event):
@@ -646,7 +601,7 @@ def handle_join(event):
     logger_manager.log_user_action("LINE Bot加入群組")
     
     reply_text = "緊急事件通報系統已啟動！"
-    line_bot_api.reply_message(event.reply_token, TextSendMessage(text=reply_text))
+    http_client.line_reply(event.reply_token, reply_text)
 
 # 錯誤處理
 @app.errorhandler(404)
@@ -662,5 +617,5 @@ def internal_error(error):
     return render_template("Information/500.html"), 500
 
 if __name__ == "__main__":
-    # 啟動應用程式
+    # 開發環境啟動（生產環境請使用 gunicorn app:app，設定見 gunicorn.conf.py）
     app.run(host="0.0.0.0", port=8000, debug=True)
@@ -0,0 +1,68 @@
+"""
+效能測試共用工具
+延遲百分位數計算，以及結果輸出、基準值儲存與退化比較（load_test.py 與 bench_storage.py 共用）
+"""
+
+import os
+import sys
+import json
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# 輸出的延遲百分位數
+PERCENTILES = (50, 95, 99)
+
+# 只影響輸出方式、不影響測試結果的參數（不計入測試設定）
+REPORT_ARGUMENTS = ('output', 'save_baseline', 'compare')
+
+def percentiles(values):
+    """計算延遲百分位數（最近排名法，單位：毫秒）"""
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+    summary = {'count': len(values)}
+    for percentile in PERCENTILES:
+        rank = max(1, -(-percentile * len(values) // 100))
+        summary[f'p{percentile}'] = round(values[rank - 1] * 1000, 1)
+    summary['max'] = round(values[-1] * 1000, 1)
+    return summary
+
+def is_regression(before, after, threshold, min_delta):
+    """判斷數值是否退化（忽略極小的絕對差距，避免毫秒以下的雜訊被判定為退化）"""
+    return after > before * (1 + threshold) and after - before >= min_delta
+
+def add_report_arguments(parser):
+    """加入結果輸出與基準值比較的參數"""
+    parser.add_argument("--output", help="將結果寫入 JSON 檔案")
+    parser.add_argument("--save-baseline", metavar="NAME", help="儲存為 benchmarks/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="與 benchmarks/baselines/NAME.json 比較")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定退化的變動比例")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="判定退化的最小差距（毫秒）")
+
+def finish_report(report, args, compare):
+    """寫入結果、儲存基準值並與基準值比較（compare(report, baseline) 返回退化項目，有退化時結束碼為 1）"""
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n已儲存基準值: {path}")
+    
+    if args.compare:
+        path = os.path.join(BASELINE_DIR, f"{args.compare}.json")
+        with open(path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline)
+        print(f"\n== 與基準值 {args.compare}（{baseline['timestamp']}）比較 ==")
+        changed = [key for key, value in report['settings'].items() if baseline['settings'].get(key) != value]
+        if changed:
+            print(f"注意：測試設定與基準值不同（{', '.join(changed)}），結果可能無法直接比較")
+        if regressions:
+            for item in regressions:
+                print(f"退化: {item}")
+            sys.exit(1)
+        print("未發現效能退化")
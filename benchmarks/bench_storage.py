@@ -0,0 +1,325 @@
+"""
+儲存效能測試工具
+以 generate_archive.py 產生不同規模的案件紀錄與日誌，逐一量測 CaseManager 與 LoggerManager 的讀取路徑
+（索引重建、列表、分頁、統計、紀錄解析與匯出串流），輸出各規模的耗時與成長倍數，並可儲存基準值比較效能退化
+
+使用方式:
+    python benchmarks/bench_storage.py                                   # 1 萬與 10 萬筆案件、30 天日誌
+    python benchmarks/bench_storage.py --cases 10000,100000,1000000 --format mixed
+    python benchmarks/bench_storage.py --save-baseline default           # 儲存為基準值
+    python benchmarks/bench_storage.py --compare default                 # 與基準值比較，退化時結束碼為 1
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import datetime
+import resource
+import statistics
+import subprocess
+from bench_common import REPORT_ARGUMENTS, is_regression, add_report_arguments, finish_report
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 產生完成的資料集標記（中斷的產生作業會重新執行）
+COMPLETE_MARKER = ".complete"
+
+# 量測程序使用的設定（不連線外部服務）
+BENCH_ENV = {
+    'SECRET_KEY': 'benchmark',
+    'LINE_BOT_API_TOKEN': 'benchmark',
+    'LINE_WEBHOOK_HANDLER': 'benchmark',
+    'LINE_GROUP_ID': 'benchmark',
+    'LINE_API_BASE_URL': 'http://127.0.0.1:9',
+    'DISCORD_WEBHOOK_URL': 'http://127.0.0.1:9/webhook',
+    'HTTP_KEEPALIVE_INTERVAL': '0'
+}
+
+class StorageBenchmark:
+    """在資料集目錄中量測各讀取路徑（需在資料集目錄中執行，模組以目前目錄為資料位置）"""
+    
+    def __init__(self, repeat):
+        self.repeat = max(1, repeat)
+        self.results = {}
+        self.log_range = None
+        
+        # 資料結束於昨天，範圍查詢使用最近 7 天與 30 天
+        last_day = datetime.date.today() - datetime.timedelta(days=1)
+        self.date_to = last_day.strftime("%Y-%m-%d")
+        self.week_from = (last_day - datetime.timedelta(days=6)).strftime("%Y-%m-%d")
+        self.month_from = (last_day - datetime.timedelta(days=29)).strftime("%Y-%m-%d")
+    
+    def measure(self, name, func, repeat=None, samples=None):
+        """重複執行並記錄耗時的中位數與最小值（毫秒，samples 為每次處理的樣本數），返回最後一次的結果"""
+        durations = []
+        result = None
+        for _ in range(repeat or self.repeat):
+            started = time.perf_counter()
+            result = func()
+            durations.append(time.perf_counter() - started)
+        
+        self.results[name] = {
+            'runs': len(durations),
+            'median_ms': round(statistics.median(durations) * 1000, 2),
+            'min_ms': round(min(durations) * 1000, 2)
+        }
+        if samples is not None:
+            self.results[name]['samples'] = samples
+        return result
+    
+    def run(self):
+        """執行所有量測"""
+        # 刪除索引，讓啟動時的同步重建完整索引
+        for path in glob.glob(os.path.join("data", "case_index.db*")) + glob.glob(os.path.join("data", "log_index.db*")):
+            os.remove(path)
+        
+        started = time.perf_counter()
+        from case_manager import case_manager
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        self.results['case_index.cold_sync'] = {'runs': 1, 'median_ms': elapsed_ms, 'min_ms': elapsed_ms}
+        self.measure("case_index.warm_sync", case_manager.sync_index)
+        
+        self.run_case_paths(case_manager)
+        self.run_log_paths()
+        self.run_exports()
+        
+        return {
+            'cases': case_manager.count_cases(),
+            'results': self.results,
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        }
+    
+    def run_case_paths(self, case_manager):
+        """案件紀錄的讀取路徑"""
+        files = self.measure("get_case_files.all", case_manager.get_case_files)
+        self.measure("get_case_files.30d", lambda: case_manager.get_case_files(self.month_from, self.date_to))
+        self.measure("iter_case_files.all", lambda: sum(1 for _ in case_manager.iter_case_files()), repeat=1)
+        self.measure("count_cases.all", case_manager.count_cases)
+        self.measure("count_cases.30d", lambda: case_manager.count_cases(self.month_from, self.date_to))
+        
+        # 分頁查詢：第一頁、以游標翻到一半的深層頁面與條件過濾
+        first_page = self.measure("query_cases.first_page", lambda: case_manager.query_cases(limit=50))
+        if files:
+            middle_cursor = case_manager.encode_cursor(files[len(files) // 2]['case_id'])
+            self.measure("query_cases.deep_cursor", lambda: case_manager.query_cases(limit=50, cursor=middle_cursor))
+            self.measure("query_cases.offset_deep", lambda: case_manager.query_cases(limit=50, offset=len(files) // 2))
+        self.measure("query_cases.filtered", lambda: case_manager.query_cases(
+            case_type="內科", location="圖書館", date_from=self.month_from, date_to=self.date_to, limit=50
+        ))
+        self.measure("query_cases.full_page", lambda: case_manager.query_cases(limit=50, full=True))
+        
+        # 單筆紀錄：清空快取後載入（讀檔與解析）與快取命中
+        sample = [case_file['filename'] for case_file in files[::max(1, len(files) // 200)]][:200]
+        def load_cold():
+            case_manager._invalidate_cached_records()
+            for filename in sample:
+                case_manager.load_case_record(filename)
+        self.measure("load_case_record.cold", load_cold, samples=len(sample))
+        self.measure("load_case_record.warm", lambda: [case_manager.load_case_record(name) for name in sample],
+                     samples=len(sample))
+        self.measure("read_case_file", lambda: [case_manager.read_case_file(name) for name in sample], samples=len(sample))
+        
+        # 舊版文字格式的逐行解析
+        text_sample = [name for name in sample if name.endswith(".txt")]
+        if text_sample:
+            contents = [case_manager.read_case_file(name) for name in text_sample]
+            self.measure("parse_case_record_full",
+                         lambda: [case_manager.parse_case_record_full(content) for content in contents],
+                         samples=len(contents))
+        
+        self.measure("get_case_stats.all", case_manager.get_case_stats)
+        self.measure("get_case_stats.30d", lambda: case_manager.get_case_stats(self.month_from, self.date_to))
+        
+        if first_page['total'] != len(files):
+            raise RuntimeError(f"案件數量不一致: {first_page['total']} != {len(files)}")
+    
+    def run_log_paths(self):
+        """日誌的讀取路徑"""
+        from logger import logger_manager
+        
+        log_files = self.measure("get_log_files", logger_manager.get_log_files)
+        # 今天的日誌由量測程序本身寫入，只量測產生的歷史日誌
+        history = [log_file for log_file in log_files if log_file['date'] < datetime.date.today().strftime("%Y%m%d")]
+        if not history:
+            return
+        
+        oldest = min(log_file['date'] for log_file in history)
+        date_from = datetime.datetime.strptime(oldest, "%Y%m%d").strftime("%Y-%m-%d")
+        latest = f"flask_app_{max(log_file['date'] for log_file in history)}.log"
+        
+        self.measure("read_log_file.tail100", lambda: logger_manager.read_log_file(latest, lines=100))
+        lines = self.measure("read_log_file.full", lambda: logger_manager.read_log_file(latest))
+        self.measure("iter_log_file.1d", lambda: sum(1 for _ in logger_manager.iter_log_file(latest)))
+        self.measure("parse_log_line", lambda: [logger_manager.parse_log_line(line) for line in lines], samples=len(lines))
+        
+        # 第一次查詢由文字日誌回填索引，之後由索引回答
+        self.measure("query_logs.backfill_all", lambda: logger_manager.query_logs(date_from, self.date_to, limit=500), repeat=1)
+        self.measure("query_logs.1d", lambda: logger_manager.query_logs(self.date_to, self.date_to, limit=500))
+        self.measure("query_logs.7d", lambda: logger_manager.query_logs(self.week_from, self.date_to, limit=500))
+        self.measure("query_logs.all", lambda: logger_manager.query_logs(date_from, self.date_to, limit=500))
+        self.measure("query_logs.all_errors", lambda: logger_manager.query_logs(date_from, self.date_to, log_type='ERROR'))
+        
+        self.log_range = (date_from, self.date_to)
+    
+    def run_exports(self):
+        """匯出路由（以測試用戶端逐段讀取串流，不在記憶體保留完整內容）"""
+        from flask import Flask
+        from api_routes import APIRoutes
+        
+        app = Flask("bench")
+        APIRoutes(app)
+        client = app.test_client()
+        
+        def export(path, payload):
+            response = client.post(path, json=payload, buffered=False)
+            size = sum(len(chunk) for chunk in response.iter_encoded())
+            response.close()
+            if response.status_code != 200 or not size:
+                raise RuntimeError(f"匯出失敗: {path} {payload} ({response.status_code})")
+            return size
+        
+        self.measure("export_records.all", lambda: export("/system/records/export", {}), repeat=1)
+        self.measure("export_records.30d", lambda: export("/system/records/export", {
+            'date_from': self.month_from, 'date_to': self.date_to
+        }))
+        self.measure("export_records.all_gzip", lambda: export("/system/records/export", {'compression': 'gzip'}),
+                     repeat=1)
+        
+        log_range = self.log_range
+        if log_range:
+            self.measure("export_logs.1d", lambda: export("/system/logs/export", {
+                'date_from': log_range[1], 'date_to': log_range[1]
+            }))
+            self.measure("export_logs.all", lambda: export("/system/logs/export", {
+                'date_from': log_range[0], 'date_to': log_range[1]
+            }), repeat=1)
+
+def dataset_dir(args, cases):
+    """資料集目錄（相同參數的資料集重複使用）"""
+    name = f"cases{cases}_{args.format}_span{args.span_days}_logs{args.log_days}x{args.log_lines}"
+    if args.gzip_logs:
+        name += "_gz"
+    return os.path.join(args.work_dir, name)
+
+def prepare_dataset(args, cases):
+    """產生資料集（已存在時略過）"""
+    directory = dataset_dir(args, cases)
+    if os.path.exists(os.path.join(directory, COMPLETE_MARKER)):
+        print(f"使用既有資料集 {directory}", flush=True)
+        return directory
+    
+    command = [sys.executable, os.path.join(BENCH_DIR, "generate_archive.py"), "--dir", directory,
+               "--cases", str(cases), "--span-days", str(args.span_days), "--format", args.format,
+               "--log-days", str(args.log_days), "--log-lines", str(args.log_lines), "--seed", str(args.seed)]
+    if args.gzip_logs:
+        command.append("--gzip-logs")
+    
+    started = time.perf_counter()
+    subprocess.run(command, check=True)
+    open(os.path.join(directory, COMPLETE_MARKER), 'w').close()
+    print(f"資料集產生完成（{time.perf_counter() - started:.1f} 秒）", flush=True)
+    return directory
+
+def run_dataset(directory, repeat):
+    """以獨立程序量測資料集（模組使用目前目錄與全域實例，每個規模需要全新的程序）"""
+    env = dict(os.environ)
+    env.update(BENCH_ENV)
+    env['PYTHONPATH'] = REPO_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    
+    result_path = os.path.join(directory, "bench_result.json")
+    subprocess.run([sys.executable, os.path.abspath(__file__), "--run-dir", directory, "--repeat", str(repeat),
+                    "--result", result_path], cwd=directory, env=env, check=True)
+    with open(result_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def print_report(report):
+    """輸出各規模的耗時表格（最後一欄為最大與最小規模的耗時比）"""
+    sizes = list(report['sizes'])
+    names = []
+    for size in sizes:
+        for name in report['sizes'][size]['results']:
+            if name not in names:
+                names.append(name)
+    
+    print("\n== 讀取路徑耗時（毫秒，中位數）==")
+    print(f"{'名稱':<32}" + "".join(f"{size + ' 筆':>14}" for size in sizes) + f"{'成長':>10}")
+    for name in names:
+        values = [report['sizes'][size]['results'].get(name, {}).get('median_ms') for size in sizes]
+        row = "".join(f"{value:>14}" if value is not None else f"{'-':>14}" for value in values)
+        samples = {report['sizes'][size]['results'].get(name, {}).get('samples') for size in sizes}
+        growth = ""
+        # 各規模的樣本數不同時耗時比沒有意義
+        if len(sizes) > 1 and len(samples) == 1 and values[0] and values[-1] is not None:
+            growth = f"{values[-1] / values[0]:.1f}x"
+        print(f"{name:<32}{row}{growth:>10}")
+    print(f"{'peak_rss_mb':<32}" + "".join(f"{report['sizes'][size]['peak_rss_mb']:>14}" for size in sizes))
+
+def compare_baseline(report, baseline, threshold, min_delta_ms):
+    """與基準值比較，返回效能退化項目"""
+    regressions = []
+    for size, base_size in baseline.get('sizes', {}).items():
+        current = report['sizes'].get(size)
+        if not current:
+            continue
+        for name, base_stats in base_size['results'].items():
+            stats = current['results'].get(name)
+            # 樣本數不同的結果無法直接比較
+            if not stats or stats.get('samples') != base_stats.get('samples'):
+                continue
+            # 以最小值比較，較不受其他程序干擾
+            before, after = base_stats['min_ms'], stats['min_ms']
+            if is_regression(before, after, threshold, min_delta_ms):
+                regressions.append(f"{size} 筆 {name} {before} -> {after} 毫秒")
+    return regressions
+
+def main():
+    """產生資料集並執行儲存效能測試"""
+    parser = argparse.ArgumentParser(description="案件紀錄與日誌讀取路徑的規模測試")
+    parser.add_argument("--cases", default="10000,100000", help="案件數量（以逗號分隔多個規模）")
+    parser.add_argument("--span-days", type=int, default=365, help="案件分布的天數")
+    parser.add_argument("--format", choices=("text", "json", "mixed"), default="text", help="案件紀錄格式")
+    parser.add_argument("--log-days", type=int, default=30, help="日誌天數")
+    parser.add_argument("--log-lines", type=int, default=20000, help="每天的日誌行數")
+    parser.add_argument("--gzip-logs", action="store_true", help="日誌以 .gz 壓縮")
+    parser.add_argument("--seed", type=int, default=1, help="亂數種子")
+    parser.add_argument("--repeat", type=int, default=3, help="每項量測的重複次數")
+    parser.add_argument("--work-dir", default=os.path.join(os.path.expanduser("~"), ".cache", "ems-bench"),
+                        help="資料集目錄（相同參數的資料集會重複使用）")
+    add_report_arguments(parser)
+    # 內部使用：在資料集目錄中執行量測
+    parser.add_argument("--run-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.run_dir:
+        os.chdir(args.run_dir)
+        sys.path.insert(0, REPO_DIR)
+        result = StorageBenchmark(args.repeat).run()
+        with open(args.result, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+        # 不等待背景寫入執行緒與 atexit 收尾
+        os._exit(0)
+    
+    sizes = [int(size) for size in args.cases.split(",") if size.strip()]
+    report = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'settings': {key: value for key, value in vars(args).items()
+                     if key not in REPORT_ARGUMENTS + ('work_dir', 'run_dir', 'result')},
+        'sizes': {}
+    }
+    for cases in sizes:
+        directory = prepare_dataset(args, cases)
+        print(f"量測 {cases} 筆案件…", flush=True)
+        report['sizes'][str(cases)] = run_dataset(directory, args.repeat)
+    
+    print_report(report)
+    finish_report(report, args, lambda report, baseline: compare_baseline(
+        report, baseline, args.threshold, args.min_delta_ms
+    ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+合成資料產生工具
+在指定目錄產生 N 筆案件紀錄（record/，內容與正式案件相同格式）與 M 天的日誌（logs/），供儲存效能測試使用
+
+使用方式:
+    python benchmarks/generate_archive.py --dir /tmp/ems-data --cases 100000 --log-days 30
+    python benchmarks/generate_archive.py --dir /tmp/ems-data --cases 1000000 --format json --gzip-logs
+"""
+
+import os
+import sys
+import gzip
+import json
+import random
+import argparse
+import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 與主網站相同的案件分類與地點
+EVENT_TYPES = (("OHCA", 1), ("內科", 2), ("外科", 3))
+EVENT_WEIGHTS = (1, 5, 4)
+LOCATIONS = ("行政大樓", "行政二館", "丘逢甲紀念館", "圖書館", "科學與航太館", "商學大樓", "忠勤樓", "建築館",
+             "語文大樓", "工學大樓", "人言大樓", "資訊電機館", "人文社會館", "電子通訊館", "育樂館", "土木水利館",
+             "理學大樓", "學思樓", "操場", "學生宿舍")
+CONTENTS = ("", "同學昏倒，意識不清", "腳踝扭傷無法行走", "呼吸困難，已通知119", "騎車跌倒，手臂擦傷流血",
+            "胸悶頭暈", "實驗室化學品噴濺", "籃球場撞傷頭部", "疑似食物中毒，腹痛嘔吐")
+USER_AGENTS = (
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+    "Line/14.9.0"
+)
+WIZARD_PATHS = ("/", "/Inform/Read_02_Event", "/Inform/Read_03_Location", "/Inform/Read_05_Room",
+                "/Inform/Read_06_Content", "/Inform/Read_07_Check", "/Inform/Read_08_Sending",
+                "/Inform/Read_09_Sending", "/Inform/Read_10_Sended")
+USER_ACTIONS = (
+    ("選擇案件分類", "分類: 內科(2)"),
+    ("選擇案件地點", "地點: 圖書館(4)"),
+    ("輸入房號位置", "房號: 3 樓"),
+    ("輸入案件內容", "內容長度: 12"),
+    ("確認案件資訊", None),
+    ("開始發送案件", None),
+    ("LINE發送成功", "Job=20240115_153000_43b8a37c | Attempts=1"),
+    ("Discord發送成功", "Job=20240115_153000_43b8a37c | Attempts=1")
+)
+
+def random_ip(rng):
+    return f"{rng.choice((1, 27, 36, 49, 59, 101, 111, 114, 140, 163, 220))}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+
+def random_case_data(rng, case_time):
+    """產生一筆案件資料（欄位與 show_09_sending 相同）"""
+    event_type, _ = rng.choices(EVENT_TYPES, EVENT_WEIGHTS)[0]
+    location = rng.choice(LOCATIONS)
+    room = f"{rng.randint(1, 9)} 樓" if rng.random() < 0.7 else f"{rng.randint(1, 9)}{rng.randint(0, 2)}{rng.randint(1, 9)}"
+    content = rng.choice(CONTENTS)
+    message = (
+        "緊急事件通報\n"
+        f"案件分類： {event_type}\n"
+        f"案件地點： {location}\n"
+        f"案件位置： {room}\n"
+        f"案件補充：\n\t{content}\n"
+        f"通報時間： {case_time.strftime('%Y年%m月%d日 %H時%M分%S秒')}"
+    )
+    return {
+        'event_type': event_type,
+        'location': location,
+        'room': room,
+        'content': content,
+        'message': message,
+        'discord_success': rng.random() < 0.99,
+        'line_success': rng.random() < 0.98,
+        'discord_message_id': str(rng.getrandbits(60)),
+        'ip': random_ip(rng),
+        'country': "TW",
+        'city': "Taichung",
+        'user_agent': rng.choice(USER_AGENTS)
+    }
+
+def case_times(rng, count, first_day, last_day, unique_seconds):
+    """在日期範圍內產生排序後的案件時間（unique_seconds 時每秒最多一筆）與同一秒內的流水號"""
+    start = datetime.datetime.combine(first_day, datetime.time())
+    span = int((datetime.datetime.combine(last_day, datetime.time()) - start).total_seconds()) + 86400
+    if unique_seconds:
+        if count > span:
+            raise ValueError(f"舊版案件編號每秒只能有一筆，{count} 筆超過分布範圍的 {span} 秒")
+        seconds = sorted(rng.sample(range(span), count))
+    else:
+        seconds = sorted(rng.randrange(span) for _ in range(count))
+    
+    previous = None
+    sequence = 0
+    for offset in seconds:
+        sequence = sequence + 1 if offset == previous else 0
+        previous = offset
+        yield start + datetime.timedelta(seconds=offset), sequence
+
+def generate_cases(case_manager, count, first_day, last_day, record_format, rng):
+    """產生案件紀錄檔案（text 為舊版文字格式與舊版編號，json 為結構化格式，mixed 為較舊的一半文字、較新的一半 JSON）"""
+    record_dir = case_manager.record_dir
+    # 舊版文字紀錄的編號為 YYYYMMDD_HHMMSS（每秒一筆），結構化紀錄才有同一秒內的流水號
+    legacy_count = {"text": count, "json": 0, "mixed": count // 2}[record_format]
+    times = case_times(rng, count, first_day, last_day, unique_seconds=legacy_count > 0)
+    for number, (case_time, sequence) in enumerate(times, 1):
+        case_data = random_case_data(rng, case_time)
+        use_json = number > legacy_count
+        if use_json:
+            case_id = f"{case_time.strftime('%Y%m%d_%H%M%S')}_{sequence:03d}"
+        else:
+            case_id = case_time.strftime('%Y%m%d_%H%M%S')
+        filename = f"case_{case_id}.json" if use_json else f"case_{case_id}.txt"
+        file_path = os.path.join(record_dir, filename)
+        
+        if use_json:
+            record = case_manager._build_case_record(case_data, case_id, case_time, file_path)
+            data = json.dumps(record, ensure_ascii=False)
+        else:
+            case_data['server_time'] = case_time.strftime('%Y-%m-%d %H:%M:%S')
+            case_data['file_path'] = file_path
+            data = case_manager._format_case_content(case_data, case_id)
+        
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        mtime = case_time.timestamp()
+        os.utime(file_path, (mtime, mtime))
+        
+        if number % 50000 == 0:
+            print(f"  已產生 {number}/{count} 筆案件紀錄", flush=True)
+
+def log_line(rng, timestamp):
+    """產生一行日誌（格式與 LoggerManager 寫出的內容相同）"""
+    ip = random_ip(rng)
+    geo = f"IP: {ip} | Country: TW | City: Taichung"
+    roll = rng.random()
+    if roll < 0.45:
+        path = rng.choice(WIZARD_PATHS)
+        method = "POST" if path not in ("/", "/Inform/Read_09_Sending", "/Inform/Read_10_Sended") and rng.random() < 0.5 else "GET"
+        status = 302 if method == "POST" else rng.choices((200, 302, 404), (95, 4, 1))[0]
+        ray = f"{rng.getrandbits(64):016x}-TPE"
+        message = (f"Request: {method} {path} | Status: {status} | Response Time: {rng.uniform(0.5, 40):.1f}ms | "
+                   f"{geo} | CF-Ray: {ray} | CF-Visitor: {{\"scheme\":\"https\"}}")
+        return f"{timestamp} [INFO] {message}\n"
+    if roll < 0.90:
+        return f"{timestamp} [INFO] User Action: 頁面訪問 | Details: 路徑: {rng.choice(WIZARD_PATHS)} | {geo}\n"
+    if roll < 0.98:
+        action, details = rng.choice(USER_ACTIONS)
+        details = f" | Details: {details}" if details else ""
+        return f"{timestamp} [INFO] User Action: {action}{details} | {geo}\n"
+    if roll < 0.995:
+        return (f"{timestamp} [WARNING] Outbox delivery failed, retrying in 2s: 20240115_153000_43b8a37c/line | "
+                f"Error: LINE API錯誤: 500 - {{\"message\":\"Internal Server Error\"}}\n")
+    return f"{timestamp} [ERROR] Error: 404 Not Found: The requested URL was not found on the server. | {geo}\n"
+
+def generate_logs(days, lines_per_day, gzip_logs, rng):
+    """產生每日日誌檔案（logs/flask_app_YYYYMMDD.log，可選擇壓縮為 .gz）"""
+    for day in days:
+        start = datetime.datetime.combine(day, datetime.time())
+        seconds = sorted(rng.randrange(86400) for _ in range(lines_per_day))
+        filename = os.path.join("logs", f"flask_app_{day.strftime('%Y%m%d')}.log")
+        opener = (lambda path: gzip.open(path + ".gz", 'wt', encoding='utf-8', compresslevel=6)) if gzip_logs \
+            else (lambda path: open(path, 'w', encoding='utf-8'))
+        
+        with opener(filename) as f:
+            batch = []
+            for offset in seconds:
+                timestamp = (start + datetime.timedelta(seconds=offset)).strftime("%Y-%m-%d %H:%M:%S")
+                batch.append(log_line(rng, timestamp))
+                if len(batch) >= 10000:
+                    f.write("".join(batch))
+                    batch = []
+            f.write("".join(batch))
+
+def generate(directory, cases, log_days, lines_per_day=20000, span_days=365, record_format="text",
+             gzip_logs=False, seed=1):
+    """在目錄中產生案件紀錄與日誌（資料結束於昨天，避免與當日寫入的日誌重疊）"""
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    # 案件管理模組以目前目錄的 record/ 與 data/ 為資料位置，切換目錄後才匯入
+    sys.path.insert(0, REPO_DIR)
+    from case_manager import case_manager
+    
+    rng = random.Random(seed)
+    last_day = datetime.date.today() - datetime.timedelta(days=1)
+    
+    if cases:
+        first_day = last_day - datetime.timedelta(days=max(span_days, 1) - 1)
+        print(f"產生 {cases} 筆案件紀錄（{first_day} ~ {last_day}，格式 {record_format}）", flush=True)
+        generate_cases(case_manager, cases, first_day, last_day, record_format, rng)
+    
+    if log_days:
+        days = [last_day - datetime.timedelta(days=offset) for offset in range(log_days)]
+        print(f"產生 {log_days} 天日誌（每天 {lines_per_day} 行）", flush=True)
+        os.makedirs("logs", exist_ok=True)
+        generate_logs(days, lines_per_day, gzip_logs, rng)
+
+def main():
+    """產生合成資料"""
+    parser = argparse.ArgumentParser(description="產生效能測試用的案件紀錄與日誌")
+    parser.add_argument("--dir", required=True, help="輸出目錄（產生 record/、logs/ 與 data/）")
+    parser.add_argument("--cases", type=int, default=10000, help="案件紀錄數量")
+    parser.add_argument("--span-days", type=int, default=365, help="案件分布的天數")
+    parser.add_argument("--format", choices=("text", "json", "mixed"), default="text",
+                        help="案件紀錄格式（text 為舊版文字格式，mixed 為較舊的一半文字、較新的一半 JSON）")
+    parser.add_argument("--log-days", type=int, default=30, help="日誌天數")
+    parser.add_argument("--log-lines", type=int, default=20000, help="每天的日誌行數")
+    parser.add_argument("--gzip-logs", action="store_true", help="日誌以 .gz 壓縮（與輪替後的舊日誌相同）")
+    parser.add_argument("--seed", type=int, default=1, help="亂數種子")
+    args = parser.parse_args()
+    
+    generate(os.path.abspath(args.dir), args.cases, args.log_days, args.log_lines, args.span_days,
+             args.format, args.gzip_logs, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+"""
+負載測試工具
+在暫存目錄以 gunicorn 啟動主網站與管理網站（外部服務使用本機替身），同時執行完整填報流程與 /api/* 查詢，
+輸出各步驟延遲百分位數、吞吐量與通報到送達時間，並可儲存基準值比較效能退化
+
+使用方式:
+    python benchmarks/load_test.py                               # 預設 30 秒、8 個填報使用者
+    python benchmarks/load_test.py --duration 60 --users 16 --workers 4
+    python benchmarks/load_test.py --line-latency 0.3 --line-error-rate 0.05
+    python benchmarks/load_test.py --save-baseline default       # 儲存為基準值
+    python benchmarks/load_test.py --compare default             # 與基準值比較，退化時結束碼為 1
+"""
+
+import os
+import sys
+import time
+import uuid
+import shutil
+import random
+import socket
+import argparse
+import tempfile
+import datetime
+import threading
+import subprocess
+import requests
+from mock_services import MockServices, MockChannel
+from bench_common import REPORT_ARGUMENTS, percentiles, is_regression, add_report_arguments, finish_report
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 填報流程（與瀏覽器相同：每次表單送出後再載入重新導向的頁面）
+WIZARD_STEPS = (
+    ("GET", "/Inform/Read_02_Event"),
+    ("POST", "/Inform/Read_02_Event"),
+    ("GET", "/Inform/Read_03_Location"),
+    ("POST", "/Inform/Read_03_Location"),
+    ("GET", "/Inform/Read_05_Room"),
+    ("POST", "/Inform/Read_05_Room"),
+    ("GET", "/Inform/Read_06_Content"),
+    ("POST", "/Inform/Read_06_Content"),
+    ("GET", "/Inform/Read_07_Check"),
+    ("POST", "/Inform/Read_07_Check"),
+    ("GET", "/Inform/Read_08_Sending"),
+    ("POST", "/Inform/Read_08_Sending"),
+    ("GET", "/Inform/Read_09_Sending"),
+    ("GET", "/Inform/Read_10_Sended")
+)
+
+# 查詢使用者輪流呼叫的唯讀端點（網站, 路徑）
+READ_ENDPOINTS = (
+    ("main", "/api/stats"),
+    ("main", "/api/cases?limit=20"),
+    ("main", "/api/records?limit=20"),
+    ("main", "/api/logs?limit=50"),
+    ("admin", "/api/records?limit=50"),
+    ("admin", "/api/stats")
+)
+
+def free_port():
+    """取得可用的本機連接埠"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class Recorder:
+    """收集各執行緒的延遲與錯誤（每個執行緒使用獨立列表，結束後合併）"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = []
+    
+    def new_bucket(self):
+        bucket = {'latency': {}, 'errors': {}}
+        with self._lock:
+            self._buckets.append(bucket)
+        return bucket
+    
+    def merged(self):
+        latency = {}
+        errors = {}
+        for bucket in self._buckets:
+            for name, values in bucket['latency'].items():
+                latency.setdefault(name, []).extend(values)
+            for name, count in bucket['errors'].items():
+                errors[name] = errors.get(name, 0) + count
+        return latency, errors
+
+class LoadTest:
+    """負載測試（啟動網站、執行負載、收集結果）"""
+    
+    def __init__(self, args):
+        self.args = args
+        self.work_dir = None
+        self.processes = []
+        self.urls = {}
+        self.services = None
+        self.recorder = Recorder()
+        # 識別碼 -> 開始填報的時間
+        self.submitted = {}
+        self.completed_flows = 0
+        self._flows_lock = threading.Lock()
+        self.run_id = uuid.uuid4().hex[:8]
+    
+    def start_services(self):
+        """啟動外部服務替身"""
+        args = self.args
+        self.services = MockServices(
+            line=MockChannel(args.line_latency, args.jitter, args.line_error_rate),
+            discord=MockChannel(args.discord_latency, args.jitter, args.discord_error_rate)
+        ).start()
+    
+    def start_sites(self):
+        """在暫存目錄以 gunicorn 啟動主網站與管理網站（不影響正式資料）"""
+        self.work_dir = tempfile.mkdtemp(prefix="ems-bench-")
+        os.makedirs(os.path.join(self.work_dir, "data"))
+        
+        env = dict(os.environ)
+        env.update({
+            'PYTHONPATH': REPO_DIR + os.pathsep + env.get('PYTHONPATH', ''),
+            'SECRET_KEY': 'benchmark',
+            'LINE_BOT_API_TOKEN': 'benchmark',
+            'LINE_WEBHOOK_HANDLER': 'benchmark',
+            'LINE_GROUP_ID': 'benchmark',
+            'LINE_API_BASE_URL': self.services.line_api_base_url,
+            'DISCORD_WEBHOOK_URL': self.services.discord_webhook_url,
+            'WEB_WORKERS': str(self.args.workers),
+            'HTTP_KEEPALIVE_INTERVAL': '0',
+            # 注入錯誤時縮短重試間隔，讓重試結果在收尾時間內完成
+            'OUTBOX_RETRY_BASE': str(self.args.retry_base)
+        })
+        
+        for site, module in (("main", "app:app"), ("admin", "admin_app:app")):
+            port = free_port()
+            log = open(os.path.join(self.work_dir, f"gunicorn_{site}.log"), "w")
+            process = subprocess.Popen(
+                [sys.executable, "-m", "gunicorn",
+                 "--config", os.path.join(REPO_DIR, "gunicorn.conf.py"),
+                 "--bind", f"127.0.0.1:{port}", module],
+                cwd=self.work_dir, env=env, stdout=log, stderr=subprocess.STDOUT
+            )
+            self.processes.append((process, log))
+            self.urls[site] = f"http://127.0.0.1:{port}"
+        
+        for site, url in self.urls.items():
+            self._wait_ready(site, url)
+    
+    def _wait_ready(self, site, url, timeout=60):
+        """等待網站可以回應"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            for process, _ in self.processes:
+                if process.poll() is not None:
+                    raise RuntimeError(f"網站啟動失敗，請查看 {self.work_dir}/gunicorn_{site}.log")
+            try:
+                if requests.get(f"{url}/api/stats", timeout=2).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"等待 {site} 網站啟動逾時")
+    
+    def stop(self):
+        """停止網站與外部服務替身，清除暫存目錄"""
+        for process, log in self.processes:
+            process.terminate()
+        for process, log in self.processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            log.close()
+        if self.services:
+            self.services.stop()
+        if self.work_dir and not self.args.keep:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+    
+    def _request(self, bucket, name, http, method, url, data=None):
+        """送出單一請求並記錄延遲，返回是否成功"""
+        start = time.perf_counter()
+        try:
+            response = http.request(method, url, data=data, allow_redirects=False, timeout=30)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        bucket['latency'].setdefault(name, []).append(time.perf_counter() - start)
+        if not ok:
+            bucket['errors'][name] = bucket['errors'].get(name, 0) + 1
+        return ok
+    
+    def _wizard_user(self, index, deadline):
+        """填報使用者：重複執行完整填報流程"""
+        bucket = self.recorder.new_bucket()
+        base = self.urls['main']
+        sequence = 0
+        
+        while time.time() < deadline:
+            sequence += 1
+            token = f"bench-{self.run_id}{index:02x}-{sequence}"
+            forms = {
+                "/Inform/Read_02_Event": {'event': random.randint(1, 3)},
+                "/Inform/Read_03_Location": {'selectedButtonInput': random.randint(1, 18), 'customLocation': ''},
+                "/Inform/Read_05_Room": {'room': str(random.randint(1, 9))},
+                "/Inform/Read_06_Content": {'content': token}
+            }
+            
+            # 每次填報使用新的 Session（與新的通報者相同）
+            with requests.Session() as http:
+                started = time.time()
+                ok = True
+                for method, path in WIZARD_STEPS:
+                    data = forms.get(path) if method == "POST" else None
+                    if not self._request(bucket, f"{method} {path}", http, method, base + path, data):
+                        ok = False
+                        break
+            
+            if ok:
+                with self._flows_lock:
+                    self.submitted[token] = started
+                    self.completed_flows += 1
+    
+    def _reader(self, index, deadline):
+        """查詢使用者：輪流呼叫唯讀 API"""
+        bucket = self.recorder.new_bucket()
+        endpoints = READ_ENDPOINTS[index % len(READ_ENDPOINTS):] + READ_ENDPOINTS[:index % len(READ_ENDPOINTS)]
+        with requests.Session() as http:
+            while time.time() < deadline:
+                for site, path in endpoints:
+                    if time.time() >= deadline:
+                        break
+                    self._request(bucket, f"{site} GET {path}", http, "GET", self.urls[site] + path)
+    
+    def run_load(self):
+        """執行負載並等待廣播送達，返回實際負載時間"""
+        args = self.args
+        started = time.time()
+        deadline = started + args.duration
+        threads = [threading.Thread(target=self._wizard_user, args=(i, deadline)) for i in range(args.users)]
+        threads += [threading.Thread(target=self._reader, args=(i, deadline)) for i in range(args.readers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+        
+        # 等待寄件匣送出所有已完成的通報
+        drain_deadline = time.time() + args.drain_timeout
+        while time.time() < drain_deadline:
+            if all(len(channel.delivered) >= len(self.submitted)
+                   for channel in (self.services.line, self.services.discord)):
+                break
+            time.sleep(0.2)
+        
+        return elapsed
+    
+    def build_report(self, elapsed):
+        """整理測試結果"""
+        latency, errors = self.recorder.merged()
+        total_requests = sum(len(values) for values in latency.values())
+        
+        steps = {}
+        for method, path in WIZARD_STEPS:
+            name = f"{method} {path}"
+            steps[name] = dict(percentiles(latency.get(name, [])), errors=errors.get(name, 0))
+        
+        reads = {}
+        for site, path in READ_ENDPOINTS:
+            name = f"{site} GET {path}"
+            reads[name] = dict(percentiles(latency.get(name, [])), errors=errors.get(name, 0))
+        
+        alerts = {}
+        for channel_name in ('line', 'discord'):
+            channel = getattr(self.services, channel_name)
+            delays = [channel.delivered[token] - started
+                      for token, started in self.submitted.items() if token in channel.delivered]
+            alerts[channel_name] = dict(
+                percentiles(delays),
+                undelivered=len(self.submitted) - len(delays),
+                **channel.get_stats()
+            )
+        
+        return {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'settings': {key: value for key, value in vars(self.args).items()
+                         if key not in REPORT_ARGUMENTS + ('keep',)},
+            'throughput': {
+                'duration': round(elapsed, 1),
+                'reports': self.completed_flows,
+                'reports_per_second': round(self.completed_flows / elapsed, 2),
+                'requests': total_requests,
+                'requests_per_second': round(total_requests / elapsed, 1),
+                'errors': sum(errors.values())
+            },
+            'wizard_steps': steps,
+            'read_endpoints': reads,
+            'time_to_alert': alerts
+        }
+
+def print_report(report):
+    """輸出結果表格"""
+    throughput = report['throughput']
+    print(f"\n== 吞吐量 ({throughput['duration']} 秒) ==")
+    print(f"完成通報 {throughput['reports']} 件（{throughput['reports_per_second']} 件/秒），"
+          f"請求 {throughput['requests']} 次（{throughput['requests_per_second']} 次/秒），錯誤 {throughput['errors']} 次")
+    
+    for title, section in (("填報步驟", report['wizard_steps']), ("查詢端點", report['read_endpoints']),
+                           ("通報到送達", report['time_to_alert'])):
+        print(f"\n== {title}（毫秒）==")
+        print(f"{'名稱':<44}{'次數':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for name, stats in section.items():
+            if not stats['count']:
+                print(f"{name:<44}{0:>8}")
+                continue
+            print(f"{name:<44}{stats['count']:>8}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}{stats['max']:>10}")
+
+def compare_baseline(report, baseline, threshold, min_delta_ms):
+    """與基準值比較，返回效能退化項目"""
+    regressions = []
+    
+    base_rate = baseline['throughput']['reports_per_second']
+    rate = report['throughput']['reports_per_second']
+    if base_rate and rate < base_rate * (1 - threshold):
+        regressions.append(f"通報吞吐量 {base_rate} -> {rate} 件/秒")
+    
+    for section in ('wizard_steps', 'read_endpoints', 'time_to_alert'):
+        for name, base_stats in baseline.get(section, {}).items():
+            stats = report[section].get(name)
+            if not stats or not stats['count'] or not base_stats.get('count'):
+                continue
+            for key in ('p95', 'p99'):
+                before, after = base_stats[key], stats[key]
+                if is_regression(before, after, threshold, min_delta_ms):
+                    regressions.append(f"{name} {key} {before} -> {after} 毫秒")
+    
+    return regressions
+
+def main():
+    """執行負載測試"""
+    parser = argparse.ArgumentParser(description="緊急通報系統負載測試")
+    parser.add_argument("--duration", type=float, default=30, help="負載時間（秒）")
+    parser.add_argument("--users", type=int, default=8, help="同時填報的使用者數")
+    parser.add_argument("--readers", type=int, default=2, help="同時查詢 API 的使用者數")
+    parser.add_argument("--workers", type=int, default=2, help="每個網站的 gunicorn 工作程序數")
+    parser.add_argument("--line-latency", type=float, default=0.1, help="LINE 替身回應延遲（秒）")
+    parser.add_argument("--discord-latency", type=float, default=0.1, help="Discord 替身回應延遲（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延遲隨機變動比例")
+    parser.add_argument("--line-error-rate", type=float, default=0.0, help="LINE 替身錯誤率（0~1）")
+    parser.add_argument("--discord-error-rate", type=float, default=0.0, help="Discord 替身錯誤率（0~1）")
+    parser.add_argument("--retry-base", type=float, default=0.5, help="寄件匣重試間隔（秒）")
+    parser.add_argument("--drain-timeout", type=float, default=30, help="負載結束後等待廣播送達的時間（秒）")
+    add_report_arguments(parser)
+    parser.add_argument("--keep", action="store_true", help="保留暫存目錄（網站日誌與資料）")
+    args = parser.parse_args()
+    
+    test = LoadTest(args)
+    try:
+        test.start_services()
+        test.start_sites()
+        print(f"主網站 {test.urls['main']}，管理網站 {test.urls['admin']}，工作目錄 {test.work_dir}")
+        print(f"執行 {args.duration} 秒：{args.users} 個填報使用者、{args.readers} 個查詢使用者")
+        elapsed = test.run_load()
+        report = test.build_report(elapsed)
+    finally:
+        test.stop()
+    
+    print_report(report)
+    finish_report(report, args, lambda report, baseline: compare_baseline(
+        report, baseline, args.threshold, args.min_delta_ms
+    ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+外部服務替身
+在本機模擬 LINE 推播 API 與 Discord Webhook（可設定延遲、抖動與錯誤率），供效能測試使用，
+不會發送任何真實訊息
+
+使用方式:
+    python benchmarks/mock_services.py --port 9000 --line-latency 0.2 --discord-error-rate 0.1
+    # 再以 LINE_API_BASE_URL=http://127.0.0.1:9000 與
+    # DISCORD_WEBHOOK_URL=http://127.0.0.1:9000/webhook 啟動網站
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 效能測試在案件內容中加入的識別碼（用於計算通報到送達的時間）
+TOKEN_PATTERN = re.compile(r"bench-[0-9a-f]+-\d+")
+
+class MockChannel:
+    """單一服務的模擬設定與接收紀錄"""
+    
+    def __init__(self, latency=0.1, jitter=0.2, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.received = 0
+        self.failed = 0
+        # 識別碼 -> 第一次成功送達的時間
+        self.delivered = {}
+        self._lock = threading.Lock()
+    
+    def handle(self, body):
+        """模擬處理時間與錯誤，返回是否成功"""
+        delay = self.latency * random.uniform(1 - self.jitter, 1 + self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        
+        failed = random.random() < self.error_rate
+        with self._lock:
+            self.received += 1
+            if failed:
+                self.failed += 1
+            else:
+                for token in TOKEN_PATTERN.findall(body):
+                    self.delivered.setdefault(token, time.time())
+        return not failed
+    
+    def get_stats(self):
+        """接收統計"""
+        with self._lock:
+            return {'received': self.received, 'failed': self.failed, 'delivered': len(self.delivered)}
+
+class MockServiceHandler(BaseHTTPRequestHandler):
+    """LINE 與 Discord API 的請求處理"""
+    
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format, *args):
+        """不輸出存取紀錄"""
+    
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def do_GET(self):
+        """連線預熱（/v2/bot/info 與 Webhook 資訊）"""
+        self._reply(200, {'id': 'mock'})
+    
+    def do_POST(self):
+        """LINE 推播與 Discord Webhook"""
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode('utf-8', errors='replace')
+        services = self.server.services
+        
+        if self.path.startswith("/v2/bot/message/"):
+            if services.line.handle(body):
+                self._reply(200, {})
+            else:
+                self._reply(500, {'message': 'mock LINE error'})
+        elif self.path.startswith("/webhook"):
+            if services.discord.handle(body):
+                self._reply(200, {'id': str(random.getrandbits(63))})
+            else:
+                self._reply(500, {'message': 'mock Discord error'})
+        else:
+            self._reply(404, {'message': 'not found'})
+
+class MockServices:
+    """LINE 推播 API 與 Discord Webhook 的本地替身伺服器"""
+    
+    def __init__(self, host="127.0.0.1", port=0, line=None, discord=None):
+        self.line = line or MockChannel()
+        self.discord = discord or MockChannel()
+        self.server = ThreadingHTTPServer((host, port), MockServiceHandler)
+        self.server.daemon_threads = True
+        self.server.services = self
+        self._thread = None
+    
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    @property
+    def line_api_base_url(self):
+        return self.base_url
+    
+    @property
+    def discord_webhook_url(self):
+        return f"{self.base_url}/webhook"
+    
+    def start(self):
+        """於背景執行緒啟動伺服器"""
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-services", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """停止伺服器"""
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def get_stats(self):
+        """各服務的接收統計"""
+        return {'line': self.line.get_stats(), 'discord': self.discord.get_stats()}
+
+def main():
+    """以獨立程序啟動外部服務替身"""
+    parser = argparse.ArgumentParser(description="LINE 與 Discord API 的本地替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--line-latency", type=float, default=0.1, help="LINE 回應延遲（秒）")
+    parser.add_argument("--discord-latency", type=float, default=0.1, help="Discord 回應延遲（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延遲隨機變動比例")
+    parser.add_argument("--line-error-rate", type=float, default=0.0, help="LINE 錯誤率（0~1）")
+    parser.add_argument("--discord-error-rate", type=float, default=0.0, help="Discord 錯誤率（0~1）")
+    args = parser.parse_args()
+    
+    services = MockServices(
+        args.host, args.port,
+        line=MockChannel(args.line_latency, args.jitter, args.line_error_rate),
+        discord=MockChannel(args.discord_latency, args.jitter, args.discord_error_rate)
+    )
+    print(f"LINE_API_BASE_URL={services.line_api_base_url}")
+    print(f"DISCORD_WEBHOOK_URL={services.discord_webhook_url}")
+    try:
+        services.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(services.get_stats(), ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+案件索引模組
+以 SQLite 維護案件中繼資料，提供依日期與分類的快速查詢
+"""
+
+import datetime
+import threading
+from sqlite_store import SQLiteStore
+
+class CaseIndex(SQLiteStore):
+    """案件索引（以案件編號排序的 SQLite 資料表）"""
+    
+    def __init__(self, db_path="data/case_index.db"):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._create_tables()
+    
+    def _configure(self, conn):
+        """新連線啟用遞迴觸發器"""
+        # 讓 INSERT OR REPLACE 取代舊資料時也觸發刪除觸發器，保持統計正確
+        conn.execute("PRAGMA recursive_triggers=ON")
+    
+    def _create_tables(self):
+        """建立索引資料表與每日統計"""
+        conn = self._connect()
+        with conn:
+            # 多個工作程序同時啟動時依序建立，避免重複新增欄位或重複回填統計
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cases (
+                    case_id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    case_time TEXT NOT NULL,
+                    case_date TEXT NOT NULL,
+                    event_type TEXT,
+                    location TEXT,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL
+                )
+            """)
+            # 冷儲存：已封存案件記錄所在的封存檔名稱（散檔時為 NULL）
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(cases)")}
+            if 'archive' not in columns:
+                conn.execute("ALTER TABLE cases ADD COLUMN archive TEXT")
+            
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cases_type ON cases (event_type, case_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cases_location ON cases (location, case_id)")
+            
+            stats_exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_stats'"
+            ).fetchone()
+            
+            # 每日統計桶：每筆案件計入 total / type / location / hour 四個維度
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS daily_stats (
+                    day TEXT NOT NULL,
+                    dimension TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (day, dimension, key)
+                )
+            """)
+            for trigger, row, delta in (("trg_cases_stats_insert", "NEW", 1),
+                                        ("trg_cases_stats_delete", "OLD", -1)):
+                event = "INSERT" if row == "NEW" else "DELETE"
+                statements = "".join(
+                    f"""
+                    INSERT INTO daily_stats (day, dimension, key, count)
+                    VALUES ({row}.case_date, '{dimension}', {key}, {delta})
+                    ON CONFLICT (day, dimension, key) DO UPDATE SET count = count + ({delta});"""
+                    for dimension, key in self._stats_dimensions(row)
+                )
+                conn.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON cases
+                    BEGIN {statements}
+                    END
+                """)
+            
+            # 既有索引首次建立統計表時，由案件資料回填
+            if not stats_exists:
+                for dimension, key in self._stats_dimensions("cases"):
+                    conn.execute(f"""
+                        INSERT INTO daily_stats (day, dimension, key, count)
+                        SELECT case_date, '{dimension}', {key}, COUNT(*) FROM cases
+                        GROUP BY case_date, {key}
+                    """)
+    
+    @staticmethod
+    def _stats_dimensions(row):
+        """統計維度與對應的 SQL 運算式"""
+        return (
+            ('total', "''"),
+            ('type', f"COALESCE({row}.event_type, 'Unknown')"),
+            ('location', f"COALESCE({row}.location, 'Unknown')"),
+            ('hour', f"substr({row}.case_time, 12, 2)")
+        )
+    
+    @staticmethod
+    def date_range_keys(date_from, date_to):
+        """將 YYYY-MM-DD 日期範圍轉換為案件編號的查詢區間 [start, end)"""
+        start_date = datetime.datetime.strptime(date_from, "%Y-%m-%d")
+        end_date = datetime.datetime.strptime(date_to, "%Y-%m-%d") + datetime.timedelta(days=1)
+        return start_date.strftime("%Y%m%d"), end_date.strftime("%Y%m%d")
+    
+    def upsert(self, entry):
+        """新增或更新單筆案件索引"""
+        conn = self._connect()
+        with conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO cases
+                    (case_id, filename, case_time, case_date, event_type, location, size, mtime)
+                VALUES (:case_id, :filename, :case_time, :case_date, :event_type, :location, :size, :mtime)
+            """, entry)
+    
+    def upsert_many(self, entries):
+        """批次新增或更新案件索引"""
+        conn = self._connect()
+        with conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO cases
+                    (case_id, filename, case_time, case_date, event_type, location, size, mtime)
+                VALUES (:case_id, :filename, :case_time, :case_date, :event_type, :location, :size, :mtime)
+            """, entries)
+    
+    def update_file_stat(self, case_id, size, mtime):
+        """更新案件檔案大小與修改時間"""
+        conn = self._connect()
+        with conn:
+            conn.execute("UPDATE cases SET size = ?, mtime = ? WHERE case_id = ?", (size, mtime, case_id))
+    
+    def remove(self, case_ids):
+        """移除案件索引"""
+        conn = self._connect()
+        with conn:
+            conn.executemany("DELETE FROM cases WHERE case_id = ?", [(case_id,) for case_id in case_ids])
+    
+    def get_filenames(self):
+        """獲取所有已索引的散檔名稱與案件編號（不含已封存的案件）"""
+        rows = self._connect().execute("SELECT case_id, filename FROM cases WHERE archive IS NULL").fetchall()
+        return {row['filename']: row['case_id'] for row in rows}
+    
+    def get_unarchived_before(self, date):
+        """獲取指定日期（YYYY-MM-DD）以前尚未封存的案件"""
+        return self._connect().execute(
+            "SELECT * FROM cases WHERE archive IS NULL AND case_date < ? ORDER BY case_id", (date,)
+        ).fetchall()
+    
+    def set_archive(self, case_ids, archive):
+        """標記案件已移入封存檔"""
+        conn = self._connect()
+        with conn:
+            conn.executemany("UPDATE cases SET archive = ? WHERE case_id = ?", [(archive, case_id) for case_id in case_ids])
+    
+    def get(self, case_id):
+        """獲取單筆案件索引"""
+        return self._connect().execute("SELECT * FROM cases WHERE case_id = ?", (case_id,)).fetchone()
+    
+    def _build_conditions(self, date_from=None, date_to=None, event_type=None, location=None, type_contains=False):
+        """組合查詢條件（type_contains 為 True 時分類以部分字串比對）"""
+        conditions = []
+        params = []
+        
+        if date_from and date_to:
+            start_key, end_key = self.date_range_keys(date_from, date_to)
+            conditions.append("case_id >= ? AND case_id < ?")
+            params.extend([start_key, end_key])
+        
+        if event_type:
+            conditions.append("instr(event_type, ?) > 0" if type_contains else "event_type = ?")
+            params.append(event_type)
+        
+        if location:
+            conditions.append("location = ?")
+            params.append(location)
+        
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, params
+    
+    def query(self, date_from=None, date_to=None, event_type=None, location=None, limit=None, offset=0,
+              before=None, type_contains=False):
+        """依日期範圍、分類與地點查詢案件（最新的在前，before 為鍵集分頁的起點）"""
+        where, params = self._build_conditions(date_from, date_to, event_type, location, type_contains)
+        if before:
+            # 鍵集分頁：只取比上一頁最後一筆更舊的案件，深層頁面與第一頁成本相同
+            where += " AND case_id < ?" if where else " WHERE case_id < ?"
+            params.append(before)
+        sql = f"SELECT * FROM cases{where} ORDER BY case_id DESC"
+        
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit, offset])
+        
+        return self._connect().execute(sql, params).fetchall()
+    
+    def count(self, date_from=None, date_to=None, event_type=None, location=None, type_contains=False):
+        """計算符合條件的案件數量"""
+        where, params = self._build_conditions(date_from, date_to, event_type, location, type_contains)
+        return self._connect().execute(f"SELECT COUNT(*) FROM cases{where}", params).fetchone()[0]
+    
+    def get_daily_stats(self, date_from=None, date_to=None):
+        """彙總每日統計桶，返回 {維度: {鍵: 數量}} 與每日總數"""
+        sql = "SELECT day, dimension, key, count FROM daily_stats WHERE count > 0"
+        params = []
+        
+        if date_from and date_to:
+            start_date = datetime.datetime.strptime(date_from, "%Y-%m-%d").strftime("%Y-%m-%d")
+            end_date = datetime.datetime.strptime(date_to, "%Y-%m-%d").strftime("%Y-%m-%d")
+            sql += " AND day BETWEEN ? AND ?"
+            params.extend([start_date, end_date])
+        
+        totals = {}
+        by_day = {}
+        for row in self._connect().execute(sql, params):
+            if row['dimension'] == 'total':
+                by_day[row['day']] = row['count']
+            else:
+                bucket = totals.setdefault(row['dimension'], {})
+                bucket[row['key']] = bucket.get(row['key'], 0) + row['count']
+        
+        return totals, by_day
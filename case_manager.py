@@ -4,15 +4,56 @@
 """
 
 import os
+import json
+import base64
+import binascii
 import datetime
+import threading
+from collections import OrderedDict
 from config import config
+from case_index import CaseIndex
+from cold_storage import cold_storage
+from shared_state import shared_state
+from metrics import metrics
 
 class CaseManager:
     """案件管理器"""
     
+    # 結構化紀錄版本與支援的檔案格式（同一案件兩者並存時以 JSON 為準）
+    RECORD_VERSION = 1
+    RECORD_EXTENSIONS = (".json", ".txt")
+    
+    # 案件編號格式 YYYYMMDD_HHMMSS_NNN：同一秒內的流水號上限，超過時進位到下一秒以保持遞增
+    CASE_ID_SEQUENCE_MAX = 999
+    
+    # 列表與統計使用的摘要欄位
+    SUMMARY_FIELDS = ('event_type', 'location', 'room', 'content', 'ip', 'country', 'city',
+                      'discord_success', 'line_success')
+    
     def __init__(self):
         self.record_dir = "record"
+        self.archive_dir = os.path.join(self.record_dir, "archive")
         self._ensure_record_dir()
+        
+        # 已解析案件紀錄的 LRU 快取（以檔案大小與修改時間驗證）
+        self.cache_size = config.CASE_CACHE_SIZE
+        self._record_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        # 快取命中統計計入效能指標
+        metrics.counter_source(lambda: {
+            'case_cache_hits_total': self.cache_hits,
+            'case_cache_misses_total': self.cache_misses
+        })
+        metrics.gauge("case_cache_entries", "案件紀錄快取項目數（所有工作程序加總）",
+                      lambda: len(self._record_cache), per_process=True)
+        metrics.gauge("case_cache_hit_ratio", "案件紀錄快取命中率（所有工作程序累計）", self._cache_hit_ratio)
+        
+        # 案件索引（啟動時與紀錄目錄同步）
+        self.index = CaseIndex()
+        self.sync_index()
     
     def _ensure_record_dir(self):
         """確保案件紀錄目錄存在"""
@@ -20,27 +61,109 @@ class CaseManager:
             os.makedirs(self.record_dir)
     
     def save_case_record(self, case_data):
-        """保存案件紀錄到檔案"""
+        """保存案件紀錄到檔案（結構化 JSON 格式）"""
         try:
-            # 生成檔案名稱（時間戳記）
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"case_{timestamp}.txt"
-            file_path = os.path.join(self.record_dir, filename)
-            
-            # 格式化案件資料
-            content = self._format_case_content(case_data, timestamp)
+            now = datetime.datetime.now()
+            while True:
+                # 生成案件編號與檔案名稱（時間戳記加流水號）
+                case_id, case_time = self._next_case_id(now)
+                filename = f"case_{case_id}.json"
+                file_path = os.path.join(self.record_dir, filename)
+                
+                # 整理結構化案件資料
+                record = self._build_case_record(case_data, case_id, now, file_path)
+                
+                # 建立檔案（不覆蓋既有紀錄）
+                try:
+                    self._create_json_record(file_path, record)
+                    break
+                except FileExistsError:
+                    # 編號已被使用（例如共用狀態重建），改用下一個流水號
+                    continue
             
-            # 寫入檔案
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+            # 同步更新索引
+            self.index.upsert(self._build_index_entry(filename, case_id, case_time, record))
             
             return filename
             
         except Exception as e:
             raise Exception(f"保存案件紀錄失敗: {str(e)}")
     
+    def _next_case_id(self, now):
+        """產生遞增的案件編號（序號保存在共用狀態，所有工作程序共用），返回 (案件編號, 案件時間)"""
+        current = now.strftime("%Y%m%d_%H%M%S")
+        
+        def advance(last):
+            if last and current <= last[0]:
+                # 同一秒內（或系統時鐘倒退）沿用上一個時間並遞增流水號
+                second, sequence = last[0], last[1] + 1
+            else:
+                second, sequence = current, 0
+            
+            if sequence > self.CASE_ID_SEQUENCE_MAX:
+                next_second = datetime.datetime.strptime(second, "%Y%m%d_%H%M%S") + datetime.timedelta(seconds=1)
+                second, sequence = next_second.strftime("%Y%m%d_%H%M%S"), 0
+            return [second, sequence]
+        
+        second, sequence = shared_state.update('case_id.last', advance)
+        return f"{second}_{sequence:03d}", datetime.datetime.strptime(second, "%Y%m%d_%H%M%S")
+    
+    def _build_case_record(self, case_data, case_id, server_time, file_path):
+        """整理結構化案件紀錄"""
+        return {
+            'version': self.RECORD_VERSION,
+            'case_id': case_id,
+            'event_type': case_data.get('event_type', 'Unknown'),
+            'location': case_data.get('location', 'Unknown'),
+            'room': case_data.get('room', 'Unknown'),
+            'content': case_data.get('content', 'None'),
+            'message': case_data.get('message', 'No message'),
+            'ip': case_data.get('ip', 'Unknown'),
+            'country': case_data.get('country', 'Unknown'),
+            'city': case_data.get('city', 'Unknown'),
+            'user_agent': case_data.get('user_agent', 'Unknown'),
+            'discord_success': case_data.get('discord_success', False),
+            'line_success': case_data.get('line_success', False),
+            'discord_message_id': case_data.get('discord_message_id'),
+            'server_time': server_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'file_path': file_path
+        }
+    
+    def _create_json_record(self, file_path, record):
+        """以原子方式建立新的案件紀錄並同步到磁碟（檔案已存在時拋出 FileExistsError）"""
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            
+            # 以硬連結建立正式檔案：讀取端只會看到完整內容，且不會覆蓋同編號的紀錄
+            os.link(tmp_path, file_path)
+        finally:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+        
+        # 同步目錄項目，確保斷電後新檔案仍存在
+        dir_fd = os.open(self.record_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    
+    def _write_json_record(self, file_path, record):
+        """以原子方式寫入結構化案件紀錄"""
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
+    
     def _format_case_content(self, case_data, timestamp):
-        """格式化案件內容"""
+        """格式化案件內容（文字檢視）"""
+        server_time = case_data.get('server_time') or datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        file_path = case_data.get('file_path') or os.path.join(self.record_dir, f'case_{timestamp}.txt')
         content = f"""案件紀錄 / Case Record
 {'='*50}
 
@@ -65,61 +188,363 @@ class CaseManager:
 {case_data.get('message', 'No message')}
 
 系統資訊 / System Information:
-- 伺服器時間 / Server Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-- 檔案路徑 / File Path: {os.path.join(self.record_dir, f'case_{timestamp}.txt')}
+- 伺服器時間 / Server Time: {server_time}
+- 檔案路徑 / File Path: {file_path}
 - 案件編號 / Case ID: {timestamp}
 
 {'='*50}
 """
         return content
     
-    def get_case_files(self, date_from=None, date_to=None):
-        """獲取案件檔案列表"""
-        case_files = []
+    def update_broadcast_results(self, filename, results):
+        """更新案件紀錄中的廣播結果"""
+        file_path = os.path.join(self.record_dir, filename)
+        if not os.path.exists(file_path):
+            return False
         
-        if not os.path.exists(self.record_dir):
-            return case_files
+        if filename.endswith(".json"):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            record['discord_success'] = results.get('discord_success', False)
+            record['line_success'] = results.get('line_success', False)
+            record['discord_message_id'] = results.get('discord_message_id')
+            self._write_json_record(file_path, record)
+        else:
+            # 舊版文字格式：直接替換廣播結果行
+            replacements = {
+                '- Discord 發送 / Discord Send:': results.get('discord_success', False),
+                '- LINE 發送 / LINE Send:': results.get('line_success', False),
+                '- Discord 訊息 ID / Discord Message ID:': results.get('discord_message_id') or 'None'
+            }
+            
+            with open(file_path, 'r', encoding='utf-8') as f:
+                lines = f.read().split('\n')
+            
+            for i, line in enumerate(lines):
+                for prefix, value in replacements.items():
+                    if line.startswith(prefix):
+                        lines[i] = f"{prefix} {value}"
+            
+            # 先寫入暫存檔再替換，避免讀取端看到寫到一半的檔案
+            tmp_path = f"{file_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines))
+            os.replace(tmp_path, file_path)
+        
+        # 同步更新快取與索引中的檔案資訊
+        self._invalidate_cached_records([filename])
+        parsed = self._parse_case_filename(filename)
+        if parsed:
+            stat = os.stat(file_path)
+            self.index.update_file_stat(parsed[0], stat.st_size, stat.st_mtime)
+        
+        return True
+    
+    def _parse_case_filename(self, filename):
+        """解析案件檔案名稱，返回 (案件編號, 案件時間)，格式不符時返回 None"""
+        if not filename.startswith("case_"):
+            return None
+        
+        case_id, ext = os.path.splitext(filename[len("case_"):])
+        if ext not in self.RECORD_EXTENSIONS:
+            return None
+        
+        case_time = self.parse_case_id(case_id)
+        if case_time is None:
+            return None
+        
+        return case_id, case_time
+    
+    @staticmethod
+    def parse_case_id(case_id):
+        """解析案件編號的時間（YYYYMMDD_HHMMSS_NNN，或舊版不含流水號的 YYYYMMDD_HHMMSS），格式不符時返回 None"""
+        time_str, sequence = case_id[:15], case_id[15:]
+        if sequence and not (sequence[0] == '_' and sequence[1:].isdigit()):
+            return None
+        
+        try:
+            return datetime.datetime.strptime(time_str, "%Y%m%d_%H%M%S")
+        except ValueError:
+            return None
+    
+    def _build_index_entry(self, filename, case_id, case_time, case_info=None):
+        """建立案件索引資料"""
+        file_path = os.path.join(self.record_dir, filename)
+        stat = os.stat(file_path)
+        
+        if case_info is None:
+            case_info = self.load_case_record(filename, full=False)
+        
+        return {
+            'case_id': case_id,
+            'filename': filename,
+            'case_time': case_time.strftime("%Y-%m-%d %H:%M:%S"),
+            'case_date': case_time.strftime("%Y-%m-%d"),
+            'event_type': case_info.get('event_type'),
+            'location': case_info.get('location'),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime
+        }
+    
+    def sync_index(self):
+        """同步案件索引與紀錄目錄（只解析尚未索引的檔案）"""
+        indexed = self.index.get_filenames()
+        on_disk = {}
         
         for filename in os.listdir(self.record_dir):
-            if filename.startswith("case_") and filename.endswith(".txt"):
+            parsed = self._parse_case_filename(filename)
+            if not parsed:
+                continue
+            
+            # 同一案件同時有 JSON 與文字檔時以 JSON 為準
+            case_id, case_time = parsed
+            if case_id not in on_disk or filename.endswith(".json"):
+                on_disk[case_id] = (filename, case_time)
+        
+        entries = []
+        for case_id, (filename, case_time) in on_disk.items():
+            if filename not in indexed:
                 try:
-                    # 解析檔案名稱獲取時間
-                    time_str = filename.replace("case_", "").replace(".txt", "")
-                    case_time = datetime.datetime.strptime(time_str, "%Y%m%d_%H%M%S")
-                    
-                    # 檢查日期範圍
-                    if date_from and date_to:
-                        start_date = datetime.datetime.strptime(date_from, "%Y-%m-%d")
-                        end_date = datetime.datetime.strptime(date_to, "%Y-%m-%d")
-                        
-                        if not (start_date.date() <= case_time.date() <= end_date.date()):
-                            continue
-                    
-                    file_path = os.path.join(self.record_dir, filename)
-                    stat = os.stat(file_path)
-                    
-                    case_files.append({
-                        'filename': filename,
-                        'case_id': time_str,
-                        'time': case_time.strftime("%Y-%m-%d %H:%M:%S"),
-                        'timestamp': case_time.isoformat(),
-                        'size': stat.st_size,
-                        'modified': datetime.datetime.fromtimestamp(stat.st_mtime)
-                    })
-                    
-                except ValueError:
+                    entries.append(self._build_index_entry(filename, case_id, case_time))
+                except (OSError, ValueError):
                     continue
         
-        return sorted(case_files, key=lambda x: x['case_id'], reverse=True)
+        if entries:
+            self.index.upsert_many(entries)
+        
+        removed = [case_id for case_id in indexed.values() if case_id not in on_disk]
+        if removed:
+            self.index.remove(removed)
+    
+    def find_case_filename(self, case_id):
+        """由案件編號查詢紀錄檔案名稱"""
+        row = self.index.get(case_id)
+        return row['filename'] if row else None
+    
+    def get_case_files(self, date_from=None, date_to=None, case_type=None):
+        """獲取案件檔案列表（由索引查詢，最新的在前）"""
+        try:
+            rows = self.index.query(date_from, date_to, case_type)
+        except ValueError:
+            return []
+        
+        return [self._case_file_info(row) for row in rows]
+    
+    def iter_case_files(self, date_from=None, date_to=None, case_type=None, batch_size=500):
+        """逐批產生案件檔案資訊（鍵集分頁，最新的在前，記憶體用量與案件數量無關）"""
+        before = None
+        while True:
+            try:
+                rows = self.index.query(date_from, date_to, case_type, limit=batch_size, before=before)
+            except ValueError:
+                return
+            
+            for row in rows:
+                yield self._case_file_info(row)
+            
+            if len(rows) < batch_size:
+                return
+            before = rows[-1]['case_id']
+    
+    def count_cases(self, date_from=None, date_to=None, case_type=None):
+        """計算符合條件的案件數量"""
+        try:
+            return self.index.count(date_from, date_to, case_type)
+        except ValueError:
+            return 0
+    
+    def _case_file_info(self, row):
+        """將索引資料轉換為案件檔案資訊"""
+        return {
+            'filename': row['filename'],
+            'case_id': row['case_id'],
+            'time': row['case_time'],
+            'timestamp': row['case_time'].replace(' ', 'T'),
+            'size': row['size'],
+            'modified': datetime.datetime.fromtimestamp(row['mtime'])
+        }
+    
+    @staticmethod
+    def encode_cursor(case_id):
+        """將案件編號編碼為不透明的分頁游標"""
+        return base64.urlsafe_b64encode(case_id.encode('utf-8')).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def decode_cursor(cursor):
+        """解碼分頁游標為案件編號"""
+        try:
+            case_id = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        except (binascii.Error, UnicodeDecodeError):
+            raise ValueError("分頁游標格式錯誤")
+        if not case_id or not case_id[:8].isdigit():
+            raise ValueError("分頁游標格式錯誤")
+        return case_id
+    
+    def query_cases(self, case_type=None, date_from=None, date_to=None, location=None,
+                    limit=None, offset=0, full=False, cursor=None, type_contains=False):
+        """查詢案件（由索引過濾與分頁，只讀取當頁案件；type_contains 時分類以部分字串比對），返回 {'records', 'total', 'next_cursor'}"""
+        if case_type == 'all':
+            case_type = None
+        
+        # 指定游標時改用鍵集分頁（忽略 offset），新案件進來時頁面內容保持穩定
+        before = self.decode_cursor(cursor) if cursor else None
+        if before:
+            offset = 0
+        
+        try:
+            total = self.index.count(date_from, date_to, case_type, location, type_contains)
+            # 多取一筆以判斷是否還有下一頁
+            rows = self.index.query(date_from, date_to, case_type, location,
+                                    limit + 1 if limit is not None else None, offset, before, type_contains)
+        except ValueError:
+            return {'records': [], 'total': 0, 'next_cursor': None}
+        
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self.encode_cursor(rows[-1]['case_id']) if rows else None
+        
+        records = []
+        for row in rows:
+            case_info = self.load_case_record(row['filename'], full=full)
+            if case_info is None:
+                continue
+            case_info.update(self._case_file_info(row))
+            records.append(case_info)
+        
+        return {'records': records, 'total': total, 'next_cursor': next_cursor}
     
     def read_case_file(self, filename):
-        """讀取案件檔案內容"""
-        file_path = os.path.join(self.record_dir, filename)
-        if not os.path.exists(file_path):
+        """讀取案件檔案內容（結構化紀錄以文字檢視呈現）"""
+        if filename.endswith(".json"):
+            record = self.load_case_record(filename)
+            if record is None:
+                return None
+            return self._format_case_content(record, record.get('case_id', ''))
+        
+        for _ in range(2):
+            source = self._record_source(filename)
+            if source is None:
+                return None
+            try:
+                return self._read_record_text(filename, source[1], source[0])
+            except (FileNotFoundError, KeyError):
+                # 壓縮作業恰好將檔案移入封存檔，重新定位一次
+                continue
+        return None
+    
+    def load_case_record(self, filename, full=True):
+        """載入案件紀錄為字典（優先使用快取，JSON 一次解碼，舊版文字格式則逐行解析）"""
+        case_info = None
+        for _ in range(2):
+            source = self._record_source(filename)
+            if source is None:
+                return None
+            
+            cache_key, archive_path = source
+            case_info = self._get_cached_record(filename, cache_key)
+            if case_info is not None:
+                break
+            
+            try:
+                content = self._read_record_text(filename, archive_path, cache_key)
+            except (FileNotFoundError, KeyError):
+                # 壓縮作業恰好將檔案移入封存檔，重新定位一次
+                continue
+            
+            if filename.endswith(".json"):
+                case_info = json.loads(content)
+                case_info.pop('version', None)
+            else:
+                case_info = self.parse_case_record_full(content)
+            self._put_cached_record(filename, cache_key, case_info)
+            break
+        
+        if case_info is None:
+            return None
+        
+        # 返回複本，避免呼叫端修改快取內容
+        if not full:
+            return {key: case_info.get(key) for key in self.SUMMARY_FIELDS}
+        return dict(case_info)
+    
+    def _record_source(self, filename):
+        """定位案件紀錄，返回 (快取驗證鍵, 封存檔路徑)，散檔時封存檔路徑為 None，找不到時返回 None"""
+        # 散檔優先：以檔案大小與修改時間作為快取驗證鍵
+        try:
+            stat = os.stat(os.path.join(self.record_dir, filename))
+            return (stat.st_size, stat.st_mtime_ns), None
+        except FileNotFoundError:
+            pass
+        
+        # 冷儲存：由索引查詢案件所在的封存檔
+        parsed = self._parse_case_filename(filename)
+        row = self.index.get(parsed[0]) if parsed else None
+        if row is None or not row['archive']:
+            return None
+        
+        archive_path = os.path.join(self.archive_dir, row['archive'])
+        try:
+            stat = os.stat(archive_path)
+        except FileNotFoundError:
             return None
+        return (row['archive'], stat.st_size, stat.st_mtime_ns), archive_path
+    
+    def _read_record_text(self, filename, archive_path=None, cache_key=None):
+        """讀取案件紀錄原始內容（散檔或封存檔成員，cache_key 為 _record_source 返回的驗證鍵）"""
+        if archive_path is None:
+            with open(os.path.join(self.record_dir, filename), 'r', encoding='utf-8') as f:
+                return f.read()
         
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        return cold_storage.read_member(archive_path, filename, cache_key).decode('utf-8')
+    
+    def _get_cached_record(self, filename, cache_key):
+        """從快取獲取已解析的案件紀錄"""
+        with self._cache_lock:
+            entry = self._record_cache.get(filename)
+            if entry is not None and entry[0] == cache_key:
+                self._record_cache.move_to_end(filename)
+                self.cache_hits += 1
+                return entry[1]
+            self.cache_misses += 1
+            return None
+    
+    def _put_cached_record(self, filename, cache_key, case_info):
+        """將已解析的案件紀錄放入快取"""
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._record_cache[filename] = (cache_key, case_info)
+            self._record_cache.move_to_end(filename)
+            while len(self._record_cache) > self.cache_size:
+                self._record_cache.popitem(last=False)
+    
+    def _invalidate_cached_records(self, filenames=None):
+        """移除快取中的案件紀錄（未指定時清空全部）"""
+        with self._cache_lock:
+            if filenames is None:
+                self._record_cache.clear()
+            else:
+                for filename in filenames:
+                    self._record_cache.pop(filename, None)
+    
+    def _cache_hit_ratio(self):
+        """所有工作程序累計的快取命中率"""
+        hits = metrics.read_total('case_cache_hits_total')
+        misses = metrics.read_total('case_cache_misses_total')
+        return hits / (hits + misses) if hits + misses else 0.0
+    
+    def get_cache_stats(self):
+        """獲取案件紀錄快取統計"""
+        with self._cache_lock:
+            total = self.cache_hits + self.cache_misses
+            return {
+                'size': len(self._record_cache),
+                'capacity': self.cache_size,
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'hit_ratio': self.cache_hits / total if total else 0.0
+            }
     
     def parse_case_record(self, content):
         """解析案件紀錄檔案內容（簡化版本）"""
@@ -272,36 +697,82 @@ class CaseManager:
     def clear_case_files(self, date_from=None, date_to=None):
         """清除案件檔案"""
         cleared_files = []
+        removed_ids = []
         
-        if not os.path.exists(self.record_dir):
+        try:
+            rows = self.index.query(date_from, date_to)
+        except ValueError:
             return cleared_files
         
-        for filename in os.listdir(self.record_dir):
-            if filename.startswith("case_") and filename.endswith(".txt"):
+        archived = {}
+        for row in rows:
+            # 一併移除同一案件的其他格式檔案（例如遷移時保留的文字檔）
+            for ext in self.RECORD_EXTENSIONS:
+                filename = f"case_{row['case_id']}{ext}"
+                if row['archive']:
+                    archived.setdefault(row['archive'], set()).add(filename)
                 try:
-                    # 解析檔案名稱獲取時間
-                    time_str = filename.replace("case_", "").replace(".txt", "")
-                    case_time = datetime.datetime.strptime(time_str, "%Y%m%d_%H%M%S")
-                    
-                    # 檢查日期範圍
-                    if date_from and date_to:
-                        start_date = datetime.datetime.strptime(date_from, "%Y-%m-%d")
-                        end_date = datetime.datetime.strptime(date_to, "%Y-%m-%d")
-                        
-                        if not (start_date.date() <= case_time.date() <= end_date.date()):
-                            continue
-                    
-                    file_path = os.path.join(self.record_dir, filename)
-                    os.remove(file_path)
+                    os.remove(os.path.join(self.record_dir, filename))
                     cleared_files.append(filename)
-                    
-                except ValueError:
-                    continue
+                except FileNotFoundError:
+                    pass
+            removed_ids.append(row['case_id'])
+        
+        # 已封存的案件由封存檔中移除
+        if archived:
+            with cold_storage.lock(self.archive_dir):
+                for archive, filenames in archived.items():
+                    cleared_files.extend(cold_storage.rewrite(os.path.join(self.archive_dir, archive), remove=filenames))
+        
+        # 同步移除索引與快取
+        if removed_ids:
+            self.index.remove(removed_ids)
+        self._invalidate_cached_records(cleared_files)
         
         return cleared_files
     
+    def archive_old_cases(self, older_than_days):
+        """將超過指定天數的案件紀錄壓縮封存為每月封存檔（冷儲存），返回已封存的案件數量"""
+        cutoff = (datetime.date.today() - datetime.timedelta(days=older_than_days)).strftime("%Y-%m-%d")
+        by_month = {}
+        for row in self.index.get_unarchived_before(cutoff):
+            by_month.setdefault(row['case_id'][:6], []).append(row['case_id'])
+        
+        if not by_month:
+            return 0
+        
+        archived = 0
+        with cold_storage.lock(self.archive_dir):
+            for month, case_ids in sorted(by_month.items()):
+                archive = f"cases_{month}.zip"
+                members = {}
+                for case_id in case_ids:
+                    for ext in self.RECORD_EXTENSIONS:
+                        filename = f"case_{case_id}{ext}"
+                        file_path = os.path.join(self.record_dir, filename)
+                        if os.path.exists(file_path):
+                            members[filename] = file_path
+                
+                case_ids = [case_id for case_id in case_ids
+                            if any(f"case_{case_id}{ext}" in members for ext in self.RECORD_EXTENSIONS)]
+                if not case_ids:
+                    continue
+                
+                # 先寫入封存檔並更新索引，最後才移除散檔，中斷時不會遺失紀錄
+                cold_storage.rewrite(os.path.join(self.archive_dir, archive), add=members)
+                self.index.set_archive(case_ids, archive)
+                self._invalidate_cached_records(members)
+                for file_path in members.values():
+                    try:
+                        os.remove(file_path)
+                    except FileNotFoundError:
+                        pass
+                archived += len(case_ids)
+        
+        return archived
+    
     def get_case_stats(self, date_from=None, date_to=None):
-        """獲取案件統計資料"""
+        """獲取案件統計資料（由索引的每日統計桶彙總，不讀取案件檔案）"""
         stats = {
             'total_cases': 0,
             'ohca_cases': 0,
@@ -312,40 +783,60 @@ class CaseManager:
             'by_date': {}
         }
         
-        case_files = self.get_case_files(date_from, date_to)
+        try:
+            totals, by_day = self.index.get_daily_stats(date_from, date_to)
+        except ValueError:
+            return stats
         
-        for case_file in case_files:
-            try:
-                content = self.read_case_file(case_file['filename'])
-                if content:
-                    case_info = self.parse_case_record(content)
-                    
-                    # 統計
-                    stats['total_cases'] += 1
-                    if case_info.get('event_type') == 'OHCA':
-                        stats['ohca_cases'] += 1
-                    elif case_info.get('event_type') == '內科':
-                        stats['internal_cases'] += 1
-                    elif case_info.get('event_type') == '外科':
-                        stats['surgical_cases'] += 1
-                    
-                    # 地點統計
-                    location = case_info.get('location', 'Unknown')
-                    stats['by_location'][location] = stats['by_location'].get(location, 0) + 1
-                    
-                    # 小時統計
-                    case_time = datetime.datetime.strptime(case_file['case_id'], "%Y%m%d_%H%M%S")
-                    hour = case_time.hour
-                    stats['by_hour'][hour] = stats['by_hour'].get(hour, 0) + 1
-                    
-                    # 日期統計
-                    date_key = case_time.strftime("%Y-%m-%d")
-                    stats['by_date'][date_key] = stats['by_date'].get(date_key, 0) + 1
-                    
-            except Exception as e:
-                continue
+        by_type = totals.get('type', {})
+        stats['total_cases'] = sum(by_day.values())
+        stats['ohca_cases'] = by_type.get('OHCA', 0)
+        stats['internal_cases'] = by_type.get('內科', 0)
+        stats['surgical_cases'] = by_type.get('外科', 0)
+        stats['by_location'] = totals.get('location', {})
+        stats['by_hour'] = {int(hour): count for hour, count in totals.get('hour', {}).items()}
+        stats['by_date'] = by_day
         
         return stats
+    
+    def migrate_text_records(self, keep_text=False):
+        """將舊版文字格式案件紀錄轉換為結構化 JSON 格式，返回已轉換的檔案列表"""
+        migrated = []
+        entries = []
+        
+        for filename in sorted(os.listdir(self.record_dir)):
+            parsed = self._parse_case_filename(filename)
+            if not parsed or not filename.endswith(".txt"):
+                continue
+            
+            case_id, case_time = parsed
+            json_filename = f"case_{case_id}.json"
+            json_path = os.path.join(self.record_dir, json_filename)
+            
+            if not os.path.exists(json_path):
+                try:
+                    case_info = self.load_case_record(filename)
+                except (OSError, ValueError):
+                    continue
+                
+                # 保留原始伺服器時間，檔案路徑改為新的 JSON 檔案
+                record = self._build_case_record(case_info, case_id, case_time, json_path)
+                record['server_time'] = case_info.get('server_time') or record['server_time']
+                record['message'] = (record['message'] or '').rstrip('\n')
+                if record['discord_message_id'] == 'None':
+                    record['discord_message_id'] = None
+                self._write_json_record(json_path, record)
+                migrated.append(filename)
+            
+            entries.append(self._build_index_entry(json_filename, case_id, case_time))
+            
+            if not keep_text:
+                os.remove(os.path.join(self.record_dir, filename))
+        
+        if entries:
+            self.index.upsert_many(entries)
+        
+        return migrated
 
 # 全域案件管理器實例
 case_manager = CaseManager()
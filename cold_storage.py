@@ -0,0 +1,148 @@
+"""
+冷儲存模組
+負責將舊案件紀錄與日誌壓縮封存為每月 ZIP 封存檔，並提供成員讀取與重寫
+"""
+
+import os
+import gzip
+import fcntl
+import shutil
+import zipfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class ColdStorage:
+    """冷儲存封存檔（每個封存檔為一個 ZIP，成員名稱與原始檔名相同）"""
+    
+    # 保持開啟的封存檔數量上限（每月一個封存檔，匯出與日誌查詢通常只涉及最近幾個月）
+    MAX_OPEN_ARCHIVES = 8
+    
+    def __init__(self):
+        # 已開啟的封存檔 {封存檔路徑: (驗證鍵, ZipFile)}，避免每次讀取成員都重新開啟並解析目錄
+        self._archives = OrderedDict()
+        self._archives_lock = threading.Lock()
+    
+    def _archive_key(self, archive_path):
+        """計算封存檔的驗證鍵 (封存檔名稱, 檔案大小, 修改時間)，與案件紀錄快取使用的鍵相同"""
+        stat = os.stat(archive_path)
+        return (os.path.basename(archive_path), stat.st_size, stat.st_mtime_ns)
+    
+    def _archive(self, archive_path, cache_key=None):
+        """獲取已開啟的封存檔（封存檔被其他程序重寫後自動重新開啟），呼叫端須持有 _archives_lock"""
+        if cache_key is None:
+            cache_key = self._archive_key(archive_path)
+        entry = self._archives.get(archive_path)
+        if entry is not None:
+            if entry[0] == cache_key:
+                self._archives.move_to_end(archive_path)
+                return entry[1]
+            self._close_archive(archive_path)
+        
+        archive = zipfile.ZipFile(archive_path)
+        self._archives[archive_path] = (cache_key, archive)
+        while len(self._archives) > self.MAX_OPEN_ARCHIVES:
+            self._close_archive(next(iter(self._archives)))
+        return archive
+    
+    def _close_archive(self, archive_path):
+        """關閉並移除已開啟的封存檔，呼叫端須持有 _archives_lock"""
+        # 已開啟的成員串流仍保有底層檔案直到自身關閉
+        entry = self._archives.pop(archive_path, None)
+        if entry is not None:
+            entry[1].close()
+    
+    def list_members(self, archive_path):
+        """獲取封存檔的成員資訊，封存檔不存在或損壞時返回空列表"""
+        try:
+            with self._archives_lock:
+                return list(self._archive(archive_path).infolist())
+        except (FileNotFoundError, zipfile.BadZipFile):
+            return []
+    
+    def has_member(self, archive_path, member):
+        """檢查封存檔是否包含指定成員，封存檔不存在或損壞時返回 False"""
+        try:
+            with self._archives_lock:
+                self._archive(archive_path).getinfo(member)
+                return True
+        except (FileNotFoundError, zipfile.BadZipFile, KeyError):
+            return False
+    
+    def read_member(self, archive_path, member, cache_key=None):
+        """讀取封存檔成員的完整內容（位元組，cache_key 為呼叫端已取得的封存檔驗證鍵）"""
+        with self._archives_lock:
+            return self._archive(archive_path, cache_key).read(member)
+    
+    def open_member(self, archive_path, member):
+        """以二進位串流開啟封存檔成員"""
+        with self._archives_lock:
+            return self._archive(archive_path).open(member)
+    
+    def rewrite(self, archive_path, add=None, remove=()):
+        """重寫封存檔（加入或移除成員），以暫存檔寫入後原子替換，返回已移除的成員名稱"""
+        # add 為 {成員名稱: 來源檔案路徑}；成員全部移除時刪除封存檔
+        add = add or {}
+        tmp_path = f"{archive_path}.{os.getpid()}.tmp"
+        removed = []
+        kept = 0
+        
+        try:
+            with open(tmp_path, 'wb') as f:
+                with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as target:
+                    if os.path.exists(archive_path):
+                        with zipfile.ZipFile(archive_path) as source:
+                            for info in source.infolist():
+                                if info.filename in remove:
+                                    removed.append(info.filename)
+                                    continue
+                                # 重新封存的成員以來源檔案為準
+                                if info.filename in add:
+                                    continue
+                                target.writestr(info, source.read(info))
+                                kept += 1
+                    
+                    for member, source_path in add.items():
+                        self._write_member(target, member, source_path)
+                        kept += 1
+                f.flush()
+                os.fsync(f.fileno())
+            
+            if kept:
+                os.replace(tmp_path, archive_path)
+            elif os.path.exists(archive_path):
+                os.remove(archive_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            # 關閉重寫前開啟的封存檔，下次讀取時重新開啟
+            with self._archives_lock:
+                self._close_archive(archive_path)
+        
+        return removed
+    
+    def _write_member(self, target, member, source_path):
+        """將來源檔案寫入封存檔成員（保留修改時間）"""
+        info = zipfile.ZipInfo.from_file(source_path, member)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        opener = gzip.open if source_path.endswith(".gz") else open
+        with opener(source_path, 'rb') as source, target.open(info, 'w', force_zip64=True) as entry:
+            shutil.copyfileobj(source, entry)
+    
+    @contextmanager
+    def lock(self, archive_dir):
+        """封存目錄寫入鎖（以 flock 防止多個程序同時重寫封存檔）"""
+        if not os.path.exists(archive_dir):
+            os.makedirs(archive_dir)
+        fd = os.open(os.path.join(archive_dir, ".lock"), os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+# 全域冷儲存實例
+cold_storage = ColdStorage()
@@ -0,0 +1,39 @@
+"""
+冷儲存壓縮工具
+將超過指定天數的案件紀錄 (record/case_*) 與日誌 (logs/flask_app_*) 封存為每月 ZIP 壓縮檔，
+封存後仍可由管理網站查詢、檢視與匯出
+
+使用方式:
+    python compact_storage.py                  # 依 .env 設定的天數封存案件紀錄與日誌
+    python compact_storage.py --cases-days 60  # 只封存 60 天以前的案件紀錄
+    python compact_storage.py --skip-logs      # 只封存案件紀錄
+"""
+
+import argparse
+from config import config
+from case_manager import case_manager
+from logger import logger_manager
+
+def main():
+    """執行冷儲存封存"""
+    parser = argparse.ArgumentParser(description="將舊案件紀錄與日誌封存為每月壓縮檔")
+    parser.add_argument("--cases-days", type=int, default=config.ARCHIVE_CASES_AFTER_DAYS,
+                        help="封存超過此天數的案件紀錄")
+    parser.add_argument("--logs-days", type=int, default=config.ARCHIVE_LOGS_AFTER_DAYS,
+                        help="封存超過此天數的日誌")
+    parser.add_argument("--skip-cases", action="store_true", help="不封存案件紀錄")
+    parser.add_argument("--skip-logs", action="store_true", help="不封存日誌")
+    args = parser.parse_args()
+    
+    if not args.skip_cases:
+        archived = case_manager.archive_old_cases(args.cases_days)
+        print(f"已封存 {archived} 個案件紀錄")
+    
+    if not args.skip_logs:
+        archived = logger_manager.archive_old_logs(args.logs_days)
+        print(f"已封存 {len(archived)} 個日誌檔案")
+    
+    logger_manager.flush()
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,17 @@ class Config:
         
         # Flask 配置
         self.SECRET_KEY = os.getenv("SECRET_KEY", "secret_key")
-        self.SESSION_TYPE = os.getenv("SESSION_TYPE", "filesystem")
+        # Session 儲存方式（cookie 使用簽章 Cookie，其他值使用伺服器端 SQLite；有效期限單位：秒）
+        self.SESSION_TYPE = os.getenv("SESSION_TYPE", "sqlite")
+        self.SESSION_LIFETIME = int(os.getenv("SESSION_LIFETIME", "1800"))
+        
+        # 受信任的反向代理（以逗號分隔的 IP 或網段，例如 127.0.0.1,10.0.0.0/8；留空表示採用所有轉送標頭）
+        self.TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "")
+        
+        # 生產環境伺服器配置（gunicorn；工作程序 0 表示依 CPU 核心數決定，逾時單位：秒）
+        self.WEB_WORKERS = int(os.getenv("WEB_WORKERS", "0"))
+        self.WEB_THREADS = int(os.getenv("WEB_THREADS", "8"))
+        self.WEB_TIMEOUT = int(os.getenv("WEB_TIMEOUT", "30"))
         
         # LINE Bot 配置
         self.LINE_BOT_API_TOKEN = os.getenv("LINE_BOT_API_TOKEN")
@@ -25,6 +35,53 @@ class Config:
         # Discord 配置
         self.DISCORD_WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL")
         
+        # 外部 API 連線配置（逾時與保持連線間隔單位：秒，間隔 0 表示只在啟動時預熱）
+        self.LINE_API_BASE_URL = os.getenv("LINE_API_BASE_URL", "https://api.line.me")
+        self.HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+        self.HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+        self.HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+        self.HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "8"))
+        self.HTTP_KEEPALIVE_INTERVAL = float(os.getenv("HTTP_KEEPALIVE_INTERVAL", "240"))
+        
+        # 廣播配置（各頻道發送期限，單位：秒）
+        self.BROADCAST_TIMEOUT = float(os.getenv("BROADCAST_TIMEOUT", "10"))
+        
+        # 廣播寄件匣配置（重試間隔單位：秒，最大嘗試次數 0 表示持續重試直到成功）
+        self.OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+        self.OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "2"))
+        self.OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", "300"))
+        self.OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "0"))
+        
+        # 案件紀錄快取配置（0 表示停用）
+        self.CASE_CACHE_SIZE = int(os.getenv("CASE_CACHE_SIZE", "1024"))
+        
+        # 日誌寫入配置（背景批次寫入，佇列滿時丟棄一般日誌；間隔單位：秒）
+        self.LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+        self.LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+        self.LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+        
+        # 日誌輪替配置（午夜切換新檔，舊日誌於延遲後壓縮為 .gz；延遲單位：秒）
+        self.LOG_COMPRESS = os.getenv("LOG_COMPRESS", "1") == "1"
+        self.LOG_COMPRESS_DELAY = float(os.getenv("LOG_COMPRESS_DELAY", "60"))
+        
+        # 冷儲存配置（超過天數的案件紀錄與日誌由 compact_storage.py 封存為每月壓縮檔）
+        self.ARCHIVE_CASES_AFTER_DAYS = int(os.getenv("ARCHIVE_CASES_AFTER_DAYS", "30"))
+        self.ARCHIVE_LOGS_AFTER_DAYS = int(os.getenv("ARCHIVE_LOGS_AFTER_DAYS", "30"))
+        
+        # 日誌解析診斷配置（預設關閉，可於管理網站即時切換；速率限制單位：筆/秒）
+        self.LOG_DIAGNOSTICS = os.getenv("LOG_DIAGNOSTICS", "0") == "1"
+        self.LOG_DIAGNOSTICS_SAMPLE_RATE = float(os.getenv("LOG_DIAGNOSTICS_SAMPLE_RATE", "0.05"))
+        self.LOG_DIAGNOSTICS_RATE_LIMIT = float(os.getenv("LOG_DIAGNOSTICS_RATE_LIMIT", "20"))
+        # 診斷檔案依大小輪替（單位：位元組），保留的舊檔數量
+        self.LOG_DIAGNOSTICS_MAX_BYTES = int(os.getenv("LOG_DIAGNOSTICS_MAX_BYTES", str(10 * 1024 * 1024)))
+        self.LOG_DIAGNOSTICS_BACKUP_COUNT = int(os.getenv("LOG_DIAGNOSTICS_BACKUP_COUNT", "3"))
+        
+        # 效能指標配置（各工作程序將指標彙總到共用資料庫的間隔，單位：秒）
+        self.METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+        
+        # 填報流程追蹤配置（追蹤資料保存天數，0 表示永久保存）
+        self.TRACE_RETENTION_DAYS = int(os.getenv("TRACE_RETENTION_DAYS", "90"))
+        
         # 確保必要目錄存在
         self._ensure_directories()
     
@@ -0,0 +1,33 @@
+"""
+Gunicorn 設定檔
+主網站與管理網站共用的生產環境伺服器設定（綁定位址由服務檔案的 --bind 指定）
+
+使用方式:
+    gunicorn --bind 0.0.0.0:8000 app:app        # 主網站
+    gunicorn --bind 0.0.0.0:5000 admin_app:app  # 管理網站
+"""
+
+import multiprocessing
+# 以別名匯入：gunicorn 會將設定檔中的 config 名稱視為自身的設定項
+from config import config as app_config
+
+# 工作程序數量（未設定時依 CPU 核心數決定）
+workers = app_config.WEB_WORKERS or multiprocessing.cpu_count() + 1
+
+# 每個工作程序以多執行緒處理請求：即時日誌串流（SSE）長時間佔用連線時不會卡住其他請求
+worker_class = "gthread"
+threads = app_config.WEB_THREADS
+timeout = app_config.WEB_TIMEOUT
+graceful_timeout = 30
+keepalive = 5
+
+# 不預先載入應用程式：日誌寫入、廣播寄件匣與連線預熱等背景執行緒必須在各工作程序中啟動
+preload_app = False
+
+# 處理一定數量的請求後重啟工作程序（加入隨機量避免同時重啟）
+max_requests = 2000
+max_requests_jitter = 200
+
+# 存取日誌由應用程式記錄，gunicorn 只輸出錯誤到 systemd journal
+accesslog = None
+errorlog = "-"
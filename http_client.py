@@ -0,0 +1,120 @@
+"""
+HTTP 連線模組
+負責 LINE Messaging API 與 Discord Webhook 的共用連線池與預熱
+"""
+
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from config import config
+
+class HTTPClientError(Exception):
+    """外部 API 回應錯誤"""
+    
+    def __init__(self, service, status_code, body):
+        self.service = service
+        self.status_code = status_code
+        self.body = body
+        super().__init__(f"{service} API錯誤: {status_code} - {body}")
+
+class HTTPClient:
+    """共用 HTTP 用戶端（保持連線的連線池）"""
+    
+    def __init__(self):
+        self.line_api_base = config.LINE_API_BASE_URL.rstrip("/")
+        self.discord_webhook_url = config.DISCORD_WEBHOOK_URL
+        self.timeout = (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT)
+        self.keepalive_interval = config.HTTP_KEEPALIVE_INTERVAL
+        
+        # 所有外部呼叫共用同一個 Session，重複使用已建立的 TCP/TLS 連線
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=config.HTTP_POOL_CONNECTIONS,
+            pool_maxsize=config.HTTP_POOL_MAXSIZE,
+            max_retries=0
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        self.line_headers = {
+            'Authorization': f"Bearer {config.LINE_BOT_API_TOKEN}",
+            'Content-Type': 'application/json'
+        }
+        self._keepalive_thread = None
+    
+    def _timeout(self, timeout):
+        """將單一逾時秒數轉換為 (連線, 讀取) 逾時"""
+        if timeout is None:
+            return self.timeout
+        return (min(self.timeout[0], timeout), timeout)
+    
+    def line_push(self, to, text, timeout=None):
+        """推播LINE文字訊息"""
+        response = self.session.post(
+            f"{self.line_api_base}/v2/bot/message/push",
+            json={'to': to, 'messages': [{'type': 'text', 'text': text}]},
+            headers=self.line_headers,
+            timeout=self._timeout(timeout)
+        )
+        if response.status_code != 200:
+            raise HTTPClientError("LINE", response.status_code, response.text)
+    
+    def line_reply(self, reply_token, text, timeout=None):
+        """回覆LINE文字訊息"""
+        response = self.session.post(
+            f"{self.line_api_base}/v2/bot/message/reply",
+            json={'replyToken': reply_token, 'messages': [{'type': 'text', 'text': text}]},
+            headers=self.line_headers,
+            timeout=self._timeout(timeout)
+        )
+        if response.status_code != 200:
+            raise HTTPClientError("LINE", response.status_code, response.text)
+    
+    def discord_execute(self, content, timeout=None):
+        """透過 Webhook 發送Discord訊息並返回訊息 ID"""
+        # 使用 wait=true 讓 Discord 回傳訊息內容以取得訊息 ID
+        response = self.session.post(
+            self.discord_webhook_url,
+            params={'wait': 'true'},
+            json={'content': content},
+            timeout=self._timeout(timeout)
+        )
+        if response.status_code != 200:
+            raise HTTPClientError("Discord", response.status_code, response.text)
+        return response.json().get('id')
+    
+    def warm_up(self):
+        """預先建立與各服務的連線（不發送任何訊息）"""
+        targets = {
+            'LINE': (f"{self.line_api_base}/v2/bot/info", self.line_headers),
+            'Discord': (self.discord_webhook_url, None)
+        }
+        results = {}
+        for service, (url, headers) in targets.items():
+            try:
+                self.session.get(url, headers=headers, timeout=self.timeout)
+                results[service] = True
+            except requests.RequestException as e:
+                results[service] = False
+                logging.warning(f"HTTP warm-up failed: {service} | Error: {e}")
+        return results
+    
+    def start_keepalive(self):
+        """背景預熱連線並定期保持連線，避免閒置後第一則通報重新握手"""
+        if self._keepalive_thread:
+            return
+        
+        def keepalive_loop():
+            while True:
+                self.warm_up()
+                if self.keepalive_interval <= 0:
+                    return
+                time.sleep(self.keepalive_interval)
+        
+        self._keepalive_thread = threading.Thread(target=keepalive_loop, name="http-keepalive", daemon=True)
+        self._keepalive_thread.start()
+
+# 全域 HTTP 用戶端實例
+http_client = HTTPClient()
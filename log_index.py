@@ -0,0 +1,295 @@
+"""
+日誌索引模組
+以 SQLite 維護結構化日誌欄位，提供依日期、等級、IP 與動作的快速查詢與統計
+"""
+
+import re
+import logging
+import datetime
+import threading
+import collections
+from sqlite_store import SQLiteStore
+
+class LogIndex(SQLiteStore):
+    """日誌索引（每筆日誌一列，依日期分區查詢）"""
+    
+    COLUMNS = ('day', 'ts', 'level', 'category', 'action', 'method', 'path', 'status',
+               'ip', 'country', 'cf_ray', 'message')
+    
+    # 由文字日誌補齊欄位用的樣式（舊版日誌或未帶結構化欄位的紀錄）
+    FIELD_PATTERNS = {
+        'ip': re.compile(r"\| IP: ([^|]+?)(?: \||$)"),
+        'country': re.compile(r"\| Country: ([^|]+?)(?: \||$)"),
+        'cf_ray': re.compile(r"\| CF-Ray: ([^|]+?)(?: \||$)"),
+        'action': re.compile(r"^User Action: ([^|]+?)(?: \||$)"),
+        'request': re.compile(r"^Request: (\S+) (\S+) \| Status: (\d+)")
+    }
+    
+    def __init__(self, db_path="data/log_index.db"):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._create_tables()
+    
+    def _create_tables(self):
+        """建立日誌索引資料表"""
+        conn = self._connect()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    day TEXT NOT NULL,
+                    ts TEXT NOT NULL,
+                    level TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    action TEXT,
+                    method TEXT,
+                    path TEXT,
+                    status INTEGER,
+                    ip TEXT,
+                    country TEXT,
+                    cf_ray TEXT,
+                    message TEXT NOT NULL,
+                    seq INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            # 相同時間、等級與訊息的日誌以出現順序編號，作為去重的唯一鍵
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(logs)")}
+            if 'seq' not in columns:
+                conn.execute("ALTER TABLE logs ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+                self._renumber(conn)
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_logs_entry ON logs (ts, level, message, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_day_ts ON logs (day, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_day_level ON logs (day, level)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_day_category ON logs (day, category)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_ip ON logs (ip, day)")
+            
+            # 已由文字日誌完整建立索引的日期
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS indexed_days (
+                    day TEXT PRIMARY KEY,
+                    indexed_at TEXT NOT NULL
+                )
+            """)
+    
+    def _renumber(self, conn):
+        """為既有的重複日誌補上編號（舊版資料表升級時執行一次）"""
+        days = [row['day'] for row in conn.execute("SELECT DISTINCT day FROM logs")]
+        for day in days:
+            seen = collections.Counter()
+            updates = []
+            for row in conn.execute("SELECT id, ts, level, message FROM logs WHERE day = ? ORDER BY id", (day,)):
+                key = (row['ts'], row['level'], row['message'])
+                if seen[key]:
+                    updates.append((seen[key], row['id']))
+                seen[key] += 1
+            conn.executemany("UPDATE logs SET seq = ? WHERE id = ?", updates)
+    
+    @staticmethod
+    def number_entries(entries):
+        """依出現順序為相同時間、等級與訊息的索引資料編號（與即時寫入的編號方式一致）"""
+        seen = collections.Counter()
+        for entry in entries:
+            key = (entry['ts'], entry['level'], entry['message'])
+            entry['seq'] = seen[key]
+            seen[key] += 1
+        return entries
+    
+    @staticmethod
+    def classify(kind, message):
+        """判斷日誌統計分類（使用者動作、案件、測試或原始類型）"""
+        if kind == 'user_action' or 'USER_ACTION' in message or 'User Action' in message:
+            return 'user_action'
+        if 'INCIDENT' in message or '案件' in message:
+            return 'incident'
+        if 'TEST' in message or '測試' in message:
+            return 'test'
+        return kind or 'message'
+    
+    @classmethod
+    def parse_fields(cls, message):
+        """由文字訊息解析結構化欄位"""
+        fields = {}
+        for key in ('ip', 'country', 'cf_ray', 'action'):
+            match = cls.FIELD_PATTERNS[key].search(message)
+            if match:
+                fields[key] = match.group(1).strip()
+        
+        match = cls.FIELD_PATTERNS['request'].match(message)
+        if match:
+            fields.update(kind='request', method=match.group(1), path=match.group(2), status=int(match.group(3)))
+        elif 'action' in fields:
+            fields['kind'] = 'user_action'
+        elif message.startswith("Error: "):
+            fields['kind'] = 'error'
+        return fields
+    
+    @classmethod
+    def build_entry(cls, timestamp, level, message, fields=None):
+        """組合單筆索引資料（timestamp 格式 YYYY-MM-DD HH:MM:SS）"""
+        if fields is None:
+            fields = cls.parse_fields(message)
+        return {
+            'day': timestamp[:10],
+            'ts': timestamp,
+            'level': level,
+            'category': cls.classify(fields.get('kind'), message),
+            'action': fields.get('action'),
+            'method': fields.get('method'),
+            'path': fields.get('path'),
+            'status': fields.get('status'),
+            'ip': fields.get('ip'),
+            'country': fields.get('country'),
+            'cf_ray': fields.get('cf_ray'),
+            # 文字日誌解析時會去除頭尾空白，即時寫入也一致，才能以訊息去重
+            'message': message.strip()
+        }
+    
+    def insert_many(self, entries):
+        """批次新增日誌索引（編號接續索引中相同日誌的數量，於同一陳述式內計算，跨程序寫入不會衝突）"""
+        conn = self._connect()
+        with conn:
+            conn.executemany(f"""
+                INSERT INTO logs ({', '.join(self.COLUMNS)}, seq)
+                SELECT {', '.join(':' + column for column in self.COLUMNS)}, COUNT(*) FROM logs
+                WHERE ts = :ts AND level = :level AND message = :message
+            """, entries)
+    
+    def replace_day(self, day, entries):
+        """以文字日誌重建單日索引並標記為已建立"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM logs WHERE day = ?", (day,))
+            conn.executemany(f"""
+                INSERT INTO logs ({', '.join(self.COLUMNS)}, seq)
+                VALUES ({', '.join(':' + column for column in self.COLUMNS)}, :seq)
+            """, self.number_entries(entries))
+            conn.execute(
+                "INSERT OR REPLACE INTO indexed_days (day, indexed_at) VALUES (?, ?)",
+                (day, datetime.datetime.now().isoformat())
+            )
+    
+    def merge_day(self, day, entries):
+        """合併寫入中日期的索引（entries 為掃描文字日誌所得），返回補入的筆數"""
+        # 已由即時寫入建立的紀錄以唯一鍵略過，只補入索引中尚未存在的日誌行；
+        # 掃描在交易外完成，交易只包含寫入，不會阻擋其他工作程序的即時寫入
+        conn = self._connect()
+        with conn:
+            cursor = conn.executemany(f"""
+                INSERT OR IGNORE INTO logs ({', '.join(self.COLUMNS)}, seq)
+                VALUES ({', '.join(':' + column for column in self.COLUMNS)}, :seq)
+            """, self.number_entries(entries))
+            conn.execute(
+                "INSERT OR REPLACE INTO indexed_days (day, indexed_at) VALUES (?, ?)",
+                (day, datetime.datetime.now().isoformat())
+            )
+        return cursor.rowcount
+    
+    def mark_indexed(self, day):
+        """標記新日期由索引處理器即時寫入（不需由文字日誌回填）"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO indexed_days (day, indexed_at) VALUES (?, ?)",
+                (day, datetime.datetime.now().isoformat())
+            )
+    
+    def get_indexed_days(self, days):
+        """獲取指定日期中已建立索引者"""
+        if not days:
+            return set()
+        placeholders = ', '.join('?' for _ in days)
+        rows = self._connect().execute(
+            f"SELECT day FROM indexed_days WHERE day IN ({placeholders})", list(days)
+        ).fetchall()
+        return {row['day'] for row in rows}
+    
+    def remove_days(self, days):
+        """移除指定日期的日誌索引"""
+        conn = self._connect()
+        with conn:
+            for day in days:
+                conn.execute("DELETE FROM logs WHERE day = ?", (day,))
+                conn.execute("DELETE FROM indexed_days WHERE day = ?", (day,))
+    
+    def _build_conditions(self, date_from, date_to, level=None, ip=None, action=None, category=None):
+        """組合查詢條件"""
+        conditions = ["day BETWEEN ? AND ?"]
+        params = [date_from, date_to]
+        
+        if level:
+            conditions.append("level = ? COLLATE NOCASE")
+            params.append(level)
+        
+        if ip:
+            # 以前綴比對，可用網段過濾（如 192.168.）
+            conditions.append("ip LIKE ? ESCAPE '\\'")
+            params.append(ip.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        
+        if action:
+            conditions.append("action = ?")
+            params.append(action)
+        
+        if category:
+            conditions.append("category = ?")
+            params.append(category)
+        
+        return " WHERE " + " AND ".join(conditions), params
+    
+    def query(self, date_from, date_to, level=None, ip=None, action=None, category=None, limit=None):
+        """依條件查詢日誌（最新的在前），日期格式 YYYY-MM-DD"""
+        where, params = self._build_conditions(date_from, date_to, level, ip, action, category)
+        sql = f"SELECT * FROM logs{where} ORDER BY ts DESC, id DESC"
+        
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        
+        return self._connect().execute(sql, params).fetchall()
+    
+    def get_stats(self, date_from, date_to, level=None, ip=None, action=None):
+        """依分類統計日誌數量"""
+        where, params = self._build_conditions(date_from, date_to, level, ip, action)
+        rows = self._connect().execute(
+            f"SELECT category, COUNT(*) AS count FROM logs{where} GROUP BY category", params
+        ).fetchall()
+        
+        counts = {row['category']: row['count'] for row in rows}
+        return {
+            'total_requests': sum(counts.values()),
+            'user_actions': counts.get('user_action', 0),
+            'incidents': counts.get('incident', 0),
+            'tests': counts.get('test', 0)
+        }
+
+class LogIndexHandler(logging.Handler):
+    """將日誌批次寫入日誌索引的處理器"""
+    
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+    
+    def _entry(self, record):
+        """將日誌紀錄轉換為索引資料"""
+        timestamp = datetime.datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S")
+        return self.index.build_entry(timestamp, record.levelname, record.getMessage(), getattr(record, 'fields', None))
+    
+    def emit_batch(self, records):
+        """批次寫入索引（單一交易）"""
+        entries = []
+        for record in records:
+            if record.levelno < self.level:
+                continue
+            try:
+                entries.append(self._entry(record))
+            except Exception:
+                self.handleError(record)
+        
+        if entries:
+            try:
+                self.index.insert_many(entries)
+            except Exception:
+                self.handleError(records[-1])
+    
+    def emit(self, record):
+        """寫入單筆索引"""
+        self.emit_batch([record])
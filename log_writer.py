@@ -0,0 +1,341 @@
+"""
+非同步日誌寫入模組
+負責以有界佇列接收日誌，並由背景執行緒批次寫入檔案與控制台
+"""
+
+import os
+import time
+import gzip
+import queue
+import shutil
+import atexit
+import logging
+import datetime
+import threading
+import logging.handlers
+from contextlib import contextmanager
+from config import config
+
+class BatchEmitMixin:
+    """批次輸出：一次寫入整批日誌後只 flush 一次"""
+    
+    def emit_batch(self, records):
+        """批次輸出多筆日誌"""
+        if self.stream is None:
+            # 檔案處理器關閉後重新開啟
+            if not hasattr(self, '_open'):
+                return
+            self.stream = self._open()
+        
+        lines = []
+        for record in records:
+            if record.levelno < self.level:
+                continue
+            try:
+                lines.append(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        
+        if lines:
+            try:
+                self.stream.write("".join(lines))
+                self.flush()
+            except Exception:
+                self.handleError(records[-1])
+
+class BatchStreamHandler(BatchEmitMixin, logging.StreamHandler):
+    """支援批次寫入的控制台處理器"""
+
+class DailyRotatingFileHandler(BatchEmitMixin, logging.FileHandler):
+    """依本地日期切換檔案的處理器（跨過午夜即寫入新檔，舊檔延遲後壓縮）"""
+    
+    def __init__(self, directory, prefix, suffix=".log", encoding='utf-8', compress=True,
+                 compress_delay=60, on_rollover=None):
+        self.directory = directory
+        self.prefix = prefix
+        self.suffix = suffix
+        self.compress = compress
+        self.compress_delay = compress_delay
+        self.on_rollover = on_rollover
+        self.current_date = datetime.date.today()
+        super().__init__(self.filename_for(self.current_date), encoding=encoding)
+        
+        # 啟動時壓縮先前遺留的舊日誌
+        self._schedule_compression()
+    
+    def filename_for(self, date):
+        """獲取指定日期的日誌檔案路徑"""
+        return os.path.join(self.directory, f"{self.prefix}{date.strftime('%Y%m%d')}{self.suffix}")
+    
+    def emit_batch(self, records):
+        """依日誌產生的日期分組寫入對應的檔案"""
+        group = []
+        group_date = None
+        for record in records:
+            record_date = datetime.date.fromtimestamp(record.created)
+            if group and record_date != group_date:
+                self._emit_group(group_date, group)
+                group = []
+            group_date = record_date
+            group.append(record)
+        
+        if group:
+            self._emit_group(group_date, group)
+    
+    def emit(self, record):
+        """寫入單筆日誌"""
+        self.emit_batch([record])
+    
+    def _emit_group(self, date, records):
+        """將同一天的日誌寫入該日檔案"""
+        # 只往後切換；午夜前產生但稍後才寫出的日誌仍寫入目前檔案
+        if date > self.current_date:
+            self._rollover(date)
+        super().emit_batch(records)
+    
+    def _rollover(self, date):
+        """切換到新日期的檔案"""
+        previous_filename = self.baseFilename
+        if self.stream:
+            self.stream.flush()
+            self.stream.close()
+            self.stream = None
+        
+        self.current_date = date
+        self.baseFilename = os.path.abspath(self.filename_for(date))
+        self.stream = self._open()
+        
+        if self.on_rollover:
+            try:
+                self.on_rollover(date, previous_filename)
+            except Exception:
+                pass
+        self._schedule_compression()
+    
+    def _schedule_compression(self):
+        """延遲後壓縮今天以前的日誌（讓其他程序寫完跨午夜的最後一批）"""
+        if not self.compress:
+            return
+        timer = threading.Timer(self.compress_delay, self.compress_old_files)
+        timer.daemon = True
+        timer.start()
+    
+    def compress_old_files(self):
+        """將今天以前的日誌檔案壓縮為 .gz"""
+        today_name = os.path.basename(self.filename_for(datetime.date.today()))
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError:
+            return
+        
+        for filename in filenames:
+            if not (filename.startswith(self.prefix) and filename.endswith(self.suffix)):
+                continue
+            if filename >= today_name or os.path.join(self.directory, filename) == self.baseFilename:
+                continue
+            
+            path = os.path.join(self.directory, filename)
+            if os.path.exists(f"{path}.gz"):
+                continue
+            tmp_path = f"{path}.gz.{os.getpid()}.tmp"
+            try:
+                with open(path, 'rb') as source, gzip.open(tmp_path, 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                os.replace(tmp_path, f"{path}.gz")
+                os.remove(path)
+            except FileNotFoundError:
+                # 其他程序已完成壓縮
+                pass
+            except OSError as e:
+                logging.warning(f"Log compression failed: {filename} | Error: {e}")
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """寫入有界佇列的處理器（佇列滿時依等級決定等待或丟棄）"""
+    
+    def __init__(self, writer):
+        super().__init__(writer.queue)
+        self.writer = writer
+    
+    def enqueue(self, record):
+        """將日誌放入佇列，不阻塞一般請求"""
+        self.writer.put(record)
+
+class AsyncLogWriter:
+    """非同步批次日誌寫入器"""
+    
+    # 警告以上等級在佇列滿時最多等待的秒數（背壓），一般日誌則直接丟棄
+    BLOCK_TIMEOUT = 0.05
+    
+    def __init__(self):
+        self.batch_size = max(1, config.LOG_BATCH_SIZE)
+        self.flush_interval = config.LOG_FLUSH_INTERVAL
+        self.queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+        
+        self._handlers = []
+        self._handlers_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.max_depth = 0
+        self._reported_drops = 0
+    
+    def set_handlers(self, handlers):
+        """替換輸出處理器（舊處理器寫完後關閉）並確保背景執行緒已啟動"""
+        with self._handlers_lock:
+            old_handlers = self._handlers
+            self._handlers = list(handlers)
+        
+        for handler in old_handlers:
+            try:
+                handler.flush()
+                handler.close()
+            except Exception:
+                pass
+        
+        self.start()
+    
+    def start(self):
+        """啟動背景寫入執行緒"""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._writer_loop, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+    
+    def put(self, record):
+        """放入一筆日誌，佇列滿時記錄丟棄數量"""
+        try:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record, timeout=self.BLOCK_TIMEOUT)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+        
+        with self._stats_lock:
+            self.enqueued += 1
+            depth = self.queue.qsize()
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return True
+    
+    def flush(self, timeout=5):
+        """等待目前佇列中的日誌全部寫入"""
+        if not self._thread or not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+    
+    def stop(self, timeout=5):
+        """寫完剩餘日誌後停止背景執行緒（程序結束時呼叫）"""
+        if not self._thread or self._stopping:
+            return
+        self._stopping = True
+        self.flush(timeout)
+        with self._handlers_lock:
+            for handler in self._handlers:
+                try:
+                    handler.flush()
+                except Exception:
+                    pass
+    
+    @contextmanager
+    def paused(self):
+        """暫停寫入（期間背景執行緒不會寫出任何批次）"""
+        with self._handlers_lock:
+            yield
+    
+    def get_stats(self):
+        """獲取寫入管線統計"""
+        with self._stats_lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'queue_size': self.queue.maxsize,
+                'max_depth': self.max_depth,
+                'enqueued': self.enqueued,
+                'dropped': self.dropped,
+                'written': self.written,
+                'batches': self.batches
+            }
+    
+    def _writer_loop(self):
+        """背景寫入主迴圈：累積到批次大小或間隔時間到就寫入"""
+        while True:
+            batch = []
+            markers = []
+            deadline = time.monotonic() + self.flush_interval
+            
+            item = self.queue.get()
+            while True:
+                if isinstance(item, threading.Event):
+                    markers.append(item)
+                    # 收到 flush 要求立即寫出
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            
+            drop_record = self._drop_report()
+            if drop_record:
+                batch.append(drop_record)
+            
+            if batch:
+                self._write_batch(batch)
+            for marker in markers:
+                marker.set()
+    
+    def _drop_report(self):
+        """佇列曾滿載時補記一筆警告"""
+        with self._stats_lock:
+            dropped = self.dropped - self._reported_drops
+            self._reported_drops = self.dropped
+        if dropped <= 0:
+            return None
+        return logging.LogRecord(
+            "log_writer", logging.WARNING, __file__, 0,
+            f"Log queue full, dropped {dropped} records", None, None
+        )
+    
+    def _write_batch(self, batch):
+        """將整批日誌交給所有處理器"""
+        with self._handlers_lock:
+            for handler in self._handlers:
+                if hasattr(handler, 'emit_batch'):
+                    handler.acquire()
+                    try:
+                        handler.emit_batch(batch)
+                    finally:
+                        handler.release()
+                else:
+                    for record in batch:
+                        if record.levelno >= handler.level:
+                            handler.handle(record)
+                    handler.flush()
+        
+        with self._stats_lock:
+            self.written += len(batch)
+            self.batches += 1
+
+# 全域日誌寫入器實例
+log_writer = AsyncLogWriter()
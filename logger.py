@@ -4,15 +4,52 @@
 """
 
 import logging
+import logging.handlers
 import datetime
 import os
-from flask import request
+import time
+import random
+import io
+import gzip
+import codecs
+import threading
+import zipfile
+import collections
+import ipaddress
+from flask import request, has_request_context, g
 from config import config
+from log_writer import log_writer, DailyRotatingFileHandler, BatchStreamHandler, DroppingQueueHandler
+from log_index import LogIndex, LogIndexHandler
+from cold_storage import cold_storage
+from shared_state import shared_state
+from metrics import metrics
 
 class LoggerManager:
     """日誌管理器"""
     
+    # 日誌檔案可能的編碼（依序嘗試，皆失敗時以可解碼任何位元組的 latin-1 讀取）與讀取區塊大小
+    LOG_ENCODINGS = ('utf-8-sig', 'cp1252')
+    READ_BLOCK_SIZE = 64 * 1024
+    
+    # 冷儲存：舊日誌依月份封存為 logs/archive/flask_app_YYYYMM.zip
+    ARCHIVE_DIR = os.path.join("logs", "archive")
+    
     def __init__(self):
+        # 每個日誌檔案的編碼判斷結果（以 inode 驗證）
+        self._encoding_cache = {}
+        self._encoding_lock = threading.Lock()
+        
+        # 結構化日誌索引（由背景寫入器與文字檔同步寫入）
+        self.log_index = LogIndex()
+        
+        # 受信任的反向代理（只有來自這些位址的轉送標頭才會被採用）
+        self.trusted_proxies = self._parse_networks(config.TRUSTED_PROXIES)
+        
+        # 日誌寫入管線統計計入效能指標
+        metrics.counter_source(self._pipeline_totals)
+        metrics.gauge("log_queue_depth", "日誌寫入佇列中等待的紀錄數（所有工作程序加總）",
+                      lambda: log_writer.queue.qsize(), per_process=True)
+        self._setup_diagnostics()
         self.setup_logging()
     
     def get_log_filename(self, date=None):
@@ -27,85 +64,243 @@ class LoggerManager:
         if not os.path.exists("logs"):
             os.makedirs("logs")
         
-        current_date = datetime.datetime.now().strftime("%Y%m%d")
-        log_filename = self.get_log_filename(current_date)
-        
         # 清除現有的處理器
         for handler in logging.root.handlers[:]:
             logging.root.removeHandler(handler)
         
-        # 設定根日誌器
+        # 設定根日誌器：只將日誌放入佇列，檔案與控制台由背景執行緒批次寫入
         root_logger = logging.getLogger()
         root_logger.setLevel(logging.INFO)
+        root_logger.addHandler(DroppingQueueHandler(log_writer))
         
-        # 設定檔案日誌
-        file_handler = logging.FileHandler(log_filename, encoding='utf-8')
+        # 設定檔案日誌（跨過午夜自動切換到新日期的檔案，舊檔壓縮）
+        file_handler = DailyRotatingFileHandler(
+            "logs", "flask_app_",
+            encoding='utf-8',
+            compress=config.LOG_COMPRESS,
+            compress_delay=config.LOG_COMPRESS_DELAY,
+            on_rollover=self._on_log_rollover
+        )
         file_handler.setLevel(logging.INFO)
         file_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
         file_handler.setFormatter(file_formatter)
-        root_logger.addHandler(file_handler)
+        self._file_handler = file_handler
         
         # 設定控制台日誌
-        console_handler = logging.StreamHandler()
+        console_handler = BatchStreamHandler()
         console_handler.setLevel(logging.INFO)
         console_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
         console_handler.setFormatter(console_formatter)
-        root_logger.addHandler(console_handler)
+        
+        # 設定日誌索引
+        index_handler = LogIndexHandler(self.log_index)
+        index_handler.setLevel(logging.INFO)
+        
+        # 當日既有的文字日誌先回填一次，之後由索引處理器即時寫入結構化欄位
+        self._ensure_log_index([file_handler.current_date])
+        
+        # 索引處理器先於檔案寫入：文字日誌中的每一行都已在索引中，回填合併不會與即時寫入重複
+        log_writer.set_handlers([index_handler, file_handler, console_handler])
         
         # 完全禁用 Flask 的 werkzeug 日誌器
         flask_logger = logging.getLogger('werkzeug')
         flask_logger.disabled = True
         flask_logger.setLevel(logging.CRITICAL)  # 只記錄嚴重錯誤
     
+    def _on_log_rollover(self, date, previous_filename):
+        """日誌切換到新日期時，新日期的索引由索引處理器即時寫入"""
+        self.log_index.mark_indexed(date.strftime("%Y-%m-%d"))
+    
+    def _setup_diagnostics(self):
+        """設定日誌解析診斷通道（寫入獨立檔案，不影響主日誌）"""
+        # 預設設定；管理網站切換後的設定保存在共用狀態，所有工作程序一致
+        self._diagnostics_defaults = {
+            'enabled': config.LOG_DIAGNOSTICS,
+            'sample_rate': config.LOG_DIAGNOSTICS_SAMPLE_RATE,
+            'rate_limit': config.LOG_DIAGNOSTICS_RATE_LIMIT
+        }
+        self.diagnostics_suppressed = 0
+        self._diagnostics_tokens = self.diagnostics_rate_limit
+        self._diagnostics_refilled = time.monotonic()
+        self._diagnostics_lock = threading.Lock()
+        
+        # 不往根日誌器傳遞，檔案在第一次寫入時才建立；依大小輪替，總用量不超過 (保留數量 + 1) 個檔案
+        diagnostics_logger = logging.getLogger("diagnostics")
+        diagnostics_logger.propagate = False
+        diagnostics_logger.setLevel(logging.INFO)
+        if not diagnostics_logger.handlers:
+            handler = logging.handlers.RotatingFileHandler(
+                "logs/log_diagnostics.log", encoding='utf-8', delay=True,
+                maxBytes=config.LOG_DIAGNOSTICS_MAX_BYTES, backupCount=config.LOG_DIAGNOSTICS_BACKUP_COUNT
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"))
+            diagnostics_logger.addHandler(handler)
+        self._diagnostics_logger = diagnostics_logger
+    
+    def _diagnostics_settings(self):
+        """獲取目前的診斷設定（共用狀態每秒最多讀取一次）"""
+        return shared_state.get('log.diagnostics', None, max_age=1.0) or self._diagnostics_defaults
+    
+    @property
+    def diagnostics_enabled(self):
+        """診斷模式是否啟用"""
+        return self._diagnostics_settings()['enabled']
+    
+    @property
+    def diagnostics_sample_rate(self):
+        """逐行事件的取樣率"""
+        return self._diagnostics_settings()['sample_rate']
+    
+    @property
+    def diagnostics_rate_limit(self):
+        """每秒最多記錄的診斷筆數"""
+        return self._diagnostics_settings()['rate_limit']
+    
+    def set_diagnostics(self, enabled=None, sample_rate=None, rate_limit=None):
+        """即時切換日誌解析診斷模式（套用到所有工作程序）"""
+        def apply(settings):
+            settings = dict(settings or self._diagnostics_defaults)
+            if enabled is not None:
+                settings['enabled'] = bool(enabled)
+            if sample_rate is not None:
+                settings['sample_rate'] = min(max(float(sample_rate), 0.0), 1.0)
+            if rate_limit is not None:
+                settings['rate_limit'] = max(float(rate_limit), 0.0)
+            return settings
+        
+        settings = shared_state.update('log.diagnostics', apply)
+        with self._diagnostics_lock:
+            self._diagnostics_tokens = min(self._diagnostics_tokens, settings['rate_limit'])
+        return self.get_diagnostics_status()
+    
+    def get_diagnostics_status(self):
+        """獲取診斷模式狀態"""
+        return {
+            'enabled': self.diagnostics_enabled,
+            'sample_rate': self.diagnostics_sample_rate,
+            'rate_limit': self.diagnostics_rate_limit,
+            'suppressed': self.diagnostics_suppressed,
+            'file': "logs/log_diagnostics.log"
+        }
+    
+    def log_diagnostic(self, event, details=None, sampled=False):
+        """記錄診斷訊息（關閉時不做任何事；逐行事件依取樣率記錄，整體受速率限制）"""
+        if not self.diagnostics_enabled:
+            return
+        if sampled and random.random() >= self.diagnostics_sample_rate:
+            return
+        
+        # 令牌桶速率限制，避免診斷本身拖慢讀取
+        with self._diagnostics_lock:
+            now = time.monotonic()
+            self._diagnostics_tokens = min(
+                self.diagnostics_rate_limit,
+                self._diagnostics_tokens + (now - self._diagnostics_refilled) * self.diagnostics_rate_limit
+            )
+            self._diagnostics_refilled = now
+            if self._diagnostics_tokens < 1:
+                self.diagnostics_suppressed += 1
+                return
+            self._diagnostics_tokens -= 1
+        
+        message = f"Diagnostic: {event}"
+        if details:
+            message += f" | Details: {details}"
+        self._diagnostics_logger.info(message)
+    
+    @staticmethod
+    def _parse_networks(value):
+        """解析以逗號分隔的 IP 位址或網段"""
+        networks = []
+        for item in value.split(','):
+            item = item.strip()
+            if item:
+                networks.append(ipaddress.ip_network(item, strict=False))
+        return tuple(networks)
+    
+    def _is_trusted_proxy(self, address):
+        """判斷位址是否為受信任的反向代理"""
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(ip in network for network in self.trusted_proxies)
+    
     def get_real_ip(self):
         """獲取真實IP地址（支援Cloudflare Tunnel）"""
-        # Cloudflare Tunnel 優先
-        if request.headers.get('CF-Connecting-IP'):
-            return request.headers.get('CF-Connecting-IP')
+        return self.get_user_info()['ip']
+    
+    def _resolve_ip(self, headers, remote_addr):
+        """由轉送標頭解析使用者IP（每個請求只解析一次）"""
+        # 設定受信任代理時，直接連線的對象不是代理就不採用任何轉送標頭
+        if self.trusted_proxies and not self._is_trusted_proxy(remote_addr):
+            return remote_addr
         
-        # Cloudflare 其他標頭
-        if request.headers.get('CF-IPCountry'):
-            # 如果有 Cloudflare 標頭，嘗試其他方式獲取 IP
-            if request.headers.get('X-Forwarded-For'):
-                return request.headers.get('X-Forwarded-For').split(',')[0].strip()
-            if request.headers.get('X-Real-IP'):
-                return request.headers.get('X-Real-IP')
+        # Cloudflare Tunnel 優先
+        if headers.get('CF-Connecting-IP'):
+            return headers.get('CF-Connecting-IP')
         
         # 其他代理
-        if request.headers.get('X-Forwarded-For'):
-            return request.headers.get('X-Forwarded-For').split(',')[0].strip()
+        forwarded_for = headers.get('X-Forwarded-For')
+        if forwarded_for:
+            hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+            if hops:
+                if self.trusted_proxies:
+                    # 由右往左略過受信任代理，第一個非代理位址即為使用者
+                    for hop in reversed(hops):
+                        if not self._is_trusted_proxy(hop):
+                            return hop
+                return hops[0]
         
-        if request.headers.get('X-Real-IP'):
-            return request.headers.get('X-Real-IP')
+        if headers.get('X-Real-IP'):
+            return headers.get('X-Real-IP')
         
         # 直接連接
-        return request.remote_addr
+        return remote_addr
     
     def get_user_info(self):
-        """獲取使用者資訊"""
-        ip = self.get_real_ip()
-        user_agent = request.headers.get('User-Agent', 'Unknown')
-        
-        # Cloudflare 地理資訊
-        country = request.headers.get('CF-IPCountry', 'Unknown')
-        city = request.headers.get('CF-IPCity', 'Unknown')
-        
-        # Cloudflare 其他資訊
-        cf_ray = request.headers.get('CF-Ray', 'Unknown')
-        cf_visitor = request.headers.get('CF-Visitor', 'Unknown')
+        """獲取使用者資訊（每個請求只組合一次，保存於 flask.g 供後續日誌與案件資料重複使用）"""
+        # 背景工作（如廣播寄件匣）沒有請求上下文
+        if not has_request_context():
+            return {
+                'ip': 'System',
+                'user_agent': 'Unknown',
+                'country': 'Unknown',
+                'city': 'Unknown',
+                'referer': 'Direct',
+                'cf_ray': 'Unknown',
+                'cf_visitor': 'Unknown'
+            }
         
-        # 來源頁面
-        referer = request.headers.get('Referer', 'Direct')
+        user_info = g.get('user_info')
+        if user_info is not None:
+            return user_info
         
-        return {
-            'ip': ip,
-            'user_agent': user_agent,
-            'country': country,
-            'city': city,
-            'referer': referer,
-            'cf_ray': cf_ray,
-            'cf_visitor': cf_visitor
+        headers = request.headers
+        user_info = {
+            'ip': self._resolve_ip(headers, request.remote_addr),
+            'user_agent': headers.get('User-Agent', 'Unknown'),
+            # Cloudflare 地理資訊
+            'country': headers.get('CF-IPCountry', 'Unknown'),
+            'city': headers.get('CF-IPCity', 'Unknown'),
+            # 來源頁面
+            'referer': headers.get('Referer', 'Direct'),
+            # Cloudflare 其他資訊
+            'cf_ray': headers.get('CF-Ray', 'Unknown'),
+            'cf_visitor': headers.get('CF-Visitor', 'Unknown')
         }
+        g.user_info = user_info
+        return user_info
+    
+    def _log_fields(self, user_info, **fields):
+        """組合日誌的結構化欄位（供日誌索引使用）"""
+        fields.setdefault('path', request.path if has_request_context() else None)
+        fields.update(
+            ip=user_info['ip'],
+            country=user_info['country'],
+            cf_ray=user_info['cf_ray'] if user_info['cf_ray'] != 'Unknown' else None
+        )
+        return fields
     
     def log_user_action(self, action, details=None):
         """記錄使用者動作"""
@@ -117,7 +312,7 @@ class LoggerManager:
         
         log_message += f" | IP: {user_info['ip']} | Country: {user_info['country']} | City: {user_info['city']}"
         
-        logging.info(log_message)
+        logging.info(log_message, extra={'fields': self._log_fields(user_info, kind='user_action', action=action)})
     
     def log_request(self, method, path, status_code, response_time=None):
         """記錄請求資訊"""
@@ -136,7 +331,8 @@ class LoggerManager:
         if user_info['cf_visitor'] != 'Unknown':
             log_message += f" | CF-Visitor: {user_info['cf_visitor']}"
         
-        logging.info(log_message)
+        fields = self._log_fields(user_info, kind='request', method=method, path=path, status=status_code)
+        logging.info(log_message, extra={'fields': fields})
     
     def log_error(self, error, context=None):
         """記錄錯誤資訊"""
@@ -148,84 +344,419 @@ class LoggerManager:
         
         log_message += f" | IP: {user_info['ip']} | Country: {user_info['country']} | City: {user_info['city']}"
         
-        logging.error(log_message)
+        logging.error(log_message, extra={'fields': self._log_fields(user_info, kind='error')})
+    
+    def flush(self, timeout=5):
+        """等待佇列中的日誌寫入檔案"""
+        return log_writer.flush(timeout)
+    
+    def _pipeline_totals(self):
+        """日誌寫入管線的累計數量（供效能指標使用）"""
+        stats = log_writer.get_stats()
+        return {
+            'log_records_enqueued_total': stats['enqueued'],
+            'log_records_written_total': stats['written'],
+            'log_records_dropped_total': stats['dropped']
+        }
+    
+    def get_pipeline_stats(self):
+        """獲取日誌寫入管線統計（佇列深度、丟棄數量等）"""
+        return log_writer.get_stats()
+    
+    def parse_log_line(self, line):
+        """解析文字日誌行，返回 (時間, 等級, 訊息)，格式不符時返回 None"""
+        line = line.strip()
+        if ' [' not in line or '] ' not in line:
+            return None
+        timestamp, level_message = line.split(' [', 1)
+        if '] ' not in level_message:
+            return None
+        level, message = level_message.split('] ', 1)
+        return timestamp, level.strip(), message.strip()
+    
+    def _ensure_log_index(self, days):
+        """確保指定日期都已建立索引（尚未建立者由文字日誌回填一次）"""
+        indexed = self.log_index.get_indexed_days([day.strftime("%Y-%m-%d") for day in days])
+        for day in days:
+            day_key = day.strftime("%Y-%m-%d")
+            log_filename = self.get_log_filename(day.strftime("%Y%m%d"))
+            if day_key in indexed or not self._log_path(os.path.basename(log_filename)):
+                continue
+            
+            entries, skipped = self._scan_log_day(day_key, os.path.basename(log_filename))
+            if day_key == self._file_handler.current_date.strftime("%Y-%m-%d"):
+                # 寫入中的日期：只補入索引中尚未存在的日誌行，其他工作程序的即時寫入不受影響
+                added = self.log_index.merge_day(day_key, entries)
+            else:
+                # 歷史日期沒有寫入者，直接重建
+                self.log_index.replace_day(day_key, entries)
+                added = len(entries)
+            
+            self.log_diagnostic("日誌索引回填", f"{day_key} 已建立 {added} 筆，略過 {skipped} 行")
+    
+    def _scan_log_day(self, day_key, filename):
+        """解析單日文字日誌為索引資料，返回 (索引資料, 略過行數)"""
+        entries = []
+        skipped = 0
+        for line_number, line in enumerate(self.iter_log_file(filename), 1):
+            parsed = self.parse_log_line(line)
+            if parsed and parsed[0][:10] == day_key:
+                entries.append(self.log_index.build_entry(*parsed))
+            elif line.strip():
+                skipped += 1
+                self.log_diagnostic("日誌行無法解析", f"{day_key} 第{line_number}行: {repr(line[:100])}", sampled=True)
+        return entries, skipped
+    
+    def query_logs(self, date_from, date_to, log_type='all', ip=None, action=None, limit=None):
+        """依日期、等級、IP 與動作查詢日誌（由日誌索引回答），返回 {'logs', 'stats'}"""
+        start_date = datetime.datetime.strptime(date_from, "%Y-%m-%d")
+        end_date = datetime.datetime.strptime(date_to, "%Y-%m-%d")
+        
+        days = []
+        current_date = start_date
+        while current_date <= end_date:
+            days.append(current_date)
+            current_date += datetime.timedelta(days=1)
+        self._ensure_log_index(days)
+        
+        level = None if log_type == 'all' else log_type
+        date_from = start_date.strftime("%Y-%m-%d")
+        date_to = end_date.strftime("%Y-%m-%d")
+        
+        started = time.perf_counter()
+        rows = self.log_index.query(date_from, date_to, level=level, ip=ip, action=action, limit=limit)
+        logs = [{
+            'timestamp': row['ts'],
+            'type': row['level'],
+            'content': row['message'],
+            'category': row['category'],
+            'action': row['action'],
+            'ip': row['ip'],
+            'path': row['path'],
+            'status': row['status']
+        } for row in rows]
+        
+        stats = self.log_index.get_stats(date_from, date_to, level=level, ip=ip, action=action)
+        
+        self.log_diagnostic(
+            "日誌查詢",
+            f"{date_from}~{date_to} 等級={log_type} IP={ip} 動作={action} | 返回 {len(logs)} 筆 | "
+            f"統計: {stats} | 耗時 {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+        
+        return {
+            'logs': logs,
+            'stats': stats
+        }
     
     def get_log_files(self):
         """獲取所有日誌檔案"""
         log_files = []
         if os.path.exists("logs"):
             for filename in os.listdir("logs"):
-                if filename.startswith("flask_app_") and filename.endswith(".log"):
+                if filename.startswith("flask_app_") and filename.endswith((".log", ".log.gz")):
                     file_path = os.path.join("logs", filename)
                     stat = os.stat(file_path)
                     log_files.append({
                         'filename': filename,
-                        'date': filename.replace("flask_app_", "").replace(".log", ""),
+                        'date': filename.replace("flask_app_", "").replace(".gz", "").replace(".log", ""),
                         'size': stat.st_size,
-                        'modified': datetime.datetime.fromtimestamp(stat.st_mtime)
+                        'modified': datetime.datetime.fromtimestamp(stat.st_mtime),
+                        'compressed': filename.endswith(".gz"),
+                        'archived': False
                     })
         
+        # 已封存的舊日誌（同一天仍有散檔時以散檔為準）
+        listed = {log_file['date'] for log_file in log_files}
+        for archive_path in self._log_archives():
+            for info in cold_storage.list_members(archive_path):
+                date = info.filename.replace("flask_app_", "").replace(".log", "")
+                if date in listed:
+                    continue
+                log_files.append({
+                    'filename': info.filename,
+                    'date': date,
+                    'size': info.compress_size,
+                    'modified': datetime.datetime(*info.date_time),
+                    'compressed': True,
+                    'archived': True
+                })
+        
         return sorted(log_files, key=lambda x: x['date'], reverse=True)
     
-    def read_log_file(self, filename, lines=None):
-        """讀取日誌檔案內容"""
-        file_path = os.path.join("logs", filename)
-        if not os.path.exists(file_path):
+    def _log_archives(self):
+        """獲取所有日誌封存檔路徑"""
+        if not os.path.exists(self.ARCHIVE_DIR):
             return []
+        return [os.path.join(self.ARCHIVE_DIR, filename) for filename in sorted(os.listdir(self.ARCHIVE_DIR))
+                if filename.startswith("flask_app_") and filename.endswith(".zip")]
+    
+    def _log_archive_path(self, filename):
+        """獲取日誌所屬月份的封存檔路徑（flask_app_YYYYMMDD.log → flask_app_YYYYMM.zip）"""
+        return os.path.join(self.ARCHIVE_DIR, f"flask_app_{filename[len('flask_app_'):][:6]}.zip")
+    
+    def _log_path(self, filename):
+        """定位日誌檔案，返回 (檔案路徑, 封存檔成員)，不存在時返回 None"""
+        # 依序尋找散檔、已壓縮的舊日誌（.gz）與冷儲存封存檔
+        file_path = os.path.join("logs", filename)
+        if os.path.exists(file_path):
+            return file_path, None
+        if os.path.exists(f"{file_path}.gz"):
+            return f"{file_path}.gz", None
         
-        # 嘗試不同編碼讀取檔案
-        encodings = ['utf-8', 'utf-8-sig', 'cp1252', 'latin-1', 'big5', 'gbk']
+        archive_path = self._log_archive_path(filename)
+        if cold_storage.has_member(archive_path, filename):
+            return archive_path, filename
+        return None
+    
+    def _open_log_binary(self, file_path, member=None):
+        """以二進位模式開啟日誌檔案（自動解壓縮 .gz 與封存檔成員）"""
+        if member:
+            return cold_storage.open_member(file_path, member)
+        if file_path.endswith(".gz"):
+            return gzip.open(file_path, 'rb')
+        return open(file_path, 'rb')
+    
+    def _detect_encoding(self, file_path, member=None):
+        """判斷日誌檔案編碼（逐區塊解碼，每個檔案只判斷一次）"""
+        stat = os.stat(file_path)
+        cache_key = (file_path, member)
+        with self._encoding_lock:
+            cached = self._encoding_cache.get(cache_key)
+        if cached and cached[0] == stat.st_ino:
+            return cached[1]
         
-        for encoding in encodings:
+        # 依序嘗試可能的編碼，以固定大小區塊解碼避免整份載入
+        encoding = 'latin-1'
+        for candidate in self.LOG_ENCODINGS:
+            decoder = codecs.getincrementaldecoder(candidate)()
             try:
-                with open(file_path, 'r', encoding=encoding) as f:
-                    if lines:
-                        return f.readlines()[-lines:]
-                    else:
-                        return f.readlines()
+                with self._open_log_binary(file_path, member) as f:
+                    while True:
+                        block = f.read(self.READ_BLOCK_SIZE)
+                        decoder.decode(block, final=not block)
+                        if not block:
+                            break
             except UnicodeDecodeError:
                 continue
+            encoding = candidate
+            break
         
-        # 如果所有編碼都失敗，使用錯誤處理
+        with self._encoding_lock:
+            self._encoding_cache[cache_key] = (stat.st_ino, encoding)
+        return encoding
+    
+    def _tail_lines(self, file_path, count, encoding):
+        """由檔案尾端反向讀取最後 count 行"""
+        with open(file_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            buffer = b''
+            
+            # 反向讀取區塊直到取得足夠的換行（多一行以確保第一行完整）
+            while position > 0 and buffer.count(b'\n') <= count:
+                read_size = min(self.READ_BLOCK_SIZE, position)
+                position -= read_size
+                f.seek(position)
+                buffer = f.read(read_size) + buffer
+        
+        lines = buffer.splitlines(keepends=True)
+        if position > 0:
+            # 第一行可能不完整
+            lines = lines[1:]
+        return [line.decode(encoding, errors='replace') for line in lines[-count:]]
+    
+    def get_active_log_filename(self):
+        """獲取目前寫入中的日誌檔案名稱（依今天日期決定，不受本程序是否已切換檔案影響）"""
+        # 本程序沒有新日誌時不會切換檔案，其他工作程序寫入的今日檔案仍應被追蹤
+        return os.path.basename(self._file_handler.filename_for(datetime.date.today()))
+    
+    def read_new_lines(self, filename, offset):
+        """讀取指定位置之後新增的完整日誌行，返回 (行列表, 新位置)"""
+        file_path = os.path.join("logs", filename)
         try:
-            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                if lines:
-                    return f.readlines()[-lines:]
-                else:
-                    return f.readlines()
-        except Exception:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return [], 0
+        
+        # 檔案被清除後重新建立時從頭讀取
+        if size < offset:
+            offset = 0
+        if size == offset:
+            return [], offset
+        
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        
+        # 只回傳完整的行，尚未寫完的部分留待下次讀取
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return [], offset
+        
+        encoding = self._detect_encoding(file_path)
+        lines = [line.decode(encoding, errors='replace') for line in data[:end].splitlines()]
+        return lines, offset + end
+    
+    def follow_log(self, position=None, poll_interval=1.0, keepalive=15.0):
+        """追蹤目前的日誌檔案（產生器），產出 (位置, 新日誌) 或逾時時產出 (位置, [])"""
+        filename = self.get_active_log_filename()
+        
+        # position 格式為 檔名:位移（供斷線重連時接續），未指定時從檔案尾端開始
+        offset = None
+        if position and ':' in position:
+            position_file, position_offset = position.rsplit(':', 1)
+            if position_file == filename and position_offset.isdigit():
+                offset = int(position_offset)
+        if offset is None:
+            try:
+                offset = os.path.getsize(os.path.join("logs", filename))
+            except OSError:
+                offset = 0
+        
+        last_yield = time.monotonic()
+        while True:
+            # 日誌切換到新檔案時從新檔案開頭追蹤
+            active_filename = self.get_active_log_filename()
+            if active_filename != filename:
+                lines, _ = self.read_new_lines(filename, offset)
+                filename, offset = active_filename, 0
+            else:
+                lines, offset = self.read_new_lines(filename, offset)
+            
+            entries = []
+            for line in lines:
+                parsed = self.parse_log_line(line)
+                if parsed:
+                    entries.append(self.log_index.build_entry(*parsed))
+                elif line.strip():
+                    self.log_diagnostic("即時日誌行無法解析", f"{filename}: {repr(line[:100])}", sampled=True)
+            
+            if entries or time.monotonic() - last_yield >= keepalive:
+                last_yield = time.monotonic()
+                yield f"{filename}:{offset}", entries
+            
+            time.sleep(poll_interval)
+    
+    def iter_log_file(self, filename):
+        """逐行讀取日誌檔案（產生器，記憶體用量與檔案大小無關，支援已壓縮的舊日誌）"""
+        source = self._log_path(filename)
+        if not source:
+            return
+        
+        encoding = self._detect_encoding(*source)
+        with io.TextIOWrapper(self._open_log_binary(*source), encoding=encoding, errors='replace') as f:
+            for line in f:
+                yield line
+    
+    def read_log_file(self, filename, lines=None):
+        """讀取日誌檔案內容（指定行數時由檔案尾端反向讀取）"""
+        source = self._log_path(filename)
+        if not source:
+            return []
+        
+        file_path, member = source
+        try:
+            if lines and (member or file_path.endswith(".gz")):
+                # 壓縮檔無法反向讀取，以固定長度佇列保留最後幾行
+                return list(collections.deque(self.iter_log_file(filename), maxlen=lines))
+            if lines:
+                return self._tail_lines(file_path, lines, self._detect_encoding(file_path))
+            return list(self.iter_log_file(filename))
+        except (OSError, EOFError, KeyError, zipfile.BadZipFile):
             return []
     
     def clear_log_files(self, date_from=None, date_to=None):
         """清除日誌檔案"""
         cleared_files = []
         
+        # 先寫完佇列中的日誌，避免清除後又寫回舊檔案
+        self.flush()
+        
         if os.path.exists("logs"):
             for filename in os.listdir("logs"):
-                if filename.startswith("flask_app_") and filename.endswith(".log"):
-                    file_date_str = filename.replace("flask_app_", "").replace(".log", "")
-                    
+                if filename.startswith("flask_app_") and filename.endswith((".log", ".log.gz")):
                     # 檢查日期範圍
-                    if date_from and date_to:
-                        try:
-                            file_date = datetime.datetime.strptime(file_date_str, "%Y%m%d")
-                            start_date = datetime.datetime.strptime(date_from, "%Y-%m-%d")
-                            end_date = datetime.datetime.strptime(date_to, "%Y-%m-%d")
-                            
-                            if not (start_date <= file_date <= end_date):
-                                continue
-                        except ValueError:
-                            continue
+                    if not self._in_date_range(filename, date_from, date_to):
+                        continue
                     
                     file_path = os.path.join("logs", filename)
                     os.remove(file_path)
                     cleared_files.append(filename)
         
+        # 已封存的舊日誌由封存檔中移除
+        archived = {}
+        for archive_path in self._log_archives():
+            for info in cold_storage.list_members(archive_path):
+                if self._in_date_range(info.filename, date_from, date_to):
+                    archived.setdefault(archive_path, set()).add(info.filename)
+        if archived:
+            with cold_storage.lock(self.ARCHIVE_DIR):
+                for archive_path, members in archived.items():
+                    cleared_files.extend(cold_storage.rewrite(archive_path, remove=members))
+        
+        # 同步移除對應日期的日誌索引
+        cleared_days = []
+        for filename in cleared_files:
+            try:
+                file_date = datetime.datetime.strptime(filename.replace("flask_app_", "").replace(".gz", "").replace(".log", ""), "%Y%m%d")
+            except ValueError:
+                continue
+            cleared_days.append(file_date.strftime("%Y-%m-%d"))
+        if cleared_days:
+            with log_writer.paused():
+                self.log_index.remove_days(cleared_days)
+        
         # 如果清除了檔案，重新初始化logging系統
         if cleared_files:
             self.setup_logging()
         
         return cleared_files
+    
+    def _in_date_range(self, filename, date_from=None, date_to=None):
+        """檢查日誌檔案日期是否在指定範圍內（未指定範圍時皆符合）"""
+        if not (date_from and date_to):
+            return True
+        
+        file_date_str = filename.replace("flask_app_", "").replace(".gz", "").replace(".log", "")
+        try:
+            file_date = datetime.datetime.strptime(file_date_str, "%Y%m%d")
+            start_date = datetime.datetime.strptime(date_from, "%Y-%m-%d")
+            end_date = datetime.datetime.strptime(date_to, "%Y-%m-%d")
+        except ValueError:
+            return False
+        return start_date <= file_date <= end_date
+    
+    def archive_old_logs(self, older_than_days):
+        """將超過指定天數的日誌壓縮封存為每月封存檔（冷儲存），返回已封存的日誌檔案列表"""
+        # 至少保留今天的日誌為散檔（寫入中）
+        cutoff = (datetime.date.today() - datetime.timedelta(days=max(1, older_than_days))).strftime("%Y%m%d")
+        by_archive = {}
+        for filename in sorted(os.listdir("logs")):
+            if not (filename.startswith("flask_app_") and filename.endswith((".log", ".log.gz"))):
+                continue
+            member = filename[:-len(".gz")] if filename.endswith(".gz") else filename
+            file_date_str = member.replace("flask_app_", "").replace(".log", "")
+            if not (file_date_str.isdigit() and file_date_str < cutoff):
+                continue
+            # 同一天同時有 .log 與 .gz（壓縮中途）時以排序在後的 .gz 為準
+            by_archive.setdefault(self._log_archive_path(member), {})[member] = os.path.join("logs", filename)
+        
+        archived = []
+        with cold_storage.lock(self.ARCHIVE_DIR):
+            for archive_path, members in sorted(by_archive.items()):
+                # 先寫入封存檔，再移除散檔與壓縮檔
+                cold_storage.rewrite(archive_path, add=members)
+                for member in members:
+                    file_path = os.path.join("logs", member)
+                    for path in (file_path, f"{file_path}.gz"):
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+                    archived.append(member)
+        
+        return archived
 
 # 全域日誌管理器實例
 logger_manager = LoggerManager()
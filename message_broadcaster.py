@@ -3,29 +3,50 @@
 負責LINE和Discord訊息的發送
 """
 
+import time
 import datetime
-from linebot import LineBotApi, WebhookHandler
-from linebot.models import TextSendMessage
-from linebot.exceptions import LineBotApiError
-from dhooks import Webhook
+from concurrent.futures import ThreadPoolExecutor, wait
 from config import config
+from http_client import http_client, HTTPClientError
 from logger import logger_manager
+from case_manager import case_manager
+from outbox import BroadcastOutbox
+from shared_state import shared_state
+from metrics import metrics
+from tracing import wizard_tracer
 
 class MessageBroadcaster:
     """訊息廣播器"""
     
     def __init__(self):
-        self.line_bot_api = LineBotApi(config.LINE_BOT_API_TOKEN)
-        self.handler = WebhookHandler(config.LINE_WEBHOOK_HANDLER)
+        self.http_client = http_client
         self.group_id = config.LINE_GROUP_ID
-        self.discord_webhook = Webhook(config.DISCORD_WEBHOOK_URL)
         
-        # 廣播控制
-        self.line_enabled = True
-        self.discord_enabled = True
+        # 並行發送設定
+        self.send_timeout = config.BROADCAST_TIMEOUT
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="broadcast")
+        
+        # 持久化廣播寄件匣（背景發送與重試）
+        self.outbox = BroadcastOutbox()
+        metrics.gauge("broadcast_outbox_pending", "廣播寄件匣中尚未完成的工作數", self.outbox.get_pending_count)
+    
+    @property
+    def line_enabled(self):
+        """LINE 廣播是否啟用（保存在共用狀態，所有工作程序一致）"""
+        return shared_state.get('broadcast.line_enabled', True)
+    
+    @property
+    def discord_enabled(self):
+        """Discord 廣播是否啟用（保存在共用狀態，所有工作程序一致）"""
+        return shared_state.get('broadcast.discord_enabled', True)
+    
+    def start_outbox(self):
+        """啟動廣播寄件匣的背景發送"""
+        self.outbox.start(self._deliver_channel, self._on_outbox_update)
     
-    def broadcast_message(self, message_content, case_data=None):
-        """廣播訊息到LINE和Discord"""
+    def broadcast_message(self, message_content, case_data=None, discord_content=None,
+                          case_filename=None, deliver_async=False, trace=None):
+        """廣播訊息到所有啟用的頻道（trace 為填報流程的追蹤資訊，寄件匣發送時記錄各頻道時間）"""
         results = {
             'line_success': False,
             'discord_success': False,
@@ -34,38 +55,98 @@ class MessageBroadcaster:
             'discord_message_id': None
         }
         
-        # 發送LINE訊息
+        # 建立各頻道的發送內容
+        channels = {}
         if self.line_enabled:
-            try:
-                self.line_bot_api.push_message(
-                    self.group_id,
-                    TextSendMessage(text=message_content)
-                )
-                results['line_success'] = True
-                logger_manager.log_user_action("LINE訊息發送成功", f"案件: {case_data.get('event_type', 'Unknown') if case_data else 'Test'}")
-                
-            except LineBotApiError as e:
-                results['line_error'] = str(e)
-                logger_manager.log_error(f"LINE訊息發送失敗: {e}")
-                
-            except Exception as e:
-                results['line_error'] = str(e)
-                logger_manager.log_error(f"LINE訊息發送異常: {e}")
-        
-        # 發送Discord訊息
+            channels['line'] = message_content
         if self.discord_enabled:
+            channels['discord'] = discord_content or message_content
+        
+        if not channels:
+            return results
+        
+        # 非同步模式：先寫入寄件匣並立即返回，由背景工作執行緒發送、重試並回寫案件紀錄
+        if deliver_async:
+            case_label = case_data.get('event_type', 'Unknown') if case_data else 'Test'
+            results['job_id'] = self.outbox.enqueue(channels, case_filename, case_label, trace)
+            results['queued'] = True
+            return results
+        
+        # 所有頻道同時發送，總延遲為最慢頻道的延遲而非加總
+        futures = {
+            self.executor.submit(self._deliver_channel, channel, content): channel
+            for channel, content in channels.items()
+        }
+        done, not_done = wait(futures, timeout=self.send_timeout)
+        
+        for future, channel in futures.items():
+            if future in not_done:
+                results[f'{channel}_error'] = f"發送逾時（超過 {self.send_timeout} 秒）"
+                continue
             try:
-                response = self.discord_webhook.send(message_content)
-                results['discord_success'] = True
-                results['discord_message_id'] = response.get('id')
-                logger_manager.log_user_action("Discord訊息發送成功", f"案件: {case_data.get('event_type', 'Unknown') if case_data else 'Test'}")
-                
+                message_id = future.result()
+                results[f'{channel}_success'] = True
+                if channel == 'discord':
+                    results['discord_message_id'] = message_id
             except Exception as e:
-                results['discord_error'] = str(e)
-                logger_manager.log_error(f"Discord訊息發送失敗: {e}")
+                results[f'{channel}_error'] = str(e)
         
         return results
     
+    def _deliver_channel(self, channel, message_content):
+        """發送單一頻道訊息，失敗時拋出例外"""
+        senders = {'line': self._send_line, 'discord': self._send_discord}
+        if channel not in senders:
+            raise ValueError(f"未知的廣播頻道: {channel}")
+        
+        # 每次發送（含重試）皆計入效能指標
+        start = time.perf_counter()
+        result = 'failure'
+        try:
+            message_id = senders[channel](message_content)
+            result = 'success'
+            return message_id
+        finally:
+            metrics.inc("broadcast_deliveries_total", channel=channel, result=result)
+            metrics.observe("broadcast_delivery_duration_seconds", time.perf_counter() - start, channel=channel)
+    
+    def _on_outbox_update(self, job, channel, finished):
+        """寄件匣頻道完成時記錄結果並回寫案件紀錄"""
+        state = job['channels'][channel]
+        name = {'line': 'LINE', 'discord': 'Discord'}.get(channel, channel)
+        if state['status'] == 'sent':
+            logger_manager.log_user_action(f"{name}發送成功", f"Job={job['job_id']} | Attempts={state['attempts']}")
+        else:
+            logger_manager.log_user_action(f"{name}發送失敗", f"Job={job['job_id']} | Error={state['last_error']}")
+        
+        # 填報流程追蹤：記錄最後一次發送的時間（距流程開始的時間即為通報到送達的時間）
+        if job.get('trace') and state.get('last_started') is not None:
+            wizard_tracer.record_span(
+                job['trace'], 'broadcast', state['last_started'], state['last_duration'],
+                channel=channel, status='ok' if state['status'] == 'sent' else 'failed'
+            )
+        
+        results = {
+            'line_success': job['channels'].get('line', {}).get('status') == 'sent',
+            'discord_success': job['channels'].get('discord', {}).get('status') == 'sent',
+            'discord_message_id': job['channels'].get('discord', {}).get('message_id')
+        }
+        
+        if job.get('case_filename'):
+            case_manager.update_broadcast_results(job['case_filename'], results)
+        
+        if finished:
+            logger_manager.log_user_action("案件廣播完成",
+                f"Discord={results['discord_success']} | LINE={results['line_success']} | Case={job.get('case_filename')}")
+    
+    def _send_line(self, message_content):
+        """發送LINE群組訊息"""
+        self.http_client.line_push(self.group_id, message_content, timeout=self.send_timeout)
+    
+    def _send_discord(self, message_content):
+        """發送Discord訊息並返回訊息 ID"""
+        return self.http_client.discord_execute(message_content, timeout=self.send_timeout)
+    
     def test_line_message(self):
         """測試LINE訊息發送"""
         test_message = f"""🧪 系統測試訊息 / System Test Message
@@ -74,14 +155,11 @@ class MessageBroadcaster:
 """
         
         try:
-            self.line_bot_api.push_message(
-                self.group_id,
-                TextSendMessage(text=test_message)
-            )
+            self._send_line(test_message)
             return {"success": True, "message": "LINE測試訊息發送成功"}
             
-        except LineBotApiError as e:
-            return {"success": False, "error": f"LINE API錯誤: {str(e)}"}
+        except HTTPClientError as e:
+            return {"success": False, "error": str(e)}
             
         except Exception as e:
             return {"success": False, "error": f"LINE發送異常: {str(e)}"}
@@ -94,11 +172,11 @@ class MessageBroadcaster:
 """
         
         try:
-            response = self.discord_webhook.send(test_message)
+            message_id = self._send_discord(test_message)
             return {
                 "success": True, 
                 "message": "Discord測試訊息發送成功",
-                "message_id": response.get('id')
+                "message_id": message_id
             }
             
         except Exception as e:
@@ -107,14 +185,11 @@ class MessageBroadcaster:
     def test_line_message_custom(self, message_content):
         """發送自定義LINE訊息（用於公告發布）"""
         try:
-            self.line_bot_api.push_message(
-                self.group_id,
-                TextSendMessage(text=message_content)
-            )
+            self._send_line(message_content)
             return {"success": True, "message": "LINE自定義訊息發送成功"}
             
-        except LineBotApiError as e:
-            return {"success": False, "error": f"LINE API錯誤: {str(e)}"}
+        except HTTPClientError as e:
+            return {"success": False, "error": str(e)}
             
         except Exception as e:
             return {"success": False, "error": f"LINE發送異常: {str(e)}"}
@@ -122,11 +197,11 @@ class MessageBroadcaster:
     def test_discord_message_custom(self, message_content):
         """發送自定義Discord訊息（用於公告發布）"""
         try:
-            response = self.discord_webhook.send(message_content)
+            message_id = self._send_discord(message_content)
             return {
                 "success": True, 
                 "message": "Discord自定義訊息發送成功",
-                "message_id": response.get('id')
+                "message_id": message_id
             }
             
         except Exception as e:
@@ -158,11 +233,16 @@ class MessageBroadcaster:
         return message
     
     def set_broadcast_control(self, line=None, discord=None):
-        """設定廣播控制"""
+        """設定廣播控制（立即套用到所有工作程序）"""
         if line is not None:
-            self.line_enabled = line
+            shared_state.set('broadcast.line_enabled', bool(line))
         if discord is not None:
-            self.discord_enabled = discord
+            shared_state.set('broadcast.discord_enabled', bool(discord))
+    
+    def init_broadcast_control(self, line=True, discord=True):
+        """設定廣播控制的預設值（已由管理網站切換過時保留目前設定，工作程序重啟不會覆蓋）"""
+        shared_state.setdefault('broadcast.line_enabled', bool(line))
+        shared_state.setdefault('broadcast.discord_enabled', bool(discord))
     
     def get_broadcast_status(self):
         """獲取廣播狀態"""
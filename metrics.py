@@ -0,0 +1,269 @@
+"""
+效能指標模組
+在記憶體中累計請求延遲、廣播結果與快取命中等指標，由背景執行緒定期將增量彙總到 SQLite
+（同一網站的所有工作程序共用），並以 Prometheus 文字格式輸出
+"""
+
+import os
+import time
+import atexit
+import bisect
+import logging
+import threading
+from config import config
+from sqlite_store import SQLiteStore
+
+class Metrics(SQLiteStore):
+    """效能指標收集器（計數器、直方圖與量測值）"""
+    
+    # 延遲直方圖的區間上限（秒）
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+    
+    def __init__(self):
+        self.db_path = None
+        self.flush_interval = config.METRICS_FLUSH_INTERVAL
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        
+        # 指標定義：名稱 -> (類型, 說明)，輸出時依定義順序排列
+        self._families = {}
+        self._buckets = {}
+        
+        # 尚未寫入資料庫的增量：(名稱, 標籤) -> 數值 / [各區間次數..., 總和]
+        self._counters = {}
+        self._histograms = {}
+        
+        # 由其他模組提供的累計值（以差值計入計數器）與量測值
+        self._counter_sources = []
+        self._source_totals = {}
+        self._gauges = []
+        
+        self._register_defaults()
+    
+    def _register_defaults(self):
+        """定義系統使用的指標"""
+        self.counter("http_requests_total", "HTTP 請求數（依方法、路由與狀態碼）")
+        self.histogram("http_request_duration_seconds", "HTTP 請求處理時間（秒）")
+        self.counter("broadcast_deliveries_total", "廣播發送次數（依頻道與結果，含重試）")
+        self.histogram("broadcast_delivery_duration_seconds", "廣播單次發送時間（秒）")
+        self.counter("case_cache_hits_total", "案件紀錄快取命中次數")
+        self.counter("case_cache_misses_total", "案件紀錄快取未命中次數")
+        self.counter("log_records_enqueued_total", "進入日誌寫入佇列的紀錄數")
+        self.counter("log_records_written_total", "已寫入檔案的日誌紀錄數")
+        self.counter("log_records_dropped_total", "佇列已滿而丟棄的日誌紀錄數")
+    
+    def counter(self, name, help_text):
+        """定義計數器"""
+        self._families[name] = ('counter', help_text)
+    
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        """定義直方圖"""
+        self._families[name] = ('histogram', help_text)
+        self._buckets[name] = tuple(buckets)
+    
+    def gauge(self, name, help_text, func, per_process=False):
+        """定義量測值（per_process 為 True 時加總所有工作程序的值，否則於輸出時直接計算）"""
+        self._families[name] = ('gauge', help_text)
+        self._gauges.append((name, func, per_process))
+    
+    def counter_source(self, func):
+        """登記程序內累計值來源（函式返回 {計數器名稱: 累計值}，寫入時只計入差值）"""
+        self._counter_sources.append(func)
+    
+    def inc(self, name, amount=1, **labels):
+        """增加計數器"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+    
+    def observe(self, name, value, **labels):
+        """記錄一次直方圖觀測值"""
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self._buckets[name]
+        index = bisect.bisect_left(buckets, value)
+        with self._lock:
+            self._observe(key, buckets, index, value)
+    
+    def _observe(self, key, buckets, index, value):
+        """累計直方圖（呼叫端須持有鎖）"""
+        entry = self._histograms.get(key)
+        if entry is None:
+            # 各區間次數（最後一格為超出所有區間）與觀測值總和
+            entry = self._histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        entry[index] += 1
+        entry[-1] += value
+    
+    def record_request(self, method, route, status, duration):
+        """記錄一次 HTTP 請求（單次取得鎖，供 after_request 使用）"""
+        buckets = self._buckets["http_request_duration_seconds"]
+        index = bisect.bisect_left(buckets, duration)
+        counter_key = ("http_requests_total", (('method', method), ('route', route), ('status', str(status))))
+        histogram_key = ("http_request_duration_seconds", (('method', method), ('route', route)))
+        with self._lock:
+            self._counters[counter_key] = self._counters.get(counter_key, 0) + 1
+            self._observe(histogram_key, buckets, index, duration)
+    
+    def start(self, site):
+        """開始定期彙總指標（每個網站使用獨立的資料庫）"""
+        if self._thread:
+            return
+        
+        self.db_path = os.path.join("data", f"metrics_{site}.db")
+        self._create_tables()
+        self._thread = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+        self._thread.start()
+        # 工作程序結束前寫入最後的增量
+        atexit.register(self.flush)
+    
+    def _create_tables(self):
+        """建立指標資料表"""
+        conn = self._connect()
+        with conn:
+            # 累計值（計數器與直方圖），以 rowid 保持直方圖區間的輸出順序
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS samples (
+                    family TEXT NOT NULL,
+                    series TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    PRIMARY KEY (family, series)
+                )
+            """)
+            # 各工作程序最近一次回報的量測值
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS gauges (
+                    pid INTEGER NOT NULL,
+                    family TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (pid, family)
+                )
+            """)
+    
+    def _flush_loop(self):
+        """背景執行緒：定期寫入增量"""
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Metrics flush failed: {e}")
+    
+    @staticmethod
+    def _series(name, labels):
+        """組合 Prometheus 時間序列名稱"""
+        if not labels:
+            return name
+        pairs = ",".join(
+            '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for key, value in labels
+        )
+        return f"{name}{{{pairs}}}"
+    
+    def _collect_deltas(self):
+        """取出自上次寫入以來的增量，返回 [(指標名稱, 時間序列, 增量)]"""
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            histograms, self._histograms = self._histograms, {}
+        
+        rows = [(name, self._series(name, labels), value) for (name, labels), value in counters.items()]
+        
+        for (name, labels), entry in histograms.items():
+            # Prometheus 直方圖為累積次數，增量的累積等於累積的增量
+            cumulative = 0
+            bounds = [f"{bound:g}" for bound in self._buckets[name]] + ["+Inf"]
+            for bound, count in zip(bounds, entry[:-1]):
+                cumulative += count
+                rows.append((name, self._series(f"{name}_bucket", labels + (('le', bound),)), cumulative))
+            rows.append((name, self._series(f"{name}_sum", labels), entry[-1]))
+            rows.append((name, self._series(f"{name}_count", labels), cumulative))
+        
+        for source in self._counter_sources:
+            try:
+                totals = source()
+            except Exception as e:
+                logging.error(f"Metrics source failed: {e}")
+                continue
+            for name, total in totals.items():
+                previous = self._source_totals.get(name, 0)
+                # 累計值被重設時（例如統計歸零）以目前值作為增量
+                delta = total - previous if total >= previous else total
+                self._source_totals[name] = total
+                if delta:
+                    rows.append((name, name, delta))
+        
+        return rows
+    
+    def flush(self):
+        """將增量與本程序的量測值寫入資料庫"""
+        if not self.db_path:
+            return
+        
+        with self._flush_lock:
+            rows = self._collect_deltas()
+            now = time.time()
+            gauges = []
+            for name, func, per_process in self._gauges:
+                if per_process:
+                    try:
+                        gauges.append((os.getpid(), name, float(func()), now))
+                    except Exception as e:
+                        logging.error(f"Metrics gauge failed: {name} | Error: {e}")
+            
+            conn = self._connect()
+            with conn:
+                conn.executemany("""
+                    INSERT INTO samples (family, series, value) VALUES (?, ?, ?)
+                    ON CONFLICT (family, series) DO UPDATE SET value = value + excluded.value
+                """, rows)
+                conn.executemany("INSERT OR REPLACE INTO gauges (pid, family, value, updated) VALUES (?, ?, ?, ?)", gauges)
+                # 已結束的工作程序不再回報，逾時後移除其量測值
+                conn.execute("DELETE FROM gauges WHERE updated < ?", (now - self.flush_interval * 3,))
+    
+    def read_total(self, series):
+        """讀取所有工作程序彙總後的時間序列數值"""
+        if not self.db_path:
+            return 0
+        row = self._connect().execute("SELECT SUM(value) FROM samples WHERE series = ?", (series,)).fetchone()
+        return row[0] or 0
+    
+    def render(self):
+        """輸出 Prometheus 文字格式（先寫入本程序的增量，確保結果包含最新資料）"""
+        samples = {}
+        gauge_values = {}
+        if self.db_path:
+            self.flush()
+            conn = self._connect()
+            for family, series, value in conn.execute("SELECT family, series, value FROM samples ORDER BY rowid"):
+                samples.setdefault(family, []).append((series, value))
+            for family, value in conn.execute("SELECT family, SUM(value) FROM gauges GROUP BY family"):
+                gauge_values[family] = value
+        
+        for name, func, per_process in self._gauges:
+            if not per_process:
+                try:
+                    gauge_values[name] = func()
+                except Exception as e:
+                    logging.error(f"Metrics gauge failed: {name} | Error: {e}")
+        
+        lines = []
+        for name, (metric_type, help_text) in self._families.items():
+            if metric_type == 'gauge':
+                if name not in gauge_values:
+                    continue
+                series_values = [(name, gauge_values[name])]
+            else:
+                series_values = samples.get(name, [])
+            
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for series, value in series_values:
+                value = float(value)
+                lines.append(f"{series} {int(value)}" if value.is_integer() else f"{series} {value!r}")
+        
+        return "\n".join(lines) + "\n"
+
+# 全域效能指標實例
+metrics = Metrics()
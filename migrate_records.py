@@ -0,0 +1,23 @@
+"""
+案件紀錄遷移工具
+將 record/ 目錄中的舊版文字格式案件紀錄 (case_*.txt) 批次轉換為結構化 JSON 格式
+
+使用方式:
+    python migrate_records.py              # 轉換後移除原始文字檔
+    python migrate_records.py --keep-text  # 保留原始文字檔
+"""
+
+import argparse
+from case_manager import case_manager
+
+def main():
+    """執行案件紀錄遷移"""
+    parser = argparse.ArgumentParser(description="將舊版文字格式案件紀錄轉換為 JSON 格式")
+    parser.add_argument("--keep-text", action="store_true", help="保留原始 case_*.txt 檔案")
+    args = parser.parse_args()
+    
+    migrated = case_manager.migrate_text_records(keep_text=args.keep_text)
+    print(f"已轉換 {len(migrated)} 個案件紀錄檔案")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+廣播寄件匣模組
+負責案件廣播的持久化佇列、背景發送與失敗重試
+"""
+
+import os
+import json
+import time
+import uuid
+import heapq
+import fcntl
+import logging
+import datetime
+import threading
+from contextlib import contextmanager
+from config import config
+
+class BroadcastOutbox:
+    """廣播寄件匣（先寫入本地日誌，再由背景工作執行緒發送）"""
+    
+    def __init__(self, outbox_dir="data/outbox"):
+        self.outbox_dir = outbox_dir
+        self.worker_count = config.OUTBOX_WORKERS
+        self.retry_base = config.OUTBOX_RETRY_BASE
+        self.retry_max = config.OUTBOX_RETRY_MAX
+        self.max_attempts = config.OUTBOX_MAX_ATTEMPTS
+        
+        self._deliver = None
+        self._on_update = None
+        self._schedule = []
+        self._condition = threading.Condition()
+        self._job_locks = {}
+        self._job_locks_guard = threading.Lock()
+        self._workers = []
+        self._ensure_outbox_dir()
+    
+    def _ensure_outbox_dir(self):
+        """確保寄件匣目錄存在"""
+        if not os.path.exists(self.outbox_dir):
+            os.makedirs(self.outbox_dir)
+    
+    def _job_path(self, job_id):
+        """獲取工作檔案路徑"""
+        return os.path.join(self.outbox_dir, f"{job_id}.json")
+    
+    def start(self, deliver, on_update=None):
+        """啟動背景發送工作執行緒並恢復未完成的工作"""
+        if self._workers:
+            return
+        
+        self._deliver = deliver
+        self._on_update = on_update
+        
+        # 恢復重啟前尚未完成的工作
+        for filename in sorted(os.listdir(self.outbox_dir)):
+            if not filename.endswith(".json"):
+                continue
+            job = self._read_job(filename[:-len(".json")])
+            if job:
+                for channel, state in job['channels'].items():
+                    if state['status'] == 'pending':
+                        self._schedule_delivery(job['job_id'], channel, state.get('next_attempt', 0))
+        
+        for index in range(self.worker_count):
+            worker = threading.Thread(target=self._worker_loop, name=f"outbox-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+    
+    def enqueue(self, channels, case_filename=None, case_label=None, trace=None):
+        """將廣播工作寫入寄件匣並排程發送，返回工作編號（trace 為填報流程的追蹤資訊）"""
+        job_id = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        job = {
+            'job_id': job_id,
+            'created': datetime.datetime.now().isoformat(),
+            'case_filename': case_filename,
+            'case_label': case_label,
+            'trace': trace,
+            'channels': {
+                channel: {
+                    'content': content,
+                    'status': 'pending',
+                    'attempts': 0,
+                    'next_attempt': 0,
+                    'last_error': None,
+                    'message_id': None,
+                    'sent_at': None,
+                    'last_started': None,
+                    'last_duration': None
+                }
+                for channel, content in channels.items()
+            }
+        }
+        
+        # 先持久化再排程，確保重啟後不會遺失
+        self._write_job(job)
+        for channel in channels:
+            self._schedule_delivery(job_id, channel, 0)
+        
+        return job_id
+    
+    def get_pending_count(self):
+        """獲取尚未完成的工作數量"""
+        return sum(1 for filename in os.listdir(self.outbox_dir) if filename.endswith(".json"))
+    
+    def _schedule_delivery(self, job_id, channel, when):
+        """排程單一頻道的發送"""
+        with self._condition:
+            heapq.heappush(self._schedule, (when, job_id, channel))
+            self._condition.notify()
+    
+    def _worker_loop(self):
+        """背景工作執行緒主迴圈"""
+        while True:
+            with self._condition:
+                while not self._schedule or self._schedule[0][0] > time.time():
+                    timeout = self._schedule[0][0] - time.time() if self._schedule else None
+                    self._condition.wait(timeout)
+                _, job_id, channel = heapq.heappop(self._schedule)
+            
+            try:
+                self._process_delivery(job_id, channel)
+            except Exception as e:
+                logging.error(f"Outbox delivery crashed: {job_id}/{channel} | Error: {e}")
+    
+    def _process_delivery(self, job_id, channel):
+        """執行單一頻道的發送並記錄結果"""
+        with self._file_lock(f"{job_id}.{channel}.lock", blocking=False) as acquired:
+            if not acquired:
+                # 其他程序正在處理此頻道，稍後再確認
+                self._schedule_delivery(job_id, channel, time.time() + self.retry_base)
+                return
+            
+            job = self._read_job(job_id)
+            if not job or job['channels'][channel]['status'] != 'pending':
+                return
+            
+            started = time.time()
+            try:
+                message_id = self._deliver(channel, job['channels'][channel]['content'])
+                error = None
+            except Exception as e:
+                message_id = None
+                error = str(e)
+            duration = time.time() - started
+            
+            with self._job_lock(job_id):
+                job = self._read_job(job_id)
+                if not job:
+                    return
+                state = job['channels'][channel]
+                state['attempts'] += 1
+                state['last_started'] = started
+                state['last_duration'] = duration
+                
+                if error is None:
+                    state['status'] = 'sent'
+                    state['message_id'] = message_id
+                    state['sent_at'] = datetime.datetime.now().isoformat()
+                    state['last_error'] = None
+                elif self.max_attempts and state['attempts'] >= self.max_attempts:
+                    state['status'] = 'failed'
+                    state['last_error'] = error
+                else:
+                    # 指數退避後重試
+                    delay = min(self.retry_base * (2 ** (state['attempts'] - 1)), self.retry_max)
+                    state['next_attempt'] = time.time() + delay
+                    state['last_error'] = error
+                    self._write_job(job)
+                    self._schedule_delivery(job_id, channel, state['next_attempt'])
+                    logging.warning(f"Outbox delivery failed, retrying in {delay:.0f}s: {job_id}/{channel} | Error: {error}")
+                    return
+                
+                finished = all(s['status'] != 'pending' for s in job['channels'].values())
+                self._write_job(job)
+                
+                if self._on_update:
+                    try:
+                        self._on_update(job, channel, finished)
+                    except Exception as e:
+                        logging.error(f"Outbox status callback failed: {job_id} | Error: {e}")
+                
+                if finished:
+                    self._remove_job(job_id)
+    
+    def _read_job(self, job_id):
+        """讀取工作檔案"""
+        try:
+            with open(self._job_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+    
+    def _write_job(self, job):
+        """以原子方式寫入工作檔案"""
+        path = self._job_path(job['job_id'])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    
+    def _remove_job(self, job_id):
+        """移除已完成的工作及其鎖定檔"""
+        for filename in [f"{job_id}.json"] + [f for f in os.listdir(self.outbox_dir) if f.startswith(f"{job_id}.") and f.endswith(".lock")]:
+            try:
+                os.remove(os.path.join(self.outbox_dir, filename))
+            except FileNotFoundError:
+                pass
+        with self._job_locks_guard:
+            self._job_locks.pop(job_id, None)
+    
+    @contextmanager
+    def _job_lock(self, job_id):
+        """工作檔案讀寫鎖（同時防止執行緒與其他程序並行修改）"""
+        with self._job_locks_guard:
+            lock = self._job_locks.setdefault(job_id, threading.Lock())
+        with lock:
+            with self._file_lock(f"{job_id}.lock") as acquired:
+                yield acquired
+    
+    @contextmanager
+    def _file_lock(self, name, blocking=True):
+        """以 flock 取得跨程序檔案鎖，程序結束時自動釋放"""
+        fd = os.open(os.path.join(self.outbox_dir, name), os.O_CREAT | os.O_RDWR)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
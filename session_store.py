@@ -0,0 +1,117 @@
+"""
+伺服器端 Session 模組
+以 SQLite 保存使用者 Session 資料（多個工作程序共用），Cookie 只保存隨機的 Session ID
+"""
+
+import json
+import time
+import secrets
+import threading
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from config import config
+from sqlite_store import SQLiteStore
+
+class ServerSession(CallbackDict, SessionMixin):
+    """伺服器端 Session（內容修改時標記需要寫回）"""
+    
+    def __init__(self, initial=None, sid=None, expires=0, new=False):
+        def on_update(session):
+            session.modified = True
+        
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.new = new
+        self.modified = False
+
+class SQLiteSessionInterface(SQLiteStore, SessionInterface):
+    """SQLite 伺服器端 Session 介面（有效期限由伺服器控管，過期資料定期清除）"""
+    
+    # 清除過期 Session 的間隔（秒）
+    PURGE_INTERVAL = 300
+    
+    def __init__(self, db_path="data/sessions.db", lifetime=None):
+        self.db_path = db_path
+        self.lifetime = lifetime or config.SESSION_LIFETIME
+        self._local = threading.local()
+        self._last_purge = 0
+        self._create_tables()
+    
+    def _create_tables(self):
+        """建立 Session 資料表"""
+        conn = self._connect()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    sid TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires)")
+    
+    def open_session(self, app, request):
+        """由 Cookie 中的 Session ID 載入資料，不存在或已過期時建立新的 Session"""
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            row = self._connect().execute(
+                "SELECT data, expires FROM sessions WHERE sid = ?", (sid,)
+            ).fetchone()
+            if row and row['expires'] > time.time():
+                return ServerSession(json.loads(row['data']), sid=sid, expires=row['expires'])
+        
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+    
+    def save_session(self, app, session, response):
+        """寫回 Session 資料（只在內容修改或有效期限過半時寫入，Cookie 只在建立時發送）"""
+        cookie_name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        
+        if not session:
+            # Session 被清空時一併刪除伺服器端資料
+            if session.modified and not session.new:
+                self._delete(session.sid)
+                response.delete_cookie(cookie_name, domain=domain, path=path)
+            return
+        
+        now = time.time()
+        if session.new or session.modified or session.expires - now < self.lifetime / 2:
+            expires = now + self.lifetime
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+                    (session.sid, json.dumps(dict(session), ensure_ascii=False), expires)
+                )
+            self._purge_expired(now)
+        
+        if session.new:
+            response.set_cookie(
+                cookie_name,
+                session.sid,
+                httponly=self.get_cookie_httponly(app),
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+                domain=domain,
+                path=path
+            )
+    
+    def _delete(self, sid):
+        """刪除伺服器端 Session 資料"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+    
+    def _purge_expired(self, now):
+        """定期清除過期的 Session"""
+        if now - self._last_purge < self.PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE expires < ?", (now,))
+
+# 全域 Session 介面實例
+session_interface = SQLiteSessionInterface()
@@ -0,0 +1,91 @@
+"""
+共用狀態模組
+以 SQLite 鍵值表保存需要在多個工作程序之間一致的執行狀態（廣播開關、案件編號序號、診斷設定）
+"""
+
+import json
+import time
+import threading
+from sqlite_store import SQLiteStore
+
+class SharedState(SQLiteStore):
+    """跨工作程序共用的鍵值狀態（值以 JSON 保存）"""
+    
+    def __init__(self, db_path="data/shared_state.db"):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._create_tables()
+    
+    def _create_tables(self):
+        """建立狀態資料表"""
+        conn = self._connect()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+    
+    def get(self, key, default=None, max_age=0):
+        """讀取狀態值（max_age 秒內重複讀取時使用本程序的快取）"""
+        if max_age > 0:
+            with self._cache_lock:
+                cached = self._cache.get(key)
+            if cached and time.monotonic() - cached[1] < max_age:
+                return cached[0]
+        
+        row = self._connect().execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        value = json.loads(row['value']) if row else default
+        
+        with self._cache_lock:
+            self._cache[key] = (value, time.monotonic())
+        return value
+    
+    def set(self, key, value):
+        """寫入狀態值"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, updated) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+        with self._cache_lock:
+            self._cache[key] = (value, time.monotonic())
+    
+    def setdefault(self, key, value):
+        """尚未設定時寫入預設值，返回目前的值"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO state (key, value, updated) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+        return self.get(key, value)
+    
+    def update(self, key, func, default=None):
+        """以單一交易讀取並更新狀態值（跨程序原子操作），返回新值"""
+        conn = self._connect()
+        # 立即取得寫入鎖，讀取與寫入之間不會有其他程序插入
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+            value = func(json.loads(row['value']) if row else default)
+            conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, updated) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        with self._cache_lock:
+            self._cache[key] = (value, time.monotonic())
+        return value
+
+# 全域共用狀態實例
+shared_state = SharedState()
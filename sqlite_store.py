@@ -0,0 +1,29 @@
+"""
+SQLite 儲存基底模組
+提供各 SQLite 模組共用的連線管理（每個執行緒一個連線、WAL 模式）
+"""
+
+import sqlite3
+
+def sqlite_connect(db_path):
+    """建立 SQLite 連線（WAL 模式，資料列可依欄位名稱或位置存取）"""
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class SQLiteStore:
+    """SQLite 儲存基底類別（子類別需設定 db_path 與 _local = threading.local()）"""
+    
+    def _connect(self):
+        """獲取目前執行緒的資料庫連線"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite_connect(self.db_path)
+            self._configure(conn)
+            self._local.conn = conn
+        return conn
+    
+    def _configure(self, conn):
+        """新連線的額外設定（預設無）"""
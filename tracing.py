@@ -0,0 +1,231 @@
+"""
+填報流程追蹤模組
+以保存在 Session 的追蹤編號串起填報流程的各個階段，記錄每個階段的伺服器處理時間與各頻道的廣播時間，
+由背景執行緒批次寫入 SQLite，並提供每日百分位數統計
+"""
+
+import time
+import uuid
+import atexit
+import logging
+import datetime
+import threading
+from config import config
+from sqlite_store import SQLiteStore
+
+class WizardTracer(SQLiteStore):
+    """填報流程追蹤器（階段紀錄先暫存於記憶體，定期批次寫入）"""
+    
+    # 批次寫入間隔（秒）與過期資料清除間隔（秒）
+    FLUSH_INTERVAL = 1.0
+    PURGE_INTERVAL = 3600
+    PERCENTILES = (50, 90, 95, 99)
+    
+    def __init__(self, db_path="data/traces.db"):
+        self.db_path = db_path
+        self.retention_days = config.TRACE_RETENTION_DAYS
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._thread = None
+        self._last_purge = 0
+        self._create_tables()
+    
+    def _create_tables(self):
+        """建立追蹤資料表"""
+        conn = self._connect()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS traces (
+                    trace_id TEXT PRIMARY KEY,
+                    day TEXT NOT NULL,
+                    started REAL NOT NULL,
+                    case_filename TEXT,
+                    job_id TEXT
+                )
+            """)
+            # elapsed 為階段結束時距離流程開始的秒數（廣播頻道的 elapsed 即為通報到送達的時間）
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS spans (
+                    trace_id TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    channel TEXT NOT NULL DEFAULT '',
+                    status TEXT NOT NULL DEFAULT 'ok',
+                    started REAL NOT NULL,
+                    duration REAL NOT NULL,
+                    elapsed REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_spans_trace ON spans (trace_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_spans_day ON spans (day, stage, channel)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_traces_day ON traces (day, started)")
+    
+    def start(self):
+        """開始背景批次寫入"""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._flush_loop, name="trace-flush", daemon=True)
+        self._thread.start()
+        # 工作程序結束前寫入尚未儲存的紀錄
+        atexit.register(self.flush)
+    
+    @staticmethod
+    def _day(timestamp):
+        """時間戳記所屬的日期（YYYY-MM-DD）"""
+        return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+    
+    def start_trace(self, started):
+        """建立新的追蹤，返回追蹤編號"""
+        trace_id = uuid.uuid4().hex
+        self._queue(
+            "INSERT OR IGNORE INTO traces (trace_id, day, started) VALUES (?, ?, ?)",
+            (trace_id, self._day(started), started)
+        )
+        return trace_id
+    
+    def record_span(self, trace, stage, started, duration, channel='', status='ok'):
+        """記錄一個階段（trace 為 {'id': 追蹤編號, 'started': 流程開始時間}）"""
+        self._queue(
+            "INSERT INTO spans (trace_id, day, stage, channel, status, started, duration, elapsed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (trace['id'], self._day(trace['started']), stage, channel, status, started, duration,
+             started + duration - trace['started'])
+        )
+    
+    def link_case(self, trace, case_filename=None, job_id=None):
+        """記錄追蹤對應的案件紀錄與廣播工作"""
+        # 流程的各階段可能由不同工作程序處理，建立追蹤的紀錄不一定已先寫入
+        self._queue(
+            "INSERT INTO traces (trace_id, day, started, case_filename, job_id) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (trace_id) DO UPDATE SET case_filename = excluded.case_filename, job_id = excluded.job_id",
+            (trace['id'], self._day(trace['started']), trace['started'], case_filename, job_id)
+        )
+    
+    def _queue(self, sql, params):
+        """暫存寫入操作"""
+        with self._lock:
+            self._pending.append((sql, params))
+    
+    def _flush_loop(self):
+        """背景執行緒：定期批次寫入"""
+        while True:
+            time.sleep(self.FLUSH_INTERVAL)
+            try:
+                self.flush()
+                self._purge_expired()
+            except Exception as e:
+                logging.error(f"Trace flush failed: {e}")
+    
+    def flush(self):
+        """將暫存的紀錄依序寫入資料庫"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        
+        conn = self._connect()
+        with conn:
+            for sql, params in pending:
+                conn.execute(sql, params)
+    
+    def _purge_expired(self):
+        """定期清除超過保存天數的追蹤"""
+        now = time.time()
+        if not self.retention_days or now - self._last_purge < self.PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        cutoff = self._day(now - self.retention_days * 86400)
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM spans WHERE day < ?", (cutoff,))
+            conn.execute("DELETE FROM traces WHERE day < ?", (cutoff,))
+    
+    def _percentiles(self, values):
+        """計算排序後數值的百分位數（最近排名法，單位：毫秒）"""
+        summary = {'count': len(values)}
+        for percentile in self.PERCENTILES:
+            rank = max(1, -(-percentile * len(values) // 100))
+            summary[f'p{percentile}'] = round(values[rank - 1] * 1000, 1)
+        summary['max'] = round(values[-1] * 1000, 1)
+        return summary
+    
+    def get_summary(self, date_from, date_to):
+        """每日各階段處理時間與通報到送達時間的百分位數"""
+        self.flush()
+        rows = self._connect().execute("""
+            SELECT day, stage, channel, duration, elapsed FROM spans
+            WHERE day BETWEEN ? AND ? AND status = 'ok'
+            ORDER BY day
+        """, (date_from, date_to)).fetchall()
+        
+        durations = {}
+        alerts = {}
+        for row in rows:
+            stage = f"{row['stage']}:{row['channel']}" if row['channel'] else row['stage']
+            durations.setdefault(row['day'], {}).setdefault(stage, []).append(row['duration'])
+            if row['channel']:
+                alerts.setdefault(row['day'], {}).setdefault(row['channel'], []).append(row['elapsed'])
+        
+        summary = {}
+        for day, stages in durations.items():
+            summary[day] = {
+                'stages': {stage: self._percentiles(sorted(values)) for stage, values in stages.items()},
+                # 由第一次點擊到各頻道送達的時間
+                'time_to_alert': {
+                    channel: self._percentiles(sorted(values))
+                    for channel, values in alerts.get(day, {}).items()
+                }
+            }
+        return summary
+    
+    def get_traces(self, date, limit=100):
+        """獲取指定日期的追蹤列表（最新的在前）"""
+        self.flush()
+        conn = self._connect()
+        traces = [dict(row) for row in conn.execute(
+            "SELECT * FROM traces WHERE day = ? ORDER BY started DESC LIMIT ?", (date, limit)
+        )]
+        for trace in traces:
+            stats = conn.execute("""
+                SELECT COUNT(*) AS stages, MAX(elapsed) AS elapsed,
+                       MAX(CASE WHEN channel = 'line' AND status = 'ok' THEN elapsed END) AS line,
+                       MAX(CASE WHEN channel = 'discord' AND status = 'ok' THEN elapsed END) AS discord
+                FROM spans WHERE trace_id = ?
+            """, (trace['trace_id'],)).fetchone()
+            trace['stages'] = stats['stages']
+            trace['elapsed_ms'] = round(stats['elapsed'] * 1000, 1) if stats['elapsed'] is not None else None
+            trace['time_to_alert_ms'] = {
+                channel: round(stats[channel] * 1000, 1) if stats[channel] is not None else None
+                for channel in ('line', 'discord')
+            }
+        return traces
+    
+    def get_trace(self, trace_id):
+        """獲取單一追蹤的所有階段（依開始時間排序）"""
+        self.flush()
+        conn = self._connect()
+        trace = conn.execute("SELECT * FROM traces WHERE trace_id = ?", (trace_id,)).fetchone()
+        if not trace:
+            return None
+        
+        spans = conn.execute(
+            "SELECT stage, channel, status, started, duration, elapsed FROM spans WHERE trace_id = ? ORDER BY started",
+            (trace_id,)
+        ).fetchall()
+        result = dict(trace)
+        result['spans'] = [
+            {
+                'stage': span['stage'],
+                'channel': span['channel'] or None,
+                'status': span['status'],
+                'started': datetime.datetime.fromtimestamp(span['started']).isoformat(),
+                'duration_ms': round(span['duration'] * 1000, 1),
+                'elapsed_ms': round(span['elapsed'] * 1000, 1)
+            }
+            for span in spans
+        ]
+        return result
+
+# 全域填報流程追蹤實例
+wizard_tracer = WizardTracer()